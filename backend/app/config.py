@@ -19,6 +19,9 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+
 
 class RateLimitConfig:
     AUTH_ATTEMPTS = "10/hour"
@@ -53,8 +56,106 @@ class HashingConfig:
     ALGORITHM = "argon2"
     TYPE = "ID"
     SALT_SIZE = 16
-    TIME_COST = 2
-    MEMORY_COST = 65536
-    PARALLELISM = 4
+    # Koszt dobierany per maszyna przez calibrate_hashing.py - starsze hashe są podnoszone przy logowaniu
+    TIME_COST = int(os.getenv("PASSWORD_HASH_TIME_COST", "2"))
+    MEMORY_COST = int(os.getenv("PASSWORD_HASH_MEMORY_COST", "65536"))
+    PARALLELISM = int(os.getenv("PASSWORD_HASH_PARALLELISM", "4"))
+    # Parametry hasha-atrapy dla logowań na nieistniejący email. Po rekalibracji zostają przy
+    # starych wartościach, dopóki większość kont nie zaloguje się ponownie - inaczej czas
+    # odpowiedzi odróżnia nieistniejące konto od konta z hashem sprzed zmiany
+    DUMMY_TIME_COST = int(os.getenv("PASSWORD_HASH_DUMMY_TIME_COST", TIME_COST))
+    DUMMY_MEMORY_COST = int(os.getenv("PASSWORD_HASH_DUMMY_MEMORY_COST", MEMORY_COST))
+    DUMMY_PARALLELISM = int(os.getenv("PASSWORD_HASH_DUMMY_PARALLELISM", PARALLELISM))
     DIGEST_SIZE = 32
     MAX_THREADS = -1
+    # Procesy liczące Argon2 w każdym workerze uvicorn i limit zadań czekających na wolny proces.
+    # Na węzeł przypada WEB_CONCURRENCY * POOL_WORKERS procesów - domyślnie rdzenie dzielone
+    # między workery, żeby równoległe logowania nie walczyły o CPU
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    POOL_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+    QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+    RETRY_AFTER_SECONDS = 1
+
+
+class PaginationConfig:
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    # Wiersze pobierane z kursora bazy naraz w trybie stream=true
+    STREAM_BATCH_SIZE = 500
+
+
+class BulkConfig:
+    MAX_MESSAGE_IDS = 500
+    MAX_GROUP_RECIPIENTS = 100
+    MAX_BATCH_MESSAGES = 100
+    # Okno, w którym współbieżne wysyłki z różnych żądań trafiają do jednej transakcji
+    GROUP_COMMIT_WINDOW_SECONDS = 0.005
+    GROUP_COMMIT_MAX_ITEMS = 100
+    PURGE_INTERVAL_SECONDS = 60
+    PURGE_BATCH_SIZE = 200
+
+
+class ExportConfig:
+    # Wiersze pobierane z kursora bazy naraz - pamięć eksportu nie zależy od rozmiaru skrzynki
+    BATCH_SIZE = 500
+    IMPORT_BATCH_SIZE = 500
+    MAX_LINE_LENGTH = 4 * 1024 * 1024
+    # Limity jednego importu - nginx ma client_max_body_size ustawione na tę samą wartość
+    MAX_IMPORT_BYTES = int(os.getenv("MAILBOX_IMPORT_MAX_BYTES", str(1024 * 1024 * 1024)))
+    MAX_IMPORT_MESSAGES = int(os.getenv("MAILBOX_IMPORT_MAX_MESSAGES", "100000"))
+
+
+class AttachmentConfig:
+    STREAM_CHUNK_SIZE = 256 * 1024
+    # "stream" - treść przez workera uvicorn, "x-accel" - nginx przez X-Accel-Redirect,
+    # "signed-url" - przekierowanie na krótkotrwały podpisany link obsługiwany przez nginx
+    DELIVERY_MODE = os.getenv("ATTACHMENT_DELIVERY_MODE", "stream")
+    X_ACCEL_PREFIX = "/_protected_blobs/"
+    PUBLIC_API_PREFIX = os.getenv("PUBLIC_API_PREFIX", "/api")
+    SIGNED_URL_TTL_SECONDS = 60
+
+
+class UploadConfig:
+    CHUNK_SIZE = 1024 * 1024
+    # Szyfrogram jest nieco większy od pliku (IV + tag), stąd zapas ponad 10 MB
+    MAX_TOTAL_SIZE = 10_000_000 + 1024
+    SESSION_TTL_HOURS = 24
+
+
+class BlobStoreConfig:
+    # "filesystem" - pliki nazwane SHA-256 w BLOB_STORE_DIR, "database" - kolumna w SQLite
+    BACKEND = os.getenv("BLOB_STORE_BACKEND", "filesystem")
+    GC_INTERVAL_SECONDS = 600
+    GC_GRACE_SECONDS = 3600
+    GC_BATCH_SIZE = 500
+
+
+class EventsConfig:
+    KEEPALIVE_SECONDS = 15
+
+
+class TokenCacheConfig:
+    # Górna granica opóźnienia wylogowania, gdyby unieważnienie przez pub/sub nie dotarło
+    TTL_SECONDS = 30
+    MAX_ENTRIES = 10000
+
+
+class UserCacheConfig:
+    LOCAL_TTL_SECONDS = 30
+    LOCAL_MAX_ENTRIES = 10000
+    # Wspólna kopia migawek w Redisie - przydaje się przy wielu workerach, można ją wyłączyć
+    REDIS_ENABLED = os.getenv("USER_CACHE_REDIS", "true").lower() == "true"
+    REDIS_TTL_SECONDS = 3600
+
+
+class CountersConfig:
+    # Liczniki w Redisie są okresowo przeliczane z bazy, żeby ewentualny rozjazd nie trwał wiecznie
+    TTL_SECONDS = 3600
+
+
+class IdempotencyConfig:
+    HEADER_MAX_LENGTH = 255
+    RESULT_TTL_SECONDS = 24 * 60 * 60
+    PENDING_TTL_SECONDS = 60
+    WAIT_SECONDS = 10
+    POLL_INTERVAL_SECONDS = 0.05
@@ -0,0 +1,106 @@
+from collections import Counter
+from datetime import timedelta
+import hashlib
+
+from sqlalchemy import select, update, delete, event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import BlobStoreConfig
+from app.db import utcnow
+from app.models.attachment import Blob
+from app.utils.blob_store import FilesystemBlobStore, get_blob_store
+
+# Klucz Session.info: pliki utworzone przez store_blob w bieżącej transakcji
+WRITTEN_BLOBS = "written_blobs"
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_written_blobs(session: Session) -> None:
+    session.info.pop(WRITTEN_BLOBS, None)
+
+
+async def store_blob(
+    db: AsyncSession,
+    source: bytes | str,
+    sha256: str | None = None,
+    size: int | None = None,
+    refs: int = 1,
+) -> str:
+    """
+    Zapisuje treść w magazynie i zwiększa licznik referencji o refs (bez commita).
+    source to bajty albo ścieżka zweryfikowanego pliku - wywołujący usuwa go po commicie.
+    Po błędzie transakcję wycofuje discard_written_blobs.
+
+    Licznik jest podbijany przed zapisem treści - transakcja trzyma wtedy blokadę
+    zapisu SQLite, więc garbage collector nie usunie pliku w trakcie.
+    """
+    if isinstance(source, bytes):
+        sha256 = hashlib.sha256(source).hexdigest()
+        size = len(source)
+
+    query = (
+        insert(Blob)
+        .values(sha256=sha256, size=size, backend=BlobStoreConfig.BACKEND, ref_count=refs, updated_at=utcnow())
+        .on_conflict_do_update(
+            index_elements=["sha256"],
+            set_={"ref_count": Blob.ref_count + refs, "updated_at": utcnow()},
+        )
+        .returning(Blob.backend)
+    )
+    backend = (await db.execute(query)).scalar_one()
+    if await get_blob_store(backend).write(db, sha256, source):
+        db.info.setdefault(WRITTEN_BLOBS, set()).add(sha256)
+    return sha256
+
+
+async def discard_written_blobs(db: AsyncSession) -> None:
+    """
+    Wycofuje transakcję i usuwa pliki, które store_blob w niej utworzył. Bez wierszy
+    w tabeli blobs garbage collector by ich nie znalazł.
+    """
+    written = db.info.pop(WRITTEN_BLOBS, set())
+    await db.rollback()
+    if not written:
+        return
+
+    # UPDATE bierze blokadę zapisu SQLite - żaden store_blob nie jest teraz między upsertem
+    # a zapisem pliku, więc brak wiersza oznacza, że nikt nie korzysta z tego pliku
+    await db.execute(update(Blob).where(Blob.sha256.in_(written)).values(ref_count=Blob.ref_count))
+    existing = set((await db.execute(select(Blob.sha256).where(Blob.sha256.in_(written)))).scalars())
+    store = get_blob_store(FilesystemBlobStore.name)
+    for sha256 in written - existing:
+        await store.remove(sha256)
+    await db.commit()
+
+
+async def release_blobs(db: AsyncSession, sha256s: list[str | None]) -> None:
+    """Zmniejsza liczniki referencji (bez commita). Treść usuwa dopiero collect_garbage."""
+    for sha256, count in Counter(s for s in sha256s if s).items():
+        await db.execute(
+            update(Blob)
+            .where(Blob.sha256 == sha256)
+            .values(ref_count=Blob.ref_count - count)
+        )
+
+
+async def collect_garbage(db: AsyncSession) -> int:
+    """Usuwa bloby bez referencji starsze niż okres karencji. Zwraca liczbę usuniętych."""
+    cutoff = utcnow() - timedelta(seconds=BlobStoreConfig.GC_GRACE_SECONDS)
+    query = (
+        delete(Blob)
+        .where(Blob.sha256.in_(
+            select(Blob.sha256)
+            .where(Blob.ref_count <= 0)
+            .where(Blob.updated_at < cutoff)
+            .limit(BlobStoreConfig.GC_BATCH_SIZE)
+        ))
+        .returning(Blob.sha256, Blob.backend)
+    )
+    removed = (await db.execute(query)).all()
+    # Pliki usuwane przed commitem, póki transakcja trzyma blokadę zapisu
+    for sha256, backend in removed:
+        await get_blob_store(backend).remove(sha256)
+    await db.commit()
+    return len(removed)
@@ -0,0 +1,207 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, tuple_, or_, func, case, literal, union_all
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.user import User
+
+
+def _without_index(column):
+    """Unarny + z SQLite - warunek na kolumnie nie kwalifikuje indeksów, które się od niej zaczynają."""
+    return UnaryExpression(column, operator=custom_op("+"), type_=column.type)
+
+
+def visible_thread(
+    user_id: int,
+    correspondent_id: int,
+    cursor: tuple[datetime, int] | None = None,
+    limit: int | None = None,
+):
+    """
+    Zapytanie o (id, created_at) wiadomości rozmowy widocznych dla user_id, od najnowszej.
+
+    Każdy kierunek rozmowy to osobny SELECT po zakresie ix_messages_thread, już uporządkowany
+    po (created_at, id). SQLite łączy je przez MERGE (UNION ALL) i kończy po limit wierszach,
+    więc koszt strony nie zależy od długości rozmowy. Flagi usunięcia są wyłączone z indeksów,
+    żeby planista nie wybrał ix_messages_sent/ix_messages_inbox ze stronicowania skrzynki.
+    """
+    directions = []
+    for sender_id, receiver_id, deleted_column in (
+        (user_id, correspondent_id, Message.deleted_by_sender),
+        (correspondent_id, user_id, Message.deleted_by_receiver),
+    ):
+        direction = (
+            select(Message.id, Message.created_at)
+            .where(Message.sender_id == sender_id)
+            .where(Message.receiver_id == receiver_id)
+            .where(_without_index(deleted_column) == False)
+        )
+        if cursor is not None:
+            direction = direction.where(tuple_(Message.created_at, Message.id) < tuple_(*cursor))
+        directions.append(direction)
+
+    query = union_all(*directions)
+    query = query.order_by(query.selected_columns.created_at.desc(), query.selected_columns.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def record_messages(db: AsyncSession, messages: list[Message]) -> None:
+    """Dolicza nowe wiadomości do rozmów nadawców i odbiorców jednym upsertem (bez commita)."""
+    summaries: dict[tuple[int, int], dict] = {}
+    for message in messages:
+        for user_id, correspondent_id, unread, deleted in (
+            (message.sender_id, message.receiver_id, 0, message.deleted_by_sender),
+            (message.receiver_id, message.sender_id, int(not message.is_read), message.deleted_by_receiver),
+        ):
+            # Import zapisuje wiadomość widoczną tylko dla jednej strony
+            if deleted:
+                continue
+            summary = summaries.setdefault((user_id, correspondent_id), {
+                "user_id": user_id,
+                "correspondent_id": correspondent_id,
+                "message_count": 0,
+                "unread_count": 0,
+            })
+            summary["message_count"] += 1
+            summary["unread_count"] += unread
+            # Import zapisuje starsze wiadomości i nie po kolei - ostatnia to największa para (created_at, id)
+            if "last_message_id" not in summary or (
+                (message.created_at, message.id) > (summary["last_message_at"], summary["last_message_id"])
+            ):
+                summary["last_message_id"] = message.id
+                summary["last_message_at"] = message.created_at
+    if not summaries:
+        return
+
+    query = insert(Conversation).values(list(summaries.values()))
+    is_newer = or_(
+        Conversation.last_message_at.is_(None),
+        tuple_(query.excluded.last_message_at, query.excluded.last_message_id)
+        > tuple_(Conversation.last_message_at, Conversation.last_message_id),
+    )
+    query = query.on_conflict_do_update(
+        index_elements=["user_id", "correspondent_id"],
+        set_={
+            "message_count": Conversation.message_count + query.excluded.message_count,
+            "unread_count": Conversation.unread_count + query.excluded.unread_count,
+            "last_message_id": case(
+                (is_newer, query.excluded.last_message_id), else_=Conversation.last_message_id
+            ),
+            "last_message_at": case(
+                (is_newer, query.excluded.last_message_at), else_=Conversation.last_message_at
+            ),
+        },
+    )
+    await db.execute(query)
+
+
+async def record_read(db: AsyncSession, receiver_id: int, sender_ids: list[int]) -> None:
+    """Zmniejsza liczniki nieprzeczytanych; sender_ids to nadawca każdej odczytanej wiadomości (bez commita)."""
+    for sender_id, count in Counter(sender_ids).items():
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.user_id == receiver_id)
+            .where(Conversation.correspondent_id == sender_id)
+            .values(unread_count=Conversation.unread_count - count)
+        )
+
+
+async def record_deleted(db: AsyncSession, user_id: int, deleted: list[tuple[int, bool]]) -> None:
+    """
+    Odejmuje usunięte wiadomości - pary (correspondent_id, czy nieprzeczytana) - i wyznacza
+    ostatnią widoczną wiadomość od nowa. Wywoływane po soft delete w tej samej transakcji.
+    """
+    counts = Counter(correspondent_id for correspondent_id, _ in deleted)
+    unread = Counter(correspondent_id for correspondent_id, is_unread in deleted if is_unread)
+    for correspondent_id, count in counts.items():
+        last_message = (await db.execute(visible_thread(user_id, correspondent_id, limit=1))).first()
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.user_id == user_id)
+            .where(Conversation.correspondent_id == correspondent_id)
+            .values(
+                message_count=Conversation.message_count - count,
+                unread_count=Conversation.unread_count - unread[correspondent_id],
+                last_message_id=last_message.id if last_message else None,
+                last_message_at=last_message.created_at if last_message else None,
+            )
+        )
+    await db.execute(
+        delete(Conversation)
+        .where(Conversation.user_id == user_id)
+        .where(Conversation.message_count <= 0)
+    )
+
+
+async def get_conversations(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: tuple[datetime, int] | None = None,
+):
+    """Rozmowy od najnowszej jako pary (Conversation, username) - jeden zakres indeksu."""
+    query = (
+        select(Conversation, User.username)
+        .join(User, Conversation.correspondent_id == User.id)
+        .where(Conversation.user_id == user_id)
+    )
+    if cursor is not None:
+        query = query.where(tuple_(Conversation.last_message_at, Conversation.correspondent_id) < tuple_(*cursor))
+    query = query.order_by(Conversation.last_message_at.desc(), Conversation.correspondent_id.desc()).limit(limit)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def rebuild_conversations(db: AsyncSession) -> int:
+    """Przelicza wszystkie podsumowania z tabeli messages - dla baz sprzed wprowadzenia tabeli."""
+    sent = (
+        select(
+            Message.sender_id.label("user_id"),
+            Message.receiver_id.label("correspondent_id"),
+            literal(0).label("unread"),
+            Message.id,
+            Message.created_at,
+        )
+        .where(Message.deleted_by_sender == False)
+    )
+    received = (
+        select(
+            Message.receiver_id,
+            Message.sender_id,
+            case((Message.is_read == False, 1), else_=0),
+            Message.id,
+            Message.created_at,
+        )
+        .where(Message.deleted_by_receiver == False)
+    )
+    visible = union_all(sent, received).subquery()
+    # Identyfikatory rosną razem z created_at, więc max(id) to ostatnia wiadomość
+    summaries = (
+        select(
+            visible.c.user_id,
+            visible.c.correspondent_id,
+            func.max(visible.c.id),
+            func.max(visible.c.created_at),
+            func.sum(visible.c.unread),
+            func.count(),
+        )
+        .group_by(visible.c.user_id, visible.c.correspondent_id)
+    )
+
+    await db.execute(delete(Conversation))
+    result = await db.execute(
+        insert(Conversation).from_select(
+            ["user_id", "correspondent_id", "last_message_id", "last_message_at", "unread_count", "message_count"],
+            summaries,
+        )
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,53 @@
+import redis.asyncio as redis
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import CountersConfig
+from app.crud.messages import count_mailbox
+
+COUNT_FIELDS = ("unread", "inbox", "sent")
+# HINCRBY na brakującym kluczu tworzy niepełny hash - bez tego pola trzeba go odbudować z bazy
+READY_FIELD = "ready"
+
+
+def _counts_key(user_id: int) -> str:
+    return f"user:{user_id}:mailbox_counts"
+
+
+async def adjust_counts(redis_conn: redis.Redis, user_id: int, **deltas: int):
+    """Atomowo zmienia liczniki skrzynki. Błąd Redisa nie przerywa żądania."""
+    try:
+        for field, delta in deltas.items():
+            if delta:
+                await redis_conn.hincrby(_counts_key(user_id), field, delta)
+    except redis.RedisError as e:
+        logger.error(f"Failed to update mailbox counters: {e}")
+
+
+async def get_counts(redis_conn: redis.Redis, db: AsyncSession, user_id: int) -> dict[str, int]:
+    key = _counts_key(user_id)
+    try:
+        cached = await redis_conn.hgetall(key)
+    except redis.RedisError as e:
+        logger.error(f"Failed to read mailbox counters: {e}")
+        return await count_mailbox(db, user_id)
+
+    if cached.get(READY_FIELD):
+        return {field: max(0, int(cached.get(field, 0))) for field in COUNT_FIELDS}
+
+    # Zmiana pomiędzy zliczeniem a zapisem może zostać zgubiona - TTL ogranicza czas rozjazdu
+    counts = await count_mailbox(db, user_id)
+    try:
+        await redis_conn.hset(key, mapping={**counts, READY_FIELD: 1})
+        await redis_conn.expire(key, CountersConfig.TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.error(f"Failed to store mailbox counters: {e}")
+    return counts
+
+
+async def reset_counts(redis_conn: redis.Redis, user_id: int):
+    """Usuwa liczniki - następny odczyt przeliczy je z bazy."""
+    try:
+        await redis_conn.delete(_counts_key(user_id))
+    except redis.RedisError as e:
+        logger.error(f"Failed to reset mailbox counters: {e}")
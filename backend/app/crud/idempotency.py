@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import json
+
+import redis.asyncio as redis
+from app.config import IdempotencyConfig
+
+
+class IdempotencyKeyReused(Exception):
+    """Ten sam klucz użyty z inną treścią żądania."""
+
+
+class IdempotencyRequestInProgress(Exception):
+    """Pierwsze żądanie z tym kluczem nie zakończyło się w czasie oczekiwania."""
+
+
+def _idempotency_key(user_id: int, idempotency_key: str) -> str:
+    return f"idempotency:{user_id}:{idempotency_key}"
+
+
+def request_fingerprint(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+async def begin_request(redis_conn: redis.Redis, user_id: int, idempotency_key: str, fingerprint: str) -> dict | None:
+    """
+    Rezerwuje klucz dla pierwszego żądania i zwraca None.
+    Powtórzenie czeka na wynik pierwszego żądania i zwraca zapisaną odpowiedź.
+    """
+    key = _idempotency_key(user_id, idempotency_key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IdempotencyConfig.WAIT_SECONDS
+
+    while True:
+        # Rezerwacja wygasa sama, jeśli worker padnie w trakcie obsługi
+        if await redis_conn.set(key, json.dumps({"fingerprint": fingerprint}), nx=True, ex=IdempotencyConfig.PENDING_TTL_SECONDS):
+            return None
+
+        raw = await redis_conn.get(key)
+        # None: klucz wygasł albo został zwolniony między SET NX a GET - rezerwacja przy następnym obiegu
+        if raw is not None:
+            record = json.loads(raw)
+            if record["fingerprint"] != fingerprint:
+                raise IdempotencyKeyReused()
+            if "response" in record:
+                return record["response"]
+        if loop.time() >= deadline:
+            raise IdempotencyRequestInProgress()
+        await asyncio.sleep(IdempotencyConfig.POLL_INTERVAL_SECONDS)
+
+
+async def complete_request(redis_conn: redis.Redis, user_id: int, idempotency_key: str, fingerprint: str, response: dict):
+    await redis_conn.set(
+        _idempotency_key(user_id, idempotency_key),
+        json.dumps({"fingerprint": fingerprint, "response": response}),
+        ex=IdempotencyConfig.RESULT_TTL_SECONDS,
+    )
+
+
+async def abort_request(redis_conn: redis.Redis, user_id: int, idempotency_key: str):
+    """Zwalnia klucz po błędzie, żeby ponowienie klienta mogło się udać."""
+    await redis_conn.delete(_idempotency_key(user_id, idempotency_key))
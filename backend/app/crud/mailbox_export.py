@@ -0,0 +1,345 @@
+import base64
+import binascii
+import hashlib
+import json
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from loguru import logger
+from pydantic import ValidationError
+from sqlalchemy import select, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import AttachmentConfig, ExportConfig
+from app.crud.blobs import store_blob, discard_written_blobs
+from app.crud.conversations import record_messages
+from app.crud.messages import _reserve_seqs, iter_attachment_data
+from app.db import utcnow
+from app.models.attachment import Attachment, Blob
+from app.models.message import Message
+from app.models.user import User
+from app.schemas.message import ExportedMessage, ExportedAttachment
+from app.utils.upload_storage import spool_path, append_to_file, remove_file
+
+EXPORT_VERSION = 1
+
+
+class MailboxImportError(Exception):
+    """Nieprawidłowy plik importu. Paczki zapisane przed błędem pozostają w skrzynce."""
+
+
+class MailboxImportTooLarge(MailboxImportError):
+    """Plik importu przekracza ExportConfig.MAX_IMPORT_BYTES lub MAX_IMPORT_MESSAGES."""
+
+
+def _line(record: dict) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+async def _load_attachments(db: AsyncSession, message_ids: list[int]) -> dict[int, list]:
+    """
+    Manifest załączników jednej paczki wiadomości: (attachment, data_size, blob_backend).
+    Załączniki bez treści (brakujący wiersz bloba) są pomijane - nie da się ich wyeksportować.
+    """
+    query = (
+        select(
+            Attachment,
+            func.coalesce(Blob.size, func.length(Attachment.encrypted_data)),
+            Blob.backend,
+        )
+        .outerjoin(Blob, Attachment.blob_sha256 == Blob.sha256)
+        .where(Attachment.message_id.in_(message_ids))
+        .order_by(Attachment.id)
+    )
+    attachments = {}
+    for row in (await db.execute(query)).all():
+        if row[1] is None:
+            logger.warning(f"Skipping attachment {row[0].id} without content in mailbox export")
+            continue
+        attachments.setdefault(row[0].message_id, []).append(row)
+    return attachments
+
+
+async def iter_mailbox_export(
+    session_factory: async_sessionmaker, user_id: int, username: str, key_epoch: int
+) -> AsyncIterator[bytes]:
+    """
+    Eksport skrzynki jako NDJSON: nagłówek, potem dla każdej wiadomości wiersz "message"
+    i fragmenty jej załączników w wierszach "attachment_data" (base64).
+
+    Wiadomości są czytane kursorem bazy paczkami po ExportConfig.BATCH_SIZE, a załączniki
+    fragmentami po AttachmentConfig.STREAM_CHUNK_SIZE - pamięć nie rośnie z rozmiarem skrzynki.
+    Generator otwiera własną sesję, bo działa dłużej niż żądanie, które go utworzyło.
+    """
+    async with session_factory() as db:
+        yield _line({
+            "type": "header",
+            "version": EXPORT_VERSION,
+            "username": username,
+            "exported_at": utcnow().isoformat(),
+        })
+
+        for direction, own_column, correspondent_column, deleted_column in (
+            ("sent", Message.sender_id, Message.receiver_id, Message.deleted_by_sender),
+            ("received", Message.receiver_id, Message.sender_id, Message.deleted_by_receiver),
+        ):
+            query = (
+                select(Message, User.username)
+                .join(User, correspondent_column == User.id)
+                .where(own_column == user_id)
+                .where(deleted_column == False)
+                .order_by(Message.created_at, Message.id)
+                .execution_options(yield_per=ExportConfig.BATCH_SIZE)
+            )
+            result = await db.stream(query)
+            async for partition in result.partitions():
+                attachments = await _load_attachments(db, [message.id for message, _ in partition])
+                for message, correspondent_username in partition:
+                    if direction == "sent":
+                        is_decryptable = message.is_decryptable_for_sender(key_epoch)
+                    else:
+                        is_decryptable = message.is_decryptable_for_receiver(key_epoch)
+                    message_attachments = attachments.get(message.id, [])
+
+                    yield _line({
+                        "type": "message",
+                        "id": message.id,
+                        "direction": direction,
+                        "correspondent_username": correspondent_username,
+                        "encrypted_content": message.payload.encrypted_content,
+                        "encrypted_symmetric_key": message.encrypted_symmetric_key,
+                        "encrypted_symmetric_key_sender": message.payload.encrypted_symmetric_key_sender,
+                        "signature": message.payload.signature,
+                        "created_at": message.created_at.isoformat(),
+                        "is_read": bool(message.is_read),
+                        "read_at": message.read_at.isoformat() if message.read_at else None,
+                        "is_decryptable": is_decryptable,
+                        "attachments": [
+                            {
+                                "id": attachment.id,
+                                "filename": attachment.filename,
+                                "mime_type": attachment.mime_type,
+                                "size": attachment.size,
+                                "data_size": data_size,
+                            }
+                            for attachment, data_size, _ in message_attachments
+                        ],
+                    })
+
+                    for attachment, data_size, blob_backend in message_attachments:
+                        chunks = iter_attachment_data(
+                            db, attachment, blob_backend, 0, data_size - 1, AttachmentConfig.STREAM_CHUNK_SIZE
+                        )
+                        async for chunk in chunks:
+                            yield _line({
+                                "type": "attachment_data",
+                                "attachment_id": attachment.id,
+                                "data": base64.b64encode(chunk).decode(),
+                            })
+
+
+@dataclass
+class _ImportedAttachment:
+    meta: ExportedAttachment
+    path: str
+    digest: "hashlib._Hash" = field(default_factory=hashlib.sha256)
+    written: int = 0
+
+
+@dataclass
+class _ImportedMessage:
+    message: ExportedMessage
+    correspondent_id: int
+    attachments: dict[int, _ImportedAttachment]
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > ExportConfig.MAX_IMPORT_BYTES:
+            raise MailboxImportTooLarge("Plik importu jest zbyt duży")
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > ExportConfig.MAX_LINE_LENGTH:
+            raise MailboxImportError("Wiersz importu jest zbyt długi")
+    if buffer:
+        yield bytes(buffer)
+
+
+def _as_naive_utc(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def _write_import_batch(db: AsyncSession, user_id: int, batch: list[_ImportedMessage]) -> None:
+    """Jedna transakcja na paczkę: INSERT ... RETURNING wiadomości, bloby i INSERT załączników."""
+    seqs, epochs = await _reserve_seqs(db, [user_id] * len(batch))
+    rows = []
+    for imported in batch:
+        message = imported.message
+        sent = message.direction == "sent"
+        seq = next(seqs[user_id])
+        rows.append({
+            "sender_id": user_id if sent else imported.correspondent_id,
+            "receiver_id": imported.correspondent_id if sent else user_id,
+            "encrypted_content": message.encrypted_content,
+            "encrypted_symmetric_key": message.encrypted_symmetric_key,
+            "encrypted_symmetric_key_sender": message.encrypted_symmetric_key_sender,
+            "signature": message.signature,
+            "created_at": _as_naive_utc(message.created_at),
+            "is_read": message.is_read,
+            "read_at": _as_naive_utc(message.read_at),
+            # Import trafia tylko do skrzynki importującego - druga strona go nie widzi
+            "deleted_by_sender": not sent,
+            "deleted_by_receiver": sent,
+            "is_decryptable_sender": message.is_decryptable or not sent,
+            "is_decryptable_receiver": message.is_decryptable or sent,
+            "sender_key_epoch": epochs[user_id] if sent else 0,
+            "receiver_key_epoch": 0 if sent else epochs[user_id],
+            "sender_seq": seq if sent else 0,
+            "receiver_seq": 0 if sent else seq,
+        })
+    result = await db.scalars(insert(Message).returning(Message, sort_by_parameter_order=True), rows)
+    messages = result.all()
+    await record_messages(db, messages)
+
+    attachment_rows = []
+    for message, imported in zip(messages, batch):
+        for attachment in imported.attachments.values():
+            attachment_rows.append({
+                "message_id": message.id,
+                "blob_sha256": await store_blob(db, attachment.path, attachment.digest.hexdigest(), attachment.written),
+                "filename": attachment.meta.filename,
+                "mime_type": attachment.meta.mime_type,
+                "size": attachment.meta.size,
+            })
+    if attachment_rows:
+        await db.execute(insert(Attachment), attachment_rows)
+    await db.commit()
+    # store_blob nie przenosi plików - tymczasowe kopie paczki są już zbędne
+    for imported in batch:
+        for attachment in imported.attachments.values():
+            await remove_file(attachment.path)
+
+
+async def import_mailbox(db: AsyncSession, user_id: int, chunks: AsyncIterator[bytes]) -> tuple[int, int]:
+    """
+    Importuje eksport NDJSON do skrzynki user_id. Wiadomości są zapisywane paczkami po
+    ExportConfig.IMPORT_BATCH_SIZE w osobnych transakcjach, a treść załączników trafia
+    od razu na dysk, więc pamięć nie zależy od rozmiaru pliku.
+
+    Wiadomości z nieistniejącymi rozmówcami są pomijane. Zwraca (zaimportowane, pominięte).
+    Rozmiar pliku i liczbę wiadomości ograniczają ExportConfig.MAX_IMPORT_BYTES
+    i MAX_IMPORT_MESSAGES - po przekroczeniu zgłaszany jest MailboxImportTooLarge.
+    """
+    correspondents: dict[str, int | None] = {}
+    batch: list[_ImportedMessage] = []
+    current: _ImportedMessage | None = None
+    skipped_attachment_ids: set[int] = set()
+    header_seen = False
+    imported = skipped = 0
+    line_number = 0
+
+    def finish_current():
+        for attachment in current.attachments.values():
+            if attachment.written != attachment.meta.data_size:
+                raise MailboxImportError(f"Wiersz {line_number}: niekompletny załącznik {attachment.meta.id}")
+        batch.append(current)
+
+    try:
+        async for line in _iter_lines(chunks):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise MailboxImportError(f"Wiersz {line_number}: nieprawidłowy JSON")
+            record_type = record.get("type") if isinstance(record, dict) else None
+
+            if record_type == "header":
+                if header_seen or record.get("version") != EXPORT_VERSION:
+                    raise MailboxImportError(f"Wiersz {line_number}: nieobsługiwany nagłówek eksportu")
+                header_seen = True
+            elif not header_seen:
+                raise MailboxImportError("Brak nagłówka eksportu")
+
+            elif record_type == "message":
+                if imported + skipped + len(batch) + (current is not None) >= ExportConfig.MAX_IMPORT_MESSAGES:
+                    raise MailboxImportTooLarge("Plik importu zawiera zbyt wiele wiadomości")
+                if current is not None:
+                    finish_current()
+                    current = None
+                if len(batch) >= ExportConfig.IMPORT_BATCH_SIZE:
+                    await _write_import_batch(db, user_id, batch)
+                    imported += len(batch)
+                    batch = []
+
+                try:
+                    message = ExportedMessage.model_validate(record)
+                except ValidationError:
+                    raise MailboxImportError(f"Wiersz {line_number}: nieprawidłowa wiadomość")
+                username = message.correspondent_username
+                if username not in correspondents:
+                    result = await db.execute(select(User.id).where(User.username == username))
+                    correspondent_id = result.scalar_one_or_none()
+                    correspondents[username] = correspondent_id if correspondent_id != user_id else None
+
+                if correspondents[username] is None:
+                    skipped += 1
+                    skipped_attachment_ids = {attachment.id for attachment in message.attachments}
+                    continue
+                skipped_attachment_ids = set()
+                current = _ImportedMessage(message, correspondents[username], {
+                    attachment.id: _ImportedAttachment(attachment, spool_path(f"import-{uuid.uuid4().hex}"))
+                    for attachment in message.attachments
+                })
+
+            elif record_type == "attachment_data":
+                attachment_id = record.get("attachment_id")
+                if attachment_id in skipped_attachment_ids:
+                    continue
+                attachment = current.attachments.get(attachment_id) if current is not None else None
+                if attachment is None or not isinstance(record.get("data"), str):
+                    raise MailboxImportError(f"Wiersz {line_number}: fragment nieznanego załącznika")
+                try:
+                    chunk = base64.b64decode(record["data"], validate=True)
+                except binascii.Error:
+                    raise MailboxImportError(f"Wiersz {line_number}: nieprawidłowe dane załącznika")
+                attachment.written += len(chunk)
+                if attachment.written > attachment.meta.data_size:
+                    raise MailboxImportError(f"Wiersz {line_number}: załącznik większy niż zadeklarowano")
+                attachment.digest.update(chunk)
+                await append_to_file(attachment.path, chunk)
+
+            else:
+                raise MailboxImportError(f"Wiersz {line_number}: nieznany typ wiersza")
+
+        if not header_seen:
+            raise MailboxImportError("Brak nagłówka eksportu")
+        if current is not None:
+            finish_current()
+            current = None
+        if batch:
+            await _write_import_batch(db, user_id, batch)
+            imported += len(batch)
+            batch = []
+    except BaseException:
+        await discard_written_blobs(db)
+        raise
+    finally:
+        # Pliki tymczasowe paczki, która nie trafiła do magazynu blobów
+        for pending in [*batch, *([current] if current is not None else [])]:
+            for attachment in pending.attachments.values():
+                await remove_file(attachment.path)
+
+    return imported, skipped
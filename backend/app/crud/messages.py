@@ -1,105 +1,641 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, update, delete, insert, tuple_, func, case
 from sqlalchemy.orm import selectinload
-from app.models.message import Message
-from app.models.attachment import Attachment
+from app.models.message import Message, MessageContent, MessageTombstone
+from app.models.attachment import Attachment, Blob
+from app.models.conversation import Conversation
 from app.models.user import User
-from app.schemas.message import SendMessageRequest
+from app.models.upload import UploadSession
+from app.schemas.message import SendMessageRequest, GroupSendRequest, AttachmentData, MessageFilters
+from app.crud.uploads import delete_upload_sessions, remove_upload_files
+from app.crud.blobs import store_blob, release_blobs, discard_written_blobs
+from app.crud.conversations import record_messages, record_read, record_deleted, visible_thread
+from app.utils.blob_store import get_blob_store
+from app.utils.upload_storage import part_path
+from app.config import BulkConfig, PaginationConfig
+from collections import Counter
 from datetime import datetime, timezone
+from typing import Iterator
 import base64
 
-async def create_message(db: AsyncSession, message_in: SendMessageRequest, sender_id: int) -> Message:
-    db_message = Message(
-        sender_id=sender_id,
-        receiver_id=message_in.receiver_id,
-        encrypted_content=message_in.encrypted_content,
-        encrypted_symmetric_key=message_in.encrypted_symmetric_key,
-        encrypted_symmetric_key_sender=message_in.encrypted_symmetric_key_sender,
-        signature=message_in.signature
-    )
-    db.add(db_message)
-    await db.flush()
-    
-    if message_in.attachments:
-        for attachment_data in message_in.attachments:
-            encrypted_binary = base64.b64decode(attachment_data.encrypted_data)
-            
-            db_attachment = Attachment(
-                message_id=db_message.id,
-                encrypted_data=encrypted_binary,
-                filename=attachment_data.filename,
-                mime_type=attachment_data.mime_type,
-                size=attachment_data.size
-            )
-            db.add(db_attachment)
-    
-    await db.commit()
-    await db.refresh(db_message)
-    return db_message
+async def _next_seq(db: AsyncSession, user_id: int) -> int:
+    """Podbija licznik zmian skrzynki użytkownika w bieżącej transakcji."""
+    query = (
+        update(User)
+        .where(User.id == user_id)
+        .values(mailbox_seq=User.mailbox_seq + 1)
+        .returning(User.mailbox_seq)
+    )
+    result = await db.execute(query)
+    return result.scalar_one()
+
+
+async def _reserve_seqs(db: AsyncSession, user_ids: list[int]) -> tuple[dict[int, Iterator[int]], dict[int, int]]:
+    """
+    Rezerwuje po jednym numerze mailbox_seq na każde wystąpienie użytkownika - jeden UPDATE
+    na użytkownika. Zwraca iteratory kolejnych numerów i bieżące key_epoch.
+    """
+    seqs, epochs = {}, {}
+    for user_id, count in Counter(user_ids).items():
+        query = (
+            update(User)
+            .where(User.id == user_id)
+            .values(mailbox_seq=User.mailbox_seq + count)
+            .returning(User.mailbox_seq, User.key_epoch)
+        )
+        last_seq, epochs[user_id] = (await db.execute(query)).one()
+        seqs[user_id] = iter(range(last_seq - count + 1, last_seq + 1))
+    return seqs, epochs
+
+
+async def _store_attachments(
+    db: AsyncSession,
+    attachments: list[AttachmentData] | None,
+    uploads: list[UploadSession] | None,
+    refs: int = 1,
+) -> list[dict]:
+    """Zapisuje treść załączników raz, z licznikiem referencji dla refs wiadomości."""
+    stored = []
+    for attachment_data in attachments or []:
+        stored.append({
+            "blob_sha256": await store_blob(db, base64.b64decode(attachment_data.encrypted_data), refs=refs),
+            "filename": attachment_data.filename,
+            "mime_type": attachment_data.mime_type,
+            "size": attachment_data.size,
+        })
+    for upload in uploads or []:
+        stored.append({
+            "blob_sha256": await store_blob(db, part_path(upload.id), upload.sha256, upload.total_size, refs=refs),
+            "filename": upload.filename,
+            "mime_type": upload.mime_type,
+            "size": upload.size,
+        })
+    return stored
+
+
+async def create_messages(
+    db: AsyncSession,
+    items: list[tuple[SendMessageRequest, int, list[UploadSession] | None]],
+) -> list[Message]:
+    """
+    Zapisuje wiadomości (message_in, sender_id, uploads) w jednej transakcji:
+    jeden INSERT ... RETURNING na wiadomości, jeden na załączniki i jeden UPDATE na użytkownika.
+    """
+    upload_ids = [upload.id for _, _, uploads in items for upload in uploads or []]
+    try:
+        seqs, epochs = await _reserve_seqs(db, [
+            user_id
+            for message_in, sender_id, _ in items
+            for user_id in (sender_id, message_in.receiver_id)
+        ])
+        rows = [
+            {
+                "sender_id": sender_id,
+                "receiver_id": message_in.receiver_id,
+                "encrypted_content": message_in.encrypted_content,
+                "encrypted_symmetric_key": message_in.encrypted_symmetric_key,
+                "encrypted_symmetric_key_sender": message_in.encrypted_symmetric_key_sender,
+                "signature": message_in.signature,
+                "sender_key_epoch": epochs[sender_id],
+                "receiver_key_epoch": epochs[message_in.receiver_id],
+                "sender_seq": next(seqs[sender_id]),
+                "receiver_seq": next(seqs[message_in.receiver_id]),
+            }
+            for message_in, sender_id, _ in items
+        ]
+        result = await db.scalars(insert(Message).returning(Message, sort_by_parameter_order=True), rows)
+        messages = result.all()
+        await record_messages(db, messages)
+
+        attachment_rows = []
+        for message, (message_in, _, uploads) in zip(messages, items):
+            for attachment in await _store_attachments(db, message_in.attachments, uploads):
+                attachment_rows.append({"message_id": message.id, **attachment})
+        if attachment_rows:
+            await db.execute(insert(Attachment), attachment_rows)
+        await delete_upload_sessions(db, upload_ids)
+
+        await db.commit()
+    except BaseException:
+        await discard_written_blobs(db)
+        raise
+    await remove_upload_files(upload_ids)
+    return messages
 
-async def get_inbox_messages(db: AsyncSession, receiver_id: int):
+
+async def create_message(
+    db: AsyncSession,
+    message_in: SendMessageRequest,
+    sender_id: int,
+    uploads: list[UploadSession] | None = None,
+) -> Message:
+    messages = await create_messages(db, [(message_in, sender_id, uploads)])
+    return messages[0]
+
+
+async def create_group_message(
+    db: AsyncSession,
+    group_in: GroupSendRequest,
+    sender_id: int,
+    uploads: list[UploadSession] | None = None,
+) -> list[Message]:
+    """
+    Wiadomość do wielu odbiorców: szyfrogram i załączniki zapisane raz,
+    dla każdego odbiorcy tylko koperta z jego zaszyfrowanym kluczem.
+    """
+    upload_ids = [upload.id for upload in uploads or []]
+    try:
+        content = MessageContent(
+            encrypted_content=group_in.encrypted_content,
+            encrypted_symmetric_key_sender=group_in.encrypted_symmetric_key_sender,
+            signature=group_in.signature,
+        )
+        db.add(content)
+        await db.flush()
+
+        receiver_ids = [recipient.receiver_id for recipient in group_in.recipients]
+        seqs, epochs = await _reserve_seqs(db, [sender_id, *receiver_ids])
+        sender_seq = next(seqs[sender_id])
+        rows = [
+            {
+                "sender_id": sender_id,
+                "receiver_id": recipient.receiver_id,
+                "content_id": content.id,
+                "encrypted_symmetric_key": recipient.encrypted_symmetric_key,
+                "sender_key_epoch": epochs[sender_id],
+                "receiver_key_epoch": epochs[recipient.receiver_id],
+                "sender_seq": sender_seq,
+                "receiver_seq": next(seqs[recipient.receiver_id]),
+            }
+            for recipient in group_in.recipients
+        ]
+        result = await db.scalars(insert(Message).returning(Message, sort_by_parameter_order=True), rows)
+        envelopes = result.all()
+        await record_messages(db, envelopes)
+
+        attachments = await _store_attachments(db, group_in.attachments, uploads, refs=len(envelopes))
+        if attachments:
+            await db.execute(insert(Attachment), [
+                {"message_id": envelope.id, **attachment}
+                for envelope in envelopes
+                for attachment in attachments
+            ])
+        await delete_upload_sessions(db, upload_ids)
+
+        await db.commit()
+    except BaseException:
+        await discard_written_blobs(db)
+        raise
+    await remove_upload_files(upload_ids)
+    return envelopes
+
+def _apply_cursor(query, cursor: tuple[datetime, int] | None, limit: int | None):
+    if cursor is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) < tuple_(*cursor))
+    query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _apply_filters(query, filters: MessageFilters | None, correspondent_column):
+    """Filtry po metadanych - każdy odpowiada indeksowi z Message.__table_args__ lub Attachment."""
+    if filters is None:
+        return query
+    if filters.correspondent_id is not None:
+        query = query.where(correspondent_column == filters.correspondent_id)
+    if filters.since is not None:
+        query = query.where(Message.created_at >= filters.since)
+    if filters.until is not None:
+        query = query.where(Message.created_at <= filters.until)
+    if filters.unread is not None:
+        query = query.where(Message.is_read == (not filters.unread))
+
+    attachment_conditions = []
+    if filters.mime_type is not None:
+        if filters.mime_type.endswith("/*"):
+            # Prefiks jako zakres, żeby pozostał przeszukiwaniem indeksu: "image/" <= typ < "image0"
+            prefix = filters.mime_type[:-1]
+            attachment_conditions.append(Attachment.mime_type >= prefix)
+            attachment_conditions.append(Attachment.mime_type < prefix[:-1] + chr(ord("/") + 1))
+        else:
+            attachment_conditions.append(Attachment.mime_type == filters.mime_type)
+    if filters.min_attachment_size is not None:
+        attachment_conditions.append(Attachment.size >= filters.min_attachment_size)
+    if filters.max_attachment_size is not None:
+        attachment_conditions.append(Attachment.size <= filters.max_attachment_size)
+
+    if attachment_conditions or filters.has_attachments:
+        query = query.where(
+            select(Attachment.message_id)
+            .where(Attachment.message_id == Message.id)
+            .where(*attachment_conditions)
+            .exists()
+        )
+    if filters.has_attachments is False:
+        query = query.where(~select(Attachment.message_id).where(Attachment.message_id == Message.id).exists())
+    return query
+
+
+def _inbox_query(receiver_id: int, cursor: tuple[datetime, int] | None, limit: int | None, filters: MessageFilters | None):
     query = (
-        select(Message, User.username)
+        select(Message, User.username, User.key_epoch)
         .join(User, Message.sender_id == User.id)
         .where(Message.receiver_id == receiver_id)
         .where(Message.deleted_by_receiver == False)
         .options(selectinload(Message.attachments))
-        .order_by(Message.created_at.desc())
     )
-    result = await db.execute(query)
-
-    return result.all()
+    query = _apply_filters(query, filters, Message.sender_id)
+    return _apply_cursor(query, cursor, limit)
 
 
-async def get_sent_messages(db: AsyncSession, sender_id: int):
+def _sent_query(sender_id: int, cursor: tuple[datetime, int] | None, limit: int | None, filters: MessageFilters | None):
     query = (
-        select(Message, User.username)
+        select(Message, User.username, User.key_epoch)
         .join(User, Message.receiver_id == User.id)
         .where(Message.sender_id == sender_id)
         .where(Message.deleted_by_sender == False)
         .options(selectinload(Message.attachments))
-        .order_by(Message.created_at.desc())
     )
-    result = await db.execute(query)
+    query = _apply_filters(query, filters, Message.receiver_id)
+    return _apply_cursor(query, cursor, limit)
+
+
+async def _stream_partitions(session_factory: async_sessionmaker, query):
+    """
+    Wyniki kursorem bazy paczkami po PaginationConfig.STREAM_BATCH_SIZE wierszy.
+    Sesja jest własna generatora - czytanie trwa dłużej niż żądanie, które go utworzyło.
+    """
+    db = session_factory()
+    try:
+        result = await db.stream(query.execution_options(yield_per=PaginationConfig.STREAM_BATCH_SIZE))
+        async for partition in result.partitions():
+            yield partition
+    finally:
+        await db.close()
+
+
+async def get_inbox_messages(
+    db: AsyncSession,
+    receiver_id: int,
+    limit: int | None = None,
+    cursor: tuple[datetime, int] | None = None,
+    filters: MessageFilters | None = None,
+):
+    result = await db.execute(_inbox_query(receiver_id, cursor, limit, filters))
+    return result.all()
+
+
+async def get_sent_messages(
+    db: AsyncSession,
+    sender_id: int,
+    limit: int | None = None,
+    cursor: tuple[datetime, int] | None = None,
+    filters: MessageFilters | None = None,
+):
+    result = await db.execute(_sent_query(sender_id, cursor, limit, filters))
     return result.all()
 
 
+def stream_inbox_messages(
+    session_factory: async_sessionmaker,
+    receiver_id: int,
+    cursor: tuple[datetime, int] | None = None,
+    filters: MessageFilters | None = None,
+):
+    """Cała skrzynka odbiorcza od kursora jako paczki wierszy jak w get_inbox_messages."""
+    return _stream_partitions(session_factory, _inbox_query(receiver_id, cursor, None, filters))
+
+
+def stream_sent_messages(
+    session_factory: async_sessionmaker,
+    sender_id: int,
+    cursor: tuple[datetime, int] | None = None,
+    filters: MessageFilters | None = None,
+):
+    """Wszystkie wysłane wiadomości od kursora jako paczki wierszy jak w get_sent_messages."""
+    return _stream_partitions(session_factory, _sent_query(sender_id, cursor, None, filters))
+
+
+async def get_thread_messages(
+    db: AsyncSession,
+    user_id: int,
+    correspondent_id: int,
+    limit: int | None = None,
+    cursor: tuple[datetime, int] | None = None,
+):
+    """Wiadomości rozmowy z correspondent_id widoczne dla user_id, od najnowszej."""
+    ids = (await db.execute(visible_thread(user_id, correspondent_id, cursor, limit))).scalars().all()
+    if not ids:
+        return []
+    query = select(Message).where(Message.id.in_(ids)).options(selectinload(Message.attachments))
+    messages = {message.id: message for message in (await db.execute(query)).scalars()}
+    return [messages[message_id] for message_id in ids]
+
+
 async def get_message_by_id(db: AsyncSession, message_id: int) -> Message | None:
     query = select(Message).where(Message.id == message_id)
     result = await db.execute(query)
     return result.scalar_one_or_none()
 
 
-async def mark_message_read(db: AsyncSession, message_id: int):
+async def get_attachment_with_access(db: AsyncSession, attachment_id: int):
+    """
+    Pobiera załącznik razem z nadawcą i odbiorcą wiadomości jednym zapytaniem.
+    Zwraca krotkę (attachment, sender_id, receiver_id, data_size, blob_backend) lub None.
+    """
+    query = (
+        select(
+            Attachment,
+            Message.sender_id,
+            Message.receiver_id,
+            func.coalesce(Blob.size, func.length(Attachment.encrypted_data)).label("data_size"),
+            Blob.backend,
+        )
+        .join(Message, Attachment.message_id == Message.id)
+        .outerjoin(Blob, Attachment.blob_sha256 == Blob.sha256)
+        .where(Attachment.id == attachment_id)
+    )
+    result = await db.execute(query)
+    return result.one_or_none()
+
+
+async def iter_attachment_data(
+    db: AsyncSession,
+    attachment: Attachment,
+    blob_backend: str | None,
+    start: int,
+    end: int,
+    chunk_size: int,
+):
+    """Fragmenty szyfrogramu z magazynu blobów albo ze starszej kolumny encrypted_data."""
+    if attachment.blob_sha256:
+        store = get_blob_store(blob_backend)
+        async for chunk in store.iter_range(db, attachment.blob_sha256, start, end, chunk_size):
+            yield chunk
+        return
+
+    offset = start
+    while offset <= end:
+        query = (
+            select(func.substr(Attachment.encrypted_data, offset + 1, min(chunk_size, end - offset + 1)))
+            .where(Attachment.id == attachment.id)
+        )
+        chunk = (await db.execute(query)).scalar_one_or_none()
+        if not chunk:
+            break
+        yield chunk
+        offset += len(chunk)
+
+
+async def mark_message_read(db: AsyncSession, message_id: int) -> bool:
+    """Zwraca True, jeśli wiadomość była wcześniej nieprzeczytana."""
+    query = (
+        select(Message.sender_id, Message.receiver_id)
+        .where(Message.id == message_id)
+        .where(Message.is_read == False)
+        .where(Message.deleted_by_receiver == False)
+    )
+    row = (await db.execute(query)).one_or_none()
+    if not row:
+        return False
+
+    sender_id, receiver_id = row
     query = (
         update(Message)
         .where(Message.id == message_id)
-        .values(is_read=True, read_at=datetime.now(timezone.utc))
+        .values(
+            is_read=True,
+            read_at=datetime.now(timezone.utc),
+            sender_seq=await _next_seq(db, sender_id),
+            receiver_seq=await _next_seq(db, receiver_id),
+        )
     )
     await db.execute(query)
+    await record_read(db, receiver_id, [sender_id])
     await db.commit()
+    return True
 
 
-async def delete_message(db: AsyncSession, message_id: int, user_id: int):
+async def mark_messages_read(
+    db: AsyncSession,
+    receiver_id: int,
+    message_ids: list[int] | None = None,
+    up_to_seq: int | None = None,
+    up_to: datetime | None = None,
+) -> list[tuple[int, int]]:
     """
-    Soft delete - oznacza wiadomość jako usuniętą dla danego użytkownika.
-    Fizycznie usuwa tylko gdy obydwaj użytkownicy usunęli wiadomość.
+    Oznacza wiele wiadomości odbiorcy jednym UPDATE w jednej transakcji.
+    Zwraca pary (id, sender_id) wierszy, które faktycznie się zmieniły.
     """
-    query = select(Message).where(Message.id == message_id)
-    result = await db.execute(query)
-    message = result.scalar_one_or_none()
-    
-    if not message:
-        return
-    
-    if message.sender_id == user_id:
-        message.deleted_by_sender = True
-    elif message.receiver_id == user_id:
-        message.deleted_by_receiver = True
-    
-    if message.deleted_by_sender and message.deleted_by_receiver:
-        await db.delete(message)
-    
+    conditions = [
+        Message.receiver_id == receiver_id,
+        Message.is_read == False,
+        Message.deleted_by_receiver == False,
+    ]
+    if message_ids is not None:
+        conditions.append(Message.id.in_(message_ids))
+    if up_to_seq is not None:
+        conditions.append(Message.receiver_seq <= up_to_seq)
+    if up_to is not None:
+        conditions.append(Message.created_at <= up_to)
+
+    # Bez zmian nie ma zapisu ani nowego numeru mailbox_seq - klienci nie synchronizują się na próżno
+    if (await db.execute(select(Message.id).where(*conditions).limit(1))).first() is None:
+        return []
+
+    query = update(Message).where(*conditions).values(
+        is_read=True,
+        read_at=datetime.now(timezone.utc),
+        receiver_seq=await _next_seq(db, receiver_id),
+    ).returning(Message.id, Message.sender_id)
+    result = await db.execute(query, execution_options={"synchronize_session": "fetch"})
+    rows = [tuple(row) for row in result.all()]
+
+    # Nadawcy też widzą zmianę przez /sync - jeden UPDATE na każdego nadawcę
+    by_sender: dict[int, list[int]] = {}
+    for message_id, sender_id in rows:
+        by_sender.setdefault(sender_id, []).append(message_id)
+    for sender_id, ids in by_sender.items():
+        await db.execute(
+            update(Message)
+            .where(Message.id.in_(ids))
+            .values(sender_seq=await _next_seq(db, sender_id))
+        )
+    await record_read(db, receiver_id, [sender_id for _, sender_id in rows])
+
+    await db.commit()
+    return rows
+
+
+async def delete_messages(
+    db: AsyncSession,
+    user_id: int,
+    message_ids: list[int] | None = None,
+    correspondent_id: int | None = None,
+) -> tuple[list[int], list[int], int]:
+    """
+    Soft delete wielu wiadomości po stronie użytkownika - po jednym UPDATE na stronę.
+    Wybór po id albo cała rozmowa z correspondent_id. Fizycznie usuwa purge_deleted_messages.
+    Zwraca (id wysłanych, id odebranych, liczba usuniętych nieprzeczytanych).
+    """
+    sent_query = (
+        update(Message)
+        .where(Message.sender_id == user_id)
+        .where(Message.deleted_by_sender == False)
+        .values(deleted_by_sender=True)
+        .returning(Message.id, Message.receiver_id)
+    )
+    inbox_query = (
+        update(Message)
+        .where(Message.receiver_id == user_id)
+        .where(Message.deleted_by_receiver == False)
+        .values(deleted_by_receiver=True)
+        .returning(Message.id, Message.is_read, Message.sender_id)
+    )
+    if message_ids is not None:
+        sent_query = sent_query.where(Message.id.in_(message_ids))
+        inbox_query = inbox_query.where(Message.id.in_(message_ids))
+    if correspondent_id is not None:
+        sent_query = sent_query.where(Message.receiver_id == correspondent_id)
+        inbox_query = inbox_query.where(Message.sender_id == correspondent_id)
+
+    options = {"synchronize_session": "fetch"}
+    sent_rows = (await db.execute(sent_query, execution_options=options)).all()
+    inbox_rows = (await db.execute(inbox_query, execution_options=options)).all()
+    sent_ids = [message_id for message_id, _ in sent_rows]
+    inbox_ids = [message_id for message_id, _, _ in inbox_rows]
+    unread = sum(1 for _, is_read, _ in inbox_rows if not is_read)
+
+    deleted_ids = sent_ids + inbox_ids
+    if deleted_ids:
+        seq = await _next_seq(db, user_id)
+        await db.execute(
+            insert(MessageTombstone),
+            [{"user_id": user_id, "message_id": message_id, "seq": seq} for message_id in deleted_ids],
+        )
+        await record_deleted(db, user_id, [
+            *((receiver_id, False) for _, receiver_id in sent_rows),
+            *((sender_id, not is_read) for _, is_read, sender_id in inbox_rows),
+        ])
+    await db.commit()
+    return sent_ids, inbox_ids, unread
+
+
+async def purge_deleted_messages(db: AsyncSession) -> int:
+    """
+    Fizycznie usuwa paczkę wiadomości usuniętych przez obie strony razem z załącznikami
+    i niewykorzystaną już wspólną treścią, zwalnia bloby. Zwraca liczbę usuniętych wiadomości.
+    """
+    query = (
+        select(Message.id, Message.content_id)
+        .where(Message.deleted_by_sender == True)
+        .where(Message.deleted_by_receiver == True)
+        .limit(BulkConfig.PURGE_BATCH_SIZE)
+    )
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return 0
+    message_ids = [message_id for message_id, _ in rows]
+    content_ids = {content_id for _, content_id in rows if content_id is not None}
+
+    result = await db.execute(
+        delete(Attachment)
+        .where(Attachment.message_id.in_(message_ids))
+        .returning(Attachment.blob_sha256)
+    )
+    await release_blobs(db, list(result.scalars().all()))
+    await db.execute(delete(Message).where(Message.id.in_(message_ids)))
+    if content_ids:
+        # Wspólna treść znika razem z ostatnią kopertą
+        await db.execute(
+            delete(MessageContent)
+            .where(MessageContent.id.in_(content_ids))
+            .where(~select(Message.id).where(Message.content_id == MessageContent.id).exists())
+        )
+    await db.commit()
+    return len(message_ids)
+
+
+async def get_mailbox_seq(db: AsyncSession, user_id: int) -> int:
+    result = await db.execute(select(User.mailbox_seq).where(User.id == user_id))
+    return result.scalar_one()
+
+
+async def count_mailbox(db: AsyncSession, user_id: int) -> dict[str, int]:
+    """Liczniki skrzynki zliczone z bazy - źródło prawdy dla liczników w Redisie."""
+    inbox_query = (
+        select(func.count(), func.coalesce(func.sum(case((Message.is_read == False, 1), else_=0)), 0))
+        .where(Message.receiver_id == user_id)
+        .where(Message.deleted_by_receiver == False)
+    )
+    sent_query = (
+        select(func.count())
+        .where(Message.sender_id == user_id)
+        .where(Message.deleted_by_sender == False)
+    )
+    inbox, unread = (await db.execute(inbox_query)).one()
+    sent = (await db.execute(sent_query)).scalar_one()
+    return {"unread": unread, "inbox": inbox, "sent": sent}
+
+
+async def get_mailbox_changes(db: AsyncSession, user_id: int, since: int):
+    """
+    Zmiany skrzynki od kursora since: (inbox, sent, usunięte id).
+    Każda lista to jeden zakres indeksu po (user_id, seq).
+    """
+    inbox_query = (
+        select(Message, User.username, User.key_epoch)
+        .join(User, Message.sender_id == User.id)
+        .where(Message.receiver_id == user_id)
+        .where(Message.receiver_seq > since)
+        .where(Message.deleted_by_receiver == False)
+        .options(selectinload(Message.attachments))
+        .order_by(Message.receiver_seq)
+    )
+    sent_query = (
+        select(Message, User.username, User.key_epoch)
+        .join(User, Message.receiver_id == User.id)
+        .where(Message.sender_id == user_id)
+        .where(Message.sender_seq > since)
+        .where(Message.deleted_by_sender == False)
+        .options(selectinload(Message.attachments))
+        .order_by(Message.sender_seq)
+    )
+    tombstones_query = (
+        select(MessageTombstone.message_id)
+        .where(MessageTombstone.user_id == user_id)
+        .where(MessageTombstone.seq > since)
+        .order_by(MessageTombstone.seq)
+    )
+    inbox = (await db.execute(inbox_query)).all()
+    sent = (await db.execute(sent_query)).all()
+    deleted = list((await db.execute(tombstones_query)).scalars().all())
+    return inbox, sent, deleted
+
+
+# "YYYY-MM-DD HH:MM:SS" - CURRENT_TIMESTAMP ze starszego server_default, bez mikrosekund
+LEGACY_TIMESTAMP_LENGTH = 19
+
+
+async def normalize_legacy_timestamps(db: AsyncSession) -> int:
+    """
+    Dopisuje ".000000" do dat zapisanych przez starszy server_default. SQLite porównuje
+    daty jako tekst, więc "...:00" < "...:00.000000" i wiersz z granicy strony wracał
+    na następnej. Zwraca liczbę poprawionych wiadomości.
+    """
+    result = await db.execute(
+        update(Message)
+        .where(func.length(Message.created_at) == LEGACY_TIMESTAMP_LENGTH)
+        .values(created_at=func.printf("%s.000000", Message.created_at))
+        .execution_options(synchronize_session=False)
+    )
+    # Podsumowania przeliczone z takich wiadomości skopiowały ich created_at
+    await db.execute(
+        update(Conversation)
+        .where(func.length(Conversation.last_message_at) == LEGACY_TIMESTAMP_LENGTH)
+        .values(last_message_at=func.printf("%s.000000", Conversation.last_message_at))
+        .execution_options(synchronize_session=False)
+    )
     await db.commit()
-    
-    return message
+    return result.rowcount
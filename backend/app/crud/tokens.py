@@ -1,5 +1,6 @@
 import redis.asyncio as redis
 from app.config import JWTConfig
+from app.utils.token_cache import publish_revocation
 
 
 async def add_refresh_token(redis_conn: redis.Redis, user_id: int, refresh_token_id: str):
@@ -27,6 +28,8 @@ async def revoke_refresh_token(redis_conn: redis.Redis, refresh_token_id: str):
     
     if user_id:
         await redis_conn.srem(f"user:{user_id}:refresh_tokens", refresh_token_id)
+    
+    await publish_revocation(redis_conn, [refresh_token_id])
 
 
 async def revoke_all_user_tokens(redis_conn: redis.Redis, user_id: int):
@@ -37,3 +40,5 @@ async def revoke_all_user_tokens(redis_conn: redis.Redis, user_id: int):
         await redis_conn.delete(*keys_to_delete)
     
     await redis_conn.delete(f"user:{user_id}:refresh_tokens")
+    
+    await publish_revocation(redis_conn, list(token_ids))
@@ -0,0 +1,95 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timedelta, timezone
+import uuid
+
+from app.config import UploadConfig
+from app.models.upload import UploadSession, UploadChunk
+from app.schemas.upload import CreateUploadRequest
+from app.utils.upload_storage import create_part_file, remove_part
+
+
+async def create_upload_session(db: AsyncSession, upload_in: CreateUploadRequest, user_id: int) -> UploadSession:
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=upload_in.filename,
+        mime_type=upload_in.mime_type,
+        size=upload_in.size,
+        total_size=upload_in.total_size,
+        chunk_size=UploadConfig.CHUNK_SIZE,
+        sha256=upload_in.sha256,
+    )
+    await create_part_file(session.id, session.total_size)
+    db.add(session)
+    await db.commit()
+    await db.refresh(session, attribute_names=["chunks"])
+    return session
+
+
+async def get_upload_session(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession | None:
+    query = (
+        select(UploadSession)
+        .where(UploadSession.id == upload_id)
+        .where(UploadSession.user_id == user_id)
+        .options(selectinload(UploadSession.chunks))
+    )
+    result = await db.execute(query)
+    return result.scalar_one_or_none()
+
+
+async def record_chunk(db: AsyncSession, upload_id: str, index: int, size: int) -> None:
+    """Zapis idempotentny - ponowne wysłanie tego samego fragmentu nadpisuje wpis."""
+    query = (
+        insert(UploadChunk)
+        .values(session_id=upload_id, index=index, size=size)
+        .on_conflict_do_update(index_elements=["session_id", "index"], set_={"size": size})
+    )
+    await db.execute(query)
+    await db.commit()
+
+
+async def mark_upload_complete(db: AsyncSession, session: UploadSession) -> None:
+    session.is_complete = True
+    await db.commit()
+
+
+async def get_completed_uploads(db: AsyncSession, upload_ids: list[str], user_id: int) -> list[UploadSession]:
+    query = (
+        select(UploadSession)
+        .where(UploadSession.id.in_(upload_ids))
+        .where(UploadSession.user_id == user_id)
+        .where(UploadSession.is_complete == True)
+    )
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def delete_upload_sessions(db: AsyncSession, upload_ids: list[str]) -> None:
+    """Usuwa wpisy sesji bez commita - pliki tymczasowe usuwa wywołujący po commicie."""
+    if not upload_ids:
+        return
+    await db.execute(delete(UploadChunk).where(UploadChunk.session_id.in_(upload_ids)))
+    await db.execute(delete(UploadSession).where(UploadSession.id.in_(upload_ids)))
+
+
+async def remove_upload_files(upload_ids: list[str]) -> None:
+    for upload_id in upload_ids:
+        await remove_part(upload_id)
+
+
+async def delete_expired_upload_sessions(db: AsyncSession, user_id: int) -> None:
+    expires_before = datetime.now(timezone.utc) - timedelta(hours=UploadConfig.SESSION_TTL_HOURS)
+    query = (
+        select(UploadSession.id)
+        .where(UploadSession.user_id == user_id)
+        .where(UploadSession.created_at < expires_before)
+    )
+    result = await db.execute(query)
+    expired_ids = list(result.scalars().all())
+    if expired_ids:
+        await delete_upload_sessions(db, expired_ids)
+        await db.commit()
+        await remove_upload_files(expired_ids)
@@ -1,6 +1,12 @@
+import json
+
+import redis.asyncio as redis
+from loguru import logger
+from app.config import UserCacheConfig
 from app.models.user import User
+from app.utils.user_cache import UserSnapshot, user_cache, publish_invalidation
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.exc import SQLAlchemyError
 
 
@@ -44,18 +50,139 @@ async def list_all_users(db: AsyncSession) -> list[User]:
     return list(users)
 
 
-async def enable_totp_for_user(db: AsyncSession, user: User) -> None:
+async def get_encrypted_private_key(db: AsyncSession, user_id: int) -> str | None:
+    result = await db.execute(select(User.encrypted_private_key).where(User.id == user_id))
+    return result.scalar_one_or_none()
+
+
+async def enable_totp_for_user(db: AsyncSession, redis_conn: redis.Redis, user: User) -> None:
     user.is_2fa_enabled = True
     await db.commit()
     await db.refresh(user)
+    await invalidate_user(redis_conn, user.id)
 
-async def disable_totp_for_user(db: AsyncSession, user: User) -> None:
+async def disable_totp_for_user(db: AsyncSession, redis_conn: redis.Redis, user: User) -> None:
     user.totp_secret_encrypted = None
     user.is_2fa_enabled = False
     await db.commit()
     await db.refresh(user)
+    await invalidate_user(redis_conn, user.id)
 
-async def set_totp_secret(db: AsyncSession, user: User, totp_secret_encrypted: str) -> None:
+async def set_totp_secret(db: AsyncSession, redis_conn: redis.Redis, user: User, totp_secret_encrypted: str) -> None:
     user.totp_secret_encrypted = totp_secret_encrypted
     await db.commit()
     await db.refresh(user)
+    await invalidate_user(redis_conn, user.id)
+
+
+async def update_password_hash(db: AsyncSession, user_id: int, old_hash: str, new_hash: str) -> bool:
+    """Podmienia hash tylko, jeśli w międzyczasie nie zmieniło go np. resetowanie hasła."""
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .where(User.password_hash == old_hash)
+        .values(password_hash=new_hash)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+def _snapshot_key(user_id: int) -> str:
+    return f"user:{user_id}:snapshot"
+
+
+async def _load_user_snapshot(db: AsyncSession, user_id: int) -> UserSnapshot | None:
+    """Tylko kolumny migawki - bez public_key i encrypted_private_key."""
+    result = await db.execute(
+        select(
+            User.id,
+            User.username,
+            User.email,
+            User.key_epoch,
+            User.is_2fa_enabled,
+            User.totp_secret_encrypted.is_not(None),
+        )
+        .where(User.id == user_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+    return UserSnapshot(row[0], row[1], row[2], row[3], bool(row[4]), bool(row[5]))
+
+
+async def _read_shared_snapshot(redis_conn: redis.Redis, user_id: int) -> tuple[UserSnapshot | None, int | None]:
+    """Migawka z Redisa i bieżąca wersja; migawka zapisana pod starszą wersją jest pomijana."""
+    try:
+        cached = await redis_conn.hgetall(_snapshot_key(user_id))
+    except redis.RedisError as e:
+        logger.error(f"Failed to read user snapshot: {e}")
+        return None, None
+
+    version = int(cached.get("version", 0))
+    if "snapshot" not in cached:
+        return None, version
+    try:
+        data = json.loads(cached["snapshot"])
+        if data.pop("version") != version:
+            return None, version
+        return UserSnapshot(**data), version
+    except (ValueError, TypeError, KeyError) as e:
+        logger.error(f"Invalid user snapshot: {e}")
+        return None, version
+
+
+async def _store_shared_snapshot(redis_conn: redis.Redis, snapshot: UserSnapshot, version: int):
+    key = _snapshot_key(snapshot.id)
+    data = {
+        "id": snapshot.id,
+        "username": snapshot.username,
+        "email": snapshot.email,
+        "key_epoch": snapshot.key_epoch,
+        "is_2fa_enabled": snapshot.is_2fa_enabled,
+        "has_totp_secret": snapshot.has_totp_secret,
+        "version": version,
+    }
+    try:
+        await redis_conn.hset(key, mapping={"snapshot": json.dumps(data)})
+        await redis_conn.expire(key, UserCacheConfig.REDIS_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.error(f"Failed to store user snapshot: {e}")
+
+
+async def get_user_snapshot(redis_conn: redis.Redis, db: AsyncSession, user_id: int) -> UserSnapshot | None:
+    """
+    Migawka użytkownika: lokalny LRU, potem (opcjonalnie) wspólna kopia w Redisie, na końcu baza.
+
+    Kopia w Redisie nosi wersję, którą invalidate_user podbija - migawka wczytana z bazy
+    przed unieważnieniem zostaje zapisana pod starą wersją i nikt jej już nie odczyta.
+    """
+    user_cache.ensure_started(redis_conn)
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    generation = user_cache.generation
+    version = None
+    if UserCacheConfig.REDIS_ENABLED:
+        snapshot, version = await _read_shared_snapshot(redis_conn, user_id)
+    if snapshot is None:
+        snapshot = await _load_user_snapshot(db, user_id)
+        if snapshot is None:
+            return None
+        if version is not None:
+            await _store_shared_snapshot(redis_conn, snapshot, version)
+
+    user_cache.add(snapshot, generation)
+    return snapshot
+
+
+async def invalidate_user(redis_conn: redis.Redis, user_id: int):
+    """Wywoływane po commicie zmiany widocznej w migawce - następny odczyt sięgnie do bazy."""
+    if UserCacheConfig.REDIS_ENABLED:
+        key = _snapshot_key(user_id)
+        try:
+            await redis_conn.hincrby(key, "version", 1)
+            await redis_conn.expire(key, UserCacheConfig.REDIS_TTL_SECONDS)
+        except redis.RedisError as e:
+            logger.error(f"Failed to invalidate user snapshot: {e}")
+    await publish_invalidation(redis_conn, [user_id])
@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from datetime import datetime, timezone
+
 from .config import DATABASE_URL
 
 Base = declarative_base()
@@ -11,6 +13,18 @@ SessionLocal = async_sessionmaker(
 )
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 async def get_db():
     async with SessionLocal() as session:
         yield session
+
+
+def get_session_factory() -> async_sessionmaker:
+    """
+    Fabryka sesji dla pracy trwającej dłużej niż żądanie, np. treści StreamingResponse.
+    Sesja z get_db jest zamykana, zanim FastAPI zacznie wysyłać ciało odpowiedzi.
+    """
+    return SessionLocal
@@ -8,7 +8,10 @@ import redis.asyncio as redis
 from loguru import logger
 
 from app.config import SECRET_KEY, JWTConfig, REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PASSWORD
+from app.crud.users import get_user_snapshot
 from app.db import get_db
+from app.utils.token_cache import token_cache
+from app.utils.user_cache import UserSnapshot
 
 redis_client = None
 
@@ -30,10 +33,8 @@ async def close_redis():
         await redis_client.close()
         redis_client = None
 
-async def verify_access_token(
-    request: Request,
-    redis_conn: redis.Redis = Depends(get_redis)
-) -> str:
+async def get_access_token_claims(request: Request) -> dict:
+    """Zweryfikowana zawartość JWT z ciasteczka access_token (bez sprawdzania sesji w Redisie)."""
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(
@@ -42,29 +43,6 @@ async def verify_access_token(
         )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[JWTConfig.ALGORITHM])
-        user_id: str = payload.get("sub")
-        refresh_token_id: str = payload.get("refresh_token_id")
-        
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Nieprawidłowa zawartość tokenu"
-            )
-        
-        if not refresh_token_id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Nieprawidłowy format tokenu"
-            )
-        
-        token_exists = await redis_conn.exists(f"refresh_token:{refresh_token_id}")
-        if not token_exists:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Sesja wygasła lub użytkownik się wylogował"
-            )
-        
-        return user_id
     except JWTError as e:
         logger.error(f"JWT validation error: {e}")
         raise HTTPException(
@@ -72,11 +50,60 @@ async def verify_access_token(
             detail="Nieprawidłowy lub wygasły token dostępu"
         )
 
+    if payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Nieprawidłowa zawartość tokenu"
+        )
+    
+    if not payload.get("refresh_token_id"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Nieprawidłowy format tokenu"
+        )
+    return payload
+
+async def is_session_active(redis_conn: redis.Redis, refresh_token_id: str) -> bool:
+    """Czy refresh token sesji nie został unieważniony - zwykle bez zapytania do Redisa."""
+    token_cache.ensure_started(redis_conn)
+    if token_cache.contains(refresh_token_id):
+        return True
+    generation = token_cache.generation
+    if not await redis_conn.exists(f"refresh_token:{refresh_token_id}"):
+        return False
+    token_cache.add(refresh_token_id, generation)
+    return True
+
+async def verify_access_token(
+    claims: dict = Depends(get_access_token_claims),
+    redis_conn: redis.Redis = Depends(get_redis)
+) -> str:
+    if not await is_session_active(redis_conn, claims["refresh_token_id"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesja wygasła lub użytkownik się wylogował"
+        )
+    return claims["sub"]
+
 async def get_current_user(
+    user_id: str = Depends(verify_access_token),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+) -> UserSnapshot:
+    """Migawka aktualnego użytkownika z JWT - zwykle z cache, bez zapytania do bazy."""
+    user = await get_user_snapshot(redis_conn, db, int(user_id))
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Użytkownik nie znaleziony"
+        )
+    return user
+
+async def get_current_user_record(
     user_id: str = Depends(verify_access_token),
     db: AsyncSession = Depends(get_db)
 ) -> User:
-    """Pobiera aktualnego użytkownika z JWT."""
+    """Pełny wiersz aktualnego użytkownika - dla handlerów, które go modyfikują."""
     result = await db.execute(
         select(User).where(User.id == int(user_id))
     )
@@ -2,6 +2,9 @@ from fastapi import Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 
+from app.config import HashingConfig
+from app.utils.password_hasher import HasherBusy
+
 
 class ExceptionHandlers:
     @staticmethod
@@ -22,3 +25,12 @@ class ExceptionHandlers:
                 status_code=500,
                 content={"detail": "Wystąpił błąd bazy danych."},
             )
+
+    @staticmethod
+    async def hasher_busy_handler(request: Request, exc: HasherBusy):
+        """Full password hashing queue - the client should retry instead of waiting in memory"""
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Serwer jest przeciążony. Proszę spróbować ponownie za chwilę."},
+            headers={"Retry-After": str(HashingConfig.RETRY_AFTER_SECONDS)},
+        )
@@ -4,8 +4,13 @@ from starlette.middleware.base import BaseHTTPMiddleware
 import uuid
 
 from app.dependencies import verify_access_token, close_redis
-from app.routers import users, auth, totp, messages, honeypot
+from app.routers import users, auth, totp, messages, honeypot, uploads, downloads, metrics
 from app.exceptions import ExceptionHandlers
+from app.utils.background_tasks import start_background_tasks, stop_background_tasks
+from app.utils.event_bus import event_bus
+from app.utils.token_cache import token_cache
+from app.utils.user_cache import user_cache
+from app.utils.password_hasher import HasherBusy, hasher_pool, get_dummy_hash
 
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
@@ -50,27 +55,44 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE"],
-    allow_headers=["Authorization", "Content-Type", "X-XSRF-TOKEN"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "X-XSRF-TOKEN", "Idempotency-Key"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.add_middleware(CSRFMiddleware)
 
+@app.on_event("startup")
+async def startup_event():
+    start_background_tasks()
+    await get_dummy_hash()
+
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_background_tasks()
+    await event_bus.stop()
+    await token_cache.stop()
+    await user_cache.stop()
+    hasher_pool.shutdown()
     await close_redis()
 
 app.state.limiter = limiter
 
 app.add_exception_handler(SQLAlchemyError, ExceptionHandlers.sqlalchemy_exception_handler)
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_exception_handler(HasherBusy, ExceptionHandlers.hasher_busy_handler)
 
 app.include_router(users.router, dependencies=[Depends(verify_access_token)])
 app.include_router(messages.router, dependencies=[Depends(verify_access_token)])
-# Totp has inline dependency on get_current_user
+app.include_router(uploads.router, dependencies=[Depends(verify_access_token)])
+# Totp has inline dependency on get_current_user / get_current_user_record
 app.include_router(totp.router)
 app.include_router(auth.router)
 app.include_router(honeypot.router)
+# Podpisane linki do załączników są uwierzytelniane podpisem HMAC, a nie ciasteczkiem
+app.include_router(downloads.router)
+# Tylko dla scrapera w sieci wewnętrznej - nginx blokuje /api/metrics
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -2,8 +2,10 @@
 Models package - imports all models to ensure SQLAlchemy mapper configuration.
 """
 from app.models.user import User
-from app.models.message import Message
-from app.models.attachment import Attachment
+from app.models.message import Message, MessageContent, MessageTombstone
+from app.models.attachment import Attachment, Blob
 from app.models.audit import LoginEvent, HoneypotEvent
+from app.models.upload import UploadSession, UploadChunk
+from app.models.conversation import Conversation
 
-__all__ = ["User", "Message", "Attachment", "LoginEvent", "HoneypotEvent"]
+__all__ = ["User", "Message", "MessageContent", "MessageTombstone", "Attachment", "Blob", "LoginEvent", "HoneypotEvent", "UploadSession", "UploadChunk", "Conversation"]
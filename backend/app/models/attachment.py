@@ -1,18 +1,38 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey
-from sqlalchemy.orm import relationship
-from app.db import Base
+from sqlalchemy import Column, Integer, String, LargeBinary, ForeignKey, DateTime, Index
+from sqlalchemy.orm import relationship, deferred
+from app.db import Base, utcnow
 
 
 class Attachment(Base):
     __tablename__ = "attachments"
+    __table_args__ = (
+        # Pokrywający indeks pod filtry listy wiadomości (typ MIME, rozmiar załącznika)
+        Index("ix_attachments_message_mime_size", "message_id", "mime_type", "size"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, index=True)
     
-    encrypted_data = Column(LargeBinary, nullable=False)
+    # Treść ładowana tylko na żądanie (undefer), listy wiadomości widzą sam manifest.
+    # Kolumna przechowuje wyłącznie starsze załączniki - nowe trafiają do magazynu blobów.
+    encrypted_data = deferred(Column(LargeBinary, nullable=True), raiseload=True)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
     
     filename = Column(String, nullable=False)
     mime_type = Column(String, nullable=False)
     size = Column(Integer, nullable=False)
     
-    message = relationship("Message", back_populates="attachments")
\ No newline at end of file
+    message = relationship("Message", back_populates="attachments")
+
+
+class Blob(Base):
+    """Zaszyfrowana treść adresowana skrótem SHA-256, współdzielona przez załączniki."""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    backend = Column(String, nullable=False)
+    data = deferred(Column(LargeBinary, nullable=True), raiseload=True)
+
+    ref_count = Column(Integer, nullable=False, default=0, index=True)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from app.db import Base
+
+
+class Conversation(Base):
+    """
+    Podsumowanie rozmowy z punktu widzenia użytkownika - aktualizowane w tej samej
+    transakcji co wysyłka, odczyt i usunięcie wiadomości.
+    """
+    __tablename__ = "conversations"
+    __table_args__ = (
+        # Lista rozmów od najnowszej, stronicowana kursorem po (last_message_at, correspondent_id)
+        Index("ix_conversations_user_last", "user_id", "last_message_at", "correspondent_id"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    correspondent_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    last_message_id = Column(Integer, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
@@ -1,31 +1,97 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.db import Base
+from app.db import Base, utcnow
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Indeksy pod stronicowanie kursorem po (created_at, id)
+        Index("ix_messages_inbox", "receiver_id", "deleted_by_receiver", "created_at", "id"),
+        Index("ix_messages_sent", "sender_id", "deleted_by_sender", "created_at", "id"),
+        # Indeksy pod synchronizację przyrostową (GET /messages/sync)
+        Index("ix_messages_receiver_seq", "receiver_id", "receiver_seq"),
+        Index("ix_messages_sender_seq", "sender_id", "sender_seq"),
+        # Wątek rozmowy dwóch użytkowników (GET /messages/conversations/{user_id})
+        Index("ix_messages_thread", "sender_id", "receiver_id", "created_at"),
+        # Filtr unread - is_read jako kolejna równość przed zakresem po (created_at, id)
+        Index("ix_messages_inbox_read", "receiver_id", "deleted_by_receiver", "is_read", "created_at", "id"),
+        Index("ix_messages_sent_read", "sender_id", "deleted_by_sender", "is_read", "created_at", "id"),
+        # Indeks częściowy - purger nie skanuje całej tabeli w poszukiwaniu usuniętych przez obie strony
+        Index(
+            "ix_messages_purge", "id",
+            sqlite_where=text("deleted_by_sender = 1 AND deleted_by_receiver = 1"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
-    encrypted_content = Column(Text, nullable=False)
+    # Wiadomość grupowa trzyma szyfrogram, klucz nadawcy i podpis we wspólnym MessageContent
+    content_id = Column(Integer, ForeignKey("message_contents.id"), nullable=True, index=True)
+    encrypted_content = Column(Text, nullable=True)
     
     encrypted_symmetric_key = Column(Text, nullable=False)
     encrypted_symmetric_key_sender = Column(Text, nullable=True)
     
-    signature = Column(Text, nullable=False)
+    signature = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, server_default=func.now())
+    # Ten sam format co wartości z Pythona - SQLite porównuje daty jako tekst, a kursor (created_at, id) tego wymaga
+    created_at = Column(DateTime, default=utcnow, server_default=text("(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"))
     is_read = Column(Boolean, default=False)
     read_at = Column(DateTime, nullable=True)
     
     deleted_by_sender = Column(Boolean, default=False)
     deleted_by_receiver = Column(Boolean, default=False)
 
+    # Flagi ze starszych resetów hasła; nowe resety zmieniają tylko User.key_epoch
     is_decryptable_sender = Column(Boolean, default=True)
     is_decryptable_receiver = Column(Boolean, default=True)
+
+    # User.key_epoch nadawcy i odbiorcy z chwili wysłania
+    sender_key_epoch = Column(Integer, nullable=False, default=0, server_default="0")
+    receiver_key_epoch = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Wartości User.mailbox_seq nadawcy i odbiorcy z chwili ostatniej zmiany wiadomości
+    sender_seq = Column(Integer, nullable=False, default=0, server_default="0")
+    receiver_seq = Column(Integer, nullable=False, default=0, server_default="0")
     
-    attachments = relationship("Attachment", back_populates="message", cascade="all, delete-orphan")
\ No newline at end of file
+    attachments = relationship("Attachment", back_populates="message", cascade="all, delete-orphan")
+    content = relationship("MessageContent", lazy="joined")
+
+    @property
+    def payload(self):
+        """Źródło szyfrogramu, klucza nadawcy i podpisu - wspólna treść albo sama wiadomość."""
+        return self.content if self.content_id is not None else self
+
+    def is_decryptable_for_sender(self, sender_key_epoch: int) -> bool:
+        return bool(self.is_decryptable_sender) and self.sender_key_epoch == sender_key_epoch
+
+    def is_decryptable_for_receiver(self, receiver_key_epoch: int) -> bool:
+        return bool(self.is_decryptable_receiver) and self.receiver_key_epoch == receiver_key_epoch
+
+
+class MessageContent(Base):
+    """Szyfrogram wiadomości grupowej zapisany raz dla wszystkich odbiorców."""
+    __tablename__ = "message_contents"
+
+    id = Column(Integer, primary_key=True)
+    encrypted_content = Column(Text, nullable=False)
+    encrypted_symmetric_key_sender = Column(Text, nullable=True)
+    signature = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=utcnow, server_default=func.now())
+
+
+class MessageTombstone(Base):
+    """Ślad usunięcia wiadomości przez użytkownika, zwracany przez synchronizację."""
+    __tablename__ = "message_tombstones"
+    __table_args__ = (
+        Index("ix_message_tombstones_user_seq", "user_id", "seq"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    message_id = Column(Integer, nullable=False)
+    seq = Column(Integer, nullable=False)
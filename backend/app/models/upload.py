@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db import Base
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    filename = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+
+    total_size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+
+    is_complete = Column(Boolean, default=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    chunks = relationship("UploadChunk", cascade="all, delete-orphan")
+
+    @property
+    def total_chunks(self) -> int:
+        return -(-self.total_size // self.chunk_size)
+
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+
+    session_id = Column(String, ForeignKey("upload_sessions.id"), primary_key=True)
+    index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
@@ -12,4 +12,10 @@ class User(Base):
     totp_secret_encrypted = Column(String, nullable=True)
     is_2fa_enabled = Column(Boolean, default=False)
     public_key = Column(Text, nullable=False)
-    encrypted_private_key = Column(Text, nullable=False)
\ No newline at end of file
+    encrypted_private_key = Column(Text, nullable=False)
+
+    # Licznik zmian skrzynki - każda zmiana widoczna dla użytkownika dostaje kolejny numer
+    mailbox_seq = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Numer pary kluczy - zwiększany przy resecie hasła, wiadomości z wcześniejszym numerem nie dają się odszyfrować
+    key_epoch = Column(Integer, nullable=False, default=0, server_default="0")
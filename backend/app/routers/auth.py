@@ -1,19 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Response
 import asyncio
 import random
 from app.schemas.auth import LoginRequest, RegisterRequest, PasswordResetRequest, PasswordResetConfirm
 from app.models.user import User
 from app.models.audit import HoneypotEvent
-from app.crud.users import get_user_by_email, create_user
+from app.crud.users import get_user_by_email, create_user, update_password_hash, get_encrypted_private_key, invalidate_user
 from app.crud.tokens import add_refresh_token, check_refresh_token, revoke_all_user_tokens, revoke_refresh_token
-from app.utils.password_hasher import verify_password, hash_password
-from app.crud.messages import get_inbox_messages, get_sent_messages
+from app.utils.password_hasher import verify_password_async, hash_password_async, get_dummy_hash, password_needs_rehash, HasherBusy
 from app.utils.rate_limiter import limiter
 from app.config import RateLimitConfig, SECRET_KEY, JWTConfig
-from app.db import AsyncSession, get_db
+from app.db import AsyncSession, get_db, get_session_factory
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from app.utils.totp_manager import verify_totp_code, decrypt_totp_secret
 from app.utils.tokens_manager import create_access_token, create_refresh_token, refresh_access_token
 from app.dependencies import get_current_user, get_redis
+from app.utils.user_cache import UserSnapshot
 from app.crud.audit import log_login_event
 import redis.asyncio as redis
 from app.utils.tokens_manager import verify_token
@@ -26,24 +27,38 @@ from datetime import datetime, timedelta, timezone
 router = APIRouter()
 
 
+async def _rehash_password(session_factory: async_sessionmaker, user_id: int, old_hash: str, password: str):
+    """
+    Przelicza hash z bieżącymi parametrami HashingConfig - po wysłaniu odpowiedzi logowania,
+    na własnej sesji, bo sesja żądania jest już wtedy zamknięta.
+    """
+    try:
+        new_hash = await hash_password_async(password)
+    except HasherBusy:
+        # Pula zajęta - hash zostanie podniesiony przy następnym logowaniu
+        return
+    async with session_factory() as db:
+        updated = await update_password_hash(db, user_id, old_hash, new_hash)
+    if updated:
+        logger.info(f"Zaktualizowano parametry hasha hasła użytkownika {user_id}")
+
+
 @router.post("/auth/login", tags=["auth"])
 @limiter.limit(RateLimitConfig.AUTH_LOGIN)
 async def login(
     request: Request,
     login_data: LoginRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
     redis_conn: redis.Redis = Depends(get_redis)
 ):
     user = await get_user_by_email(db, login_data.email)
     await asyncio.sleep(random.uniform(0.02, 0.1))
-    fake_hash = hash_password("fake_password")
-    if not user:
-        verify_password(login_data.password, fake_hash)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Nieprawidłowy email lub hasło"
-        )
-    if not verify_password(login_data.password, user.password_hash):
+    # Dokładnie jedna weryfikacja Argon2 niezależnie od istnienia konta
+    password_hash = user.password_hash if user else await get_dummy_hash()
+    password_valid = await verify_password_async(login_data.password, password_hash)
+    if not user or not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Nieprawidłowy email lub hasło"
@@ -62,6 +77,9 @@ async def login(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Nieprawidłowy kod TOTP"
             )
+
+    if password_needs_rehash(user.password_hash):
+        background_tasks.add_task(_rehash_password, session_factory, user.id, user.password_hash, login_data.password)
     
     # Generowanie tokenów
     refresh_token_id = str(uuid.uuid4())
@@ -133,7 +151,7 @@ async def register(request: Request, register_data: RegisterRequest, db: AsyncSe
         return {"message": "Użytkownik zarejestrowany pomyślnie"}
 
     try:
-        hashed_password = hash_password(register_data.password)
+        hashed_password = await hash_password_async(register_data.password)
         existing_user = await get_user_by_email(db, register_data.email)
         await asyncio.sleep(random.uniform(0.02, 0.1))
         if existing_user:
@@ -150,7 +168,7 @@ async def register(request: Request, register_data: RegisterRequest, db: AsyncSe
 
         await create_user(db, user)
         return {"message": "Użytkownik zarejestrowany pomyślnie"}
-    except HTTPException:
+    except (HTTPException, HasherBusy):
         raise
     except Exception as e:
         raise HTTPException(
@@ -288,7 +306,7 @@ async def logout_all(
 
 @router.get("/auth/me", tags=["auth"])
 @limiter.limit(RateLimitConfig.DEFAULT_LIMIT)
-async def get_me(request: Request, current_user: User = Depends(get_current_user)):
+async def get_me(request: Request, current_user: UserSnapshot = Depends(get_current_user)):
     return {
         "id": current_user.id,
         "username": current_user.username,
@@ -300,11 +318,12 @@ async def get_me(request: Request, current_user: User = Depends(get_current_user
 @limiter.limit(RateLimitConfig.AUTH_ATTEMPTS)
 async def unlock_private_key(
     request: Request,
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     
     return {
-        "encrypted_private_key": current_user.encrypted_private_key
+        "encrypted_private_key": await get_encrypted_private_key(db, current_user.id)
     }
 
 
@@ -356,28 +375,23 @@ async def reset_password(
             )
         
         user = await get_user_by_email(db, email)
-        sent_messages = await get_sent_messages(db, user.id) or []
-        inbox_messages = await get_inbox_messages(db, user.id) or []
-
-        # Po resecie hasła wiadomości nie są już odszyfrowywalne
-        for msg, _ in sent_messages:
-            msg.is_decryptable_sender = False
-        for msg, _ in inbox_messages:
-            msg.is_decryptable_receiver = False
 
         if not user or str(user.id) != user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Nieprawidłowy token resetowania"
             )
-        
-        user.password_hash = hash_password(reset_data.new_password)
+
+        # Po resecie hasła wcześniejsze wiadomości nie są już odszyfrowywalne - wystarczy nowy numer pary kluczy
+        user.key_epoch = User.key_epoch + 1
+        user.password_hash = await hash_password_async(reset_data.new_password)
         user.public_key = reset_data.public_key
         user.encrypted_private_key = reset_data.encrypted_private_key
 
         await revoke_all_user_tokens(redis_conn, int(user_id))
 
         await db.commit()
+        await invalidate_user(redis_conn, user.id)
         
         logger.info(f"Hasło poprawnie zresetowane dla użytkownika {user.email}")
         
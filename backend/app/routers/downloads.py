@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException, Path, Response
+
+from app.utils.blob_store import x_accel_headers
+from app.utils.signed_urls import verify_blob_signature
+
+router = APIRouter(prefix="/downloads", tags=["downloads"])
+
+
+@router.get("/{sha256}")
+async def download_blob(
+    expires: int,
+    signature: str,
+    sha256: str = Path(pattern="^[0-9a-f]{64}$"),
+):
+    """Podpisany link - sama weryfikacja HMAC, plik wysyła nginx bez udziału bazy"""
+    if not verify_blob_signature(sha256, expires, signature):
+        raise HTTPException(status_code=403, detail="Link wygasł lub jest nieprawidłowy")
+
+    return Response(headers=x_accel_headers(sha256), media_type="application/octet-stream")
@@ -1,25 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, RedirectResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from typing import List
+import asyncio
 import base64
+import json
+import time
+import redis.asyncio as redis
+from urllib.parse import quote
+from collections import Counter
+from datetime import datetime, timezone
 
-from app.db import get_db
-from app.dependencies import get_current_user
+from app.db import get_db, get_session_factory
+from app.dependencies import get_current_user, get_redis, verify_access_token, get_access_token_claims, is_session_active
 from app.models.user import User
-from app.models.attachment import Attachment
-from app.schemas.message import MessageResponse, SendMessageRequest
-from app.crud.messages import create_message, get_inbox_messages, get_sent_messages, get_message_by_id, mark_message_read, delete_message
-from sqlalchemy import select
+from app.schemas.message import MessageResponse, SendMessageRequest, SyncResponse, MailboxCountsResponse, MarkReadRequest, DeleteMessagesRequest, GroupSendRequest, BatchSendRequest, ConversationResponse, MessageFilters, MailboxImportResponse
+from app.crud.messages import create_messages, create_group_message, get_inbox_messages, get_sent_messages, get_message_by_id, mark_message_read, mark_messages_read, delete_messages, get_attachment_with_access, iter_attachment_data, get_mailbox_seq, get_mailbox_changes, get_thread_messages, stream_inbox_messages, stream_sent_messages
+from app.schemas import message_json
+from app.crud.uploads import get_completed_uploads
+from app.crud.counters import adjust_counts, get_counts, reset_counts
+from app.crud.conversations import get_conversations
+from app.crud.mailbox_export import iter_mailbox_export, import_mailbox, MailboxImportError, MailboxImportTooLarge
+from app.crud.idempotency import begin_request, complete_request, abort_request, request_fingerprint, IdempotencyKeyReused, IdempotencyRequestInProgress
+from app.config import PaginationConfig, AttachmentConfig, EventsConfig, BulkConfig, IdempotencyConfig
+from app.utils.http_range import parse_range_header, RangeNotSatisfiable
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.blob_store import FilesystemBlobStore, x_accel_headers
+from app.utils.signed_urls import sign_blob
+from app.utils.event_bus import event_bus, publish_event
+from app.utils.user_cache import UserSnapshot
+from app.utils.group_commit import GroupCommitQueue
+from sqlalchemy import select, func
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
-@router.post("/send", response_model=dict)
-async def send_message(
-    message_in: SendMessageRequest,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
-    if message_in.receiver_id == current_user.id:
+send_queue = GroupCommitQueue(
+    create_messages,
+    window_seconds=BulkConfig.GROUP_COMMIT_WINDOW_SECONDS,
+    max_items=BulkConfig.GROUP_COMMIT_MAX_ITEMS,
+)
+
+
+def _parse_cursor(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy kursor")
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # Daty w bazie są w UTC bez strefy - czas z inną strefą trzeba najpierw przeliczyć
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def _message_filters(
+    correspondent_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    unread: bool | None = None,
+    has_attachments: bool | None = None,
+    mime_type: str | None = Query(None, max_length=255, description="Dokładny typ albo prefiks, np. image/*"),
+    min_attachment_size: int | None = Query(None, ge=0),
+    max_attachment_size: int | None = Query(None, ge=0),
+) -> MessageFilters:
+    return MessageFilters(
+        correspondent_id=correspondent_id,
+        since=_as_utc(since),
+        until=_as_utc(until),
+        unread=unread,
+        has_attachments=has_attachments,
+        mime_type=mime_type,
+        min_attachment_size=min_attachment_size,
+        max_attachment_size=max_attachment_size,
+    )
+
+
+async def _stream_message_array(partitions, to_response):
+    """
+    Tablica JSON pisana przyrostowo - każda paczka wierszy z bazy jest kodowana
+    jednym wywołaniem orjson i od razu wysyłana.
+    """
+    yield b"["
+    first = True
+    async for rows in partitions:
+        if not rows:
+            continue
+        body = message_json.dumps([to_response(*row) for row in rows])
+        yield (b"" if first else b",") + body[1:-1]
+        first = False
+    yield b"]"
+
+
+def _set_next_cursor(response: Response, rows, limit: int):
+    """Kursor następnej strony trafia do nagłówka, treść pozostaje listą."""
+    if len(rows) == limit:
+        last_message = rows[-1][0]
+        response.headers["X-Next-Cursor"] = encode_cursor(last_message.created_at, last_message.id)
+
+
+async def _notify(redis_conn: redis.Redis, event_type: str, message_id: int, *user_ids: int):
+    for user_id in user_ids:
+        await publish_event(redis_conn, user_id, {"type": event_type, "message_id": message_id})
+
+
+async def _after_send(redis_conn: redis.Redis, messages):
+    for sender_id, count in Counter(message.sender_id for message in messages).items():
+        await adjust_counts(redis_conn, sender_id, sent=count)
+    for message in messages:
+        await adjust_counts(redis_conn, message.receiver_id, inbox=1, unread=1)
+        await _notify(redis_conn, "message_created", message.id, message.sender_id, message.receiver_id)
+
+
+async def _get_uploads(db: AsyncSession, upload_ids: list[str] | None, user_id: int):
+    if not upload_ids:
+        return []
+    unique_ids = set(upload_ids)
+    uploads = await get_completed_uploads(db, list(unique_ids), user_id)
+    if len(uploads) != len(unique_ids):
+        raise HTTPException(status_code=400, detail="Nieprawidłowe lub niezakończone przesyłanie załącznika")
+    return uploads
+
+
+async def _prepare_send(db: AsyncSession, message_in: SendMessageRequest, sender_id: int):
+    """Walidacja odbiorcy i przesłanych załączników - przed jakimkolwiek zapisem."""
+    if message_in.receiver_id == sender_id:
         raise HTTPException(status_code=400, detail="Nie można wysłać wiadomości do samego siebie.")
 
     query = select(User).where(User.id == message_in.receiver_id)
@@ -29,88 +137,361 @@ async def send_message(
     if not receiver:
         raise HTTPException(status_code=404, detail="Odbiorca nie znaleziony")
 
-    message = await create_message(db, message_in, current_user.id)
+    return await _get_uploads(db, message_in.upload_ids, sender_id)
+
+
+async def _deliver(
+    session_factory: async_sessionmaker,
+    redis_conn: redis.Redis,
+    message_in: SendMessageRequest,
+    sender_id: int,
+    uploads,
+) -> dict:
+    message = await send_queue.submit(session_factory, (message_in, sender_id, uploads))
+    await _after_send(redis_conn, [message])
     return {"message_id": message.id}
 
+
+@router.post("/send", response_model=dict)
+async def send_message(
+    message_in: SendMessageRequest,
+    user_id: str = Depends(verify_access_token),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=IdempotencyConfig.HEADER_MAX_LENGTH),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Powtórzenie z tym samym Idempotency-Key zwraca pierwszą odpowiedź bez ponownego zapisu"""
+    sender_id = int(user_id)
+    if idempotency_key is None:
+        uploads = await _prepare_send(db, message_in, sender_id)
+        return await _deliver(session_factory, redis_conn, message_in, sender_id, uploads)
+
+    fingerprint = request_fingerprint(message_in.model_dump_json())
+    try:
+        cached_response = await begin_request(redis_conn, sender_id, idempotency_key, fingerprint)
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Klucz Idempotency-Key użyty z inną treścią żądania")
+    except IdempotencyRequestInProgress:
+        raise HTTPException(status_code=409, detail="Żądanie z tym kluczem Idempotency-Key jest nadal przetwarzane")
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        uploads = await _prepare_send(db, message_in, sender_id)
+    except BaseException:
+        await abort_request(redis_conn, sender_id, idempotency_key)
+        raise
+
+    async def deliver_and_record() -> dict:
+        try:
+            response = await _deliver(session_factory, redis_conn, message_in, sender_id, uploads)
+        except BaseException:
+            await abort_request(redis_conn, sender_id, idempotency_key)
+            raise
+        await complete_request(redis_conn, sender_id, idempotency_key, fingerprint, response)
+        return response
+
+    # Rozłączenie klienta nie przerywa zapisu - odpowiedź i tak trafia pod klucz,
+    # więc ponowienie dostaje wynik zamiast drugiej wysyłki
+    return await asyncio.shield(deliver_and_record())
+
+
+@router.post("/send-batch", response_model=dict)
+async def send_message_batch(
+    batch_in: BatchSendRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Wiele wiadomości w jednej transakcji - identyfikatory w kolejności żądania"""
+    receiver_ids = {message_in.receiver_id for message_in in batch_in.messages}
+    if current_user.id in receiver_ids:
+        raise HTTPException(status_code=400, detail="Nie można wysłać wiadomości do samego siebie.")
+
+    result = await db.execute(select(func.count()).select_from(User).where(User.id.in_(receiver_ids)))
+    if result.scalar_one() != len(receiver_ids):
+        raise HTTPException(status_code=404, detail="Odbiorca nie znaleziony")
+
+    upload_ids = [upload_id for message_in in batch_in.messages for upload_id in set(message_in.upload_ids or [])]
+    if len(set(upload_ids)) != len(upload_ids):
+        raise HTTPException(status_code=400, detail="Nieprawidłowe lub niezakończone przesyłanie załącznika")
+    uploads = {upload.id: upload for upload in await _get_uploads(db, upload_ids, current_user.id)}
+
+    messages = await create_messages(db, [
+        (message_in, current_user.id, [uploads[upload_id] for upload_id in set(message_in.upload_ids or [])])
+        for message_in in batch_in.messages
+    ])
+    await _after_send(redis_conn, messages)
+    return {"message_ids": [message.id for message in messages]}
+
+
+@router.post("/send-group", response_model=dict)
+async def send_group_message(
+    group_in: GroupSendRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Jedna treść do wielu odbiorców - każdy dostaje własną kopertę z kluczem"""
+    receiver_ids = [recipient.receiver_id for recipient in group_in.recipients]
+    if current_user.id in receiver_ids:
+        raise HTTPException(status_code=400, detail="Nie można wysłać wiadomości do samego siebie.")
+
+    result = await db.execute(select(func.count()).select_from(User).where(User.id.in_(receiver_ids)))
+    if result.scalar_one() != len(receiver_ids):
+        raise HTTPException(status_code=404, detail="Odbiorca nie znaleziony")
+
+    uploads = await _get_uploads(db, group_in.upload_ids, current_user.id)
+    envelopes = await create_group_message(db, group_in, current_user.id, uploads=uploads)
+    await _after_send(redis_conn, envelopes)
+    return {"message_ids": [envelope.id for envelope in envelopes]}
+
 @router.get("/inbox", response_model=List[MessageResponse])
 async def get_inbox(
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(PaginationConfig.DEFAULT_PAGE_SIZE, ge=1, le=PaginationConfig.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    filters: MessageFilters = Depends(_message_filters),
+    stream: bool = Query(False, description="Cała lista od kursora jako strumień JSON, limit jest pomijany"),
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
 ):
-    rows = await get_inbox_messages(db, current_user.id)
-    
-    response = []
-    for message, sender_username in rows:
-        attachment_responses = []
-        if message.attachments:
-            for att in message.attachments:
-                attachment_responses.append({
-                    "id": att.id,
-                    "filename": att.filename,
-                    "mime_type": att.mime_type,
-                    "size": att.size
-                })
-        
-        response.append(MessageResponse(
-            id=message.id,
-            sender_id=message.sender_id,
-            sender_username=sender_username,
-            encrypted_content=message.encrypted_content,
-            encrypted_symmetric_key=message.encrypted_symmetric_key,
-            encrypted_symmetric_key_sender=message.encrypted_symmetric_key_sender,
-            signature=message.signature,
-            created_at=message.created_at,
-            is_read=message.is_read,
-            is_decryptable_receiver=message.is_decryptable_receiver,
-            is_decryptable_sender=message.is_decryptable_sender,
-            attachments=attachment_responses
-        ))
+    def to_response(message, sender_username, sender_key_epoch):
+        return message_json.inbox_message(message, sender_username, sender_key_epoch, current_user.key_epoch)
 
+    if stream:
+        partitions = stream_inbox_messages(session_factory, current_user.id, cursor=_parse_cursor(cursor), filters=filters)
+        return StreamingResponse(_stream_message_array(partitions, to_response), media_type="application/json")
+
+    rows = await get_inbox_messages(db, current_user.id, limit=limit, cursor=_parse_cursor(cursor), filters=filters)
+    response = ORJSONResponse([to_response(*row) for row in rows])
+    _set_next_cursor(response, rows, limit)
     return response
 
 @router.get("/sent", response_model=List[MessageResponse])
 async def get_sent(
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(PaginationConfig.DEFAULT_PAGE_SIZE, ge=1, le=PaginationConfig.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    filters: MessageFilters = Depends(_message_filters),
+    stream: bool = Query(False, description="Cała lista od kursora jako strumień JSON, limit jest pomijany"),
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    def to_response(message, receiver_username, receiver_key_epoch):
+        return message_json.sent_message(message, current_user.username, receiver_username, current_user.key_epoch, receiver_key_epoch)
+
+    if stream:
+        partitions = stream_sent_messages(session_factory, current_user.id, cursor=_parse_cursor(cursor), filters=filters)
+        return StreamingResponse(_stream_message_array(partitions, to_response), media_type="application/json")
+
+    rows = await get_sent_messages(db, current_user.id, limit=limit, cursor=_parse_cursor(cursor), filters=filters)
+    response = ORJSONResponse([to_response(*row) for row in rows])
+    _set_next_cursor(response, rows, limit)
+    return response
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_mailbox(
+    since: int = Query(0, ge=0),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    rows = await get_sent_messages(db, current_user.id)
-    
-    response = []
-    for message, receiver_username in rows:
-        attachment_responses = []
-        if message.attachments:
-            for att in message.attachments:
-                attachment_responses.append({
-                    "id": att.id,
-                    "filename": att.filename,
-                    "mime_type": att.mime_type,
-                    "size": att.size
-                })
-        
-        response.append(MessageResponse(
-            id=message.id,
-            sender_id=message.sender_id,
-            sender_username=current_user.username,
-            recipient_id=message.receiver_id,
-            recipient_username=receiver_username,
-            encrypted_content=message.encrypted_content,
-            encrypted_symmetric_key=message.encrypted_symmetric_key,
-            encrypted_symmetric_key_sender=message.encrypted_symmetric_key_sender,
-            signature=message.signature,
-            created_at=message.created_at,
-            is_decryptable_receiver=message.is_decryptable_receiver,
-            is_decryptable_sender=message.is_decryptable_sender,
-            is_read=message.is_read,
-            attachments=attachment_responses
-        ))
+    """Zwraca tylko wiadomości zmienione od kursora since oraz id usuniętych"""
+    # Kursor odczytany przed zmianami - późniejsze zmiany co najwyżej przyjdą ponownie
+    cursor = await get_mailbox_seq(db, current_user.id)
+    inbox, sent, deleted = await get_mailbox_changes(db, current_user.id, since)
+    return ORJSONResponse({
+        "cursor": cursor,
+        "key_epoch": current_user.key_epoch,
+        "inbox": [
+            message_json.inbox_message(message, sender_username, sender_key_epoch, current_user.key_epoch)
+            for message, sender_username, sender_key_epoch in inbox
+        ],
+        "sent": [
+            message_json.sent_message(message, current_user.username, receiver_username, current_user.key_epoch, receiver_key_epoch)
+            for message, receiver_username, receiver_key_epoch in sent
+        ],
+        "deleted": deleted,
+    })
+
+@router.get("/conversations", response_model=List[ConversationResponse])
+async def list_conversations(
+    http_response: Response,
+    limit: int = Query(PaginationConfig.DEFAULT_PAGE_SIZE, ge=1, le=PaginationConfig.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Lista rozmów od najnowszej - odczyt gotowych podsumowań zamiast grupowania skrzynki"""
+    rows = await get_conversations(db, current_user.id, limit=limit, cursor=_parse_cursor(cursor))
+    if len(rows) == limit:
+        last = rows[-1][0]
+        http_response.headers["X-Next-Cursor"] = encode_cursor(last.last_message_at, last.correspondent_id)
+
+    return [
+        ConversationResponse(
+            correspondent_id=conversation.correspondent_id,
+            correspondent_username=correspondent_username,
+            last_message_id=conversation.last_message_id,
+            last_message_at=conversation.last_message_at,
+            unread_count=conversation.unread_count,
+            message_count=conversation.message_count,
+        )
+        for conversation, correspondent_username in rows
+    ]
+
 
+@router.get("/conversations/{user_id}", response_model=List[MessageResponse])
+async def get_conversation_thread(
+    user_id: int,
+    limit: int = Query(PaginationConfig.DEFAULT_PAGE_SIZE, ge=1, le=PaginationConfig.MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Wiadomości rozmowy z danym użytkownikiem w obie strony, od najnowszej"""
+    correspondent = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    if not correspondent:
+        raise HTTPException(status_code=404, detail="Użytkownik nie znaleziony")
+
+    messages = await get_thread_messages(db, current_user.id, user_id, limit=limit, cursor=_parse_cursor(cursor))
+    response = ORJSONResponse([
+        message_json.sent_message(message, current_user.username, correspondent.username, current_user.key_epoch, correspondent.key_epoch)
+        if message.sender_id == current_user.id else
+        message_json.inbox_message(message, correspondent.username, correspondent.key_epoch, current_user.key_epoch)
+        for message in messages
+    ])
+    if len(messages) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1].created_at, messages[-1].id)
     return response
 
+
+@router.get("/counts", response_model=MailboxCountsResponse)
+async def mailbox_counts(
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Liczniki do plakietki - bez pobierania całej skrzynki"""
+    return await get_counts(redis_conn, db, current_user.id)
+
+
+@router.get("/events")
+async def mailbox_events(
+    request: Request,
+    current_user: UserSnapshot = Depends(get_current_user),
+    claims: dict = Depends(get_access_token_claims),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """
+    Server-Sent Events ze zmianami skrzynki - zastępuje odpytywanie /inbox.
+    Strumień kończy się po wylogowaniu albo wygaśnięciu tokenu dostępu - klient łączy się ponownie z nowym.
+    """
+    user_id = current_user.id
+    event_bus.ensure_started(redis_conn)
+    queue = event_bus.subscribe(user_id)
+
+    async def stream_events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                # Sesję sprawdza też cache tokenów, więc przy aktywnej subskrypcji zwykle bez Redisa
+                if time.time() >= claims["exp"] or not await is_session_active(redis_conn, claims["refresh_token_id"]):
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EventsConfig.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_bus.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/export")
+async def export_mailbox(
+    current_user: UserSnapshot = Depends(get_current_user),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """Eksport całej skrzynki z załącznikami jako strumień NDJSON (przeniesienie na inne urządzenie)"""
+    return StreamingResponse(
+        iter_mailbox_export(session_factory, current_user.id, current_user.username, current_user.key_epoch),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="mailbox.ndjson"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.post("/import", response_model=MailboxImportResponse)
+async def import_mailbox_file(
+    request: Request,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Import pliku z /messages/export - treść żądania jest czytana strumieniowo"""
+    try:
+        imported, skipped = await import_mailbox(db, current_user.id, request.stream())
+    except MailboxImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MailboxImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Paczki zapisane przed ewentualnym błędem też zmieniają liczniki
+        await reset_counts(redis_conn, current_user.id)
+
+    return MailboxImportResponse(imported=imported, skipped=skipped)
+
+
+@router.post("/read")
+async def mark_many_as_read(
+    request_in: MarkReadRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Oznacza jako przeczytane wiadomości o podanych id albo wszystko do kursora/chwili"""
+    up_to = _as_utc(request_in.up_to)
+
+    rows = await mark_messages_read(
+        db,
+        current_user.id,
+        message_ids=request_in.message_ids,
+        up_to_seq=request_in.up_to_cursor,
+        up_to=up_to,
+    )
+
+    if rows:
+        await adjust_counts(redis_conn, current_user.id, unread=-len(rows))
+        await publish_event(redis_conn, current_user.id, {
+            "type": "messages_read",
+            "message_ids": [message_id for message_id, _ in rows],
+        })
+        for sender_id in {sender_id for _, sender_id in rows}:
+            await publish_event(redis_conn, sender_id, {
+                "type": "messages_read",
+                "message_ids": [message_id for message_id, owner_id in rows if owner_id == sender_id],
+            })
+    return {"status": "success", "updated": len(rows)}
+
+
 @router.post("/{message_id}/read")
 async def mark_as_read(
     message_id: int,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
 ):
     message = await get_message_by_id(db, message_id)
     if not message:
@@ -119,49 +500,95 @@ async def mark_as_read(
     if message.receiver_id != current_user.id:
         raise HTTPException(status_code=403, detail="Brak uprawnień")
         
-    await mark_message_read(db, message_id)
+    if await mark_message_read(db, message_id):
+        await adjust_counts(redis_conn, message.receiver_id, unread=-1)
+        await _notify(redis_conn, "message_read", message_id, message.sender_id, message.receiver_id)
     return {"status": "success"}
 
 
+async def _after_delete(redis_conn: redis.Redis, user_id: int, sent_ids: list[int], inbox_ids: list[int], unread: int):
+    await adjust_counts(redis_conn, user_id, sent=-len(sent_ids), inbox=-len(inbox_ids), unread=-unread)
+
+
+@router.post("/delete")
+async def delete_many_messages(
+    request_in: DeleteMessagesRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Usuwa wiele wiadomości po stronie użytkownika; id cudzych wiadomości są pomijane"""
+    sent_ids, inbox_ids, unread = await delete_messages(db, current_user.id, message_ids=request_in.message_ids)
+    if sent_ids or inbox_ids:
+        await _after_delete(redis_conn, current_user.id, sent_ids, inbox_ids, unread)
+        await publish_event(redis_conn, current_user.id, {"type": "messages_deleted", "message_ids": sent_ids + inbox_ids})
+    return {"status": "success", "deleted": len(sent_ids) + len(inbox_ids)}
+
+
+@router.delete("/conversations/{user_id}")
+async def clear_conversation(
+    user_id: int,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
+    """Usuwa całą rozmowę z danym użytkownikiem po stronie zalogowanego użytkownika"""
+    sent_ids, inbox_ids, unread = await delete_messages(db, current_user.id, correspondent_id=user_id)
+    if sent_ids or inbox_ids:
+        await _after_delete(redis_conn, current_user.id, sent_ids, inbox_ids, unread)
+        await publish_event(redis_conn, current_user.id, {"type": "messages_deleted", "message_ids": sent_ids + inbox_ids})
+    return {"status": "success", "deleted": len(sent_ids) + len(inbox_ids)}
+
+
 @router.delete("/{message_id}")
 async def delete_message_endpoint(
     message_id: int,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
 ):
-    message = await get_message_by_id(db, message_id)
-    if not message:
-        raise HTTPException(status_code=404, detail="Wiadomość nie znaleziona")
-    
-    if message.sender_id != current_user.id and message.receiver_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Brak uprawnień")
-    
-    await delete_message(db, message_id, current_user.id)
+    sent_ids, inbox_ids, unread = await delete_messages(db, current_user.id, message_ids=[message_id])
+    if not sent_ids and not inbox_ids:
+        # Nic nie zmieniono - wiadomość nie istnieje, jest cudza albo już usunięta
+        message = await get_message_by_id(db, message_id)
+        if not message:
+            raise HTTPException(status_code=404, detail="Wiadomość nie znaleziona")
+        if message.sender_id != current_user.id and message.receiver_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Brak uprawnień")
+        return {"status": "success", "message": "Wiadomość usunięta"}
+
+    await _after_delete(redis_conn, current_user.id, sent_ids, inbox_ids, unread)
+    await _notify(redis_conn, "message_deleted", message_id, current_user.id)
     return {"status": "success", "message": "Wiadomość usunięta"}
 
 
+async def _get_accessible_attachment(db: AsyncSession, attachment_id: int, user_id: int):
+    row = await get_attachment_with_access(db, attachment_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Załącznik nie znaleziony")
+
+    attachment, sender_id, receiver_id, data_size, blob_backend = row
+    if sender_id != user_id and receiver_id != user_id:
+        raise HTTPException(status_code=403, detail="Brak uprawnień")
+    # Brak wiersza bloba (np. nieudana migracja) - treści nie ma skąd odczytać
+    if data_size is None:
+        raise HTTPException(status_code=404, detail="Treść załącznika nie znaleziona")
+
+    return attachment, data_size, blob_backend
+
+
 @router.get("/attachments/{attachment_id}")
 async def get_attachment(
     attachment_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Pobiera zaszyfrowaną zawartość załącznika"""
-    query = select(Attachment).where(Attachment.id == attachment_id)
-    result = await db.execute(query)
-    attachment = result.scalar_one_or_none()
+    attachment, data_size, blob_backend = await _get_accessible_attachment(db, attachment_id, current_user.id)
     
-    if not attachment:
-        raise HTTPException(status_code=404, detail="Załącznik nie znaleziony")
-    
-    message = await get_message_by_id(db, attachment.message_id)
-    if not message:
-        raise HTTPException(status_code=404, detail="Wiadomość nie znaleziona")
-    
-    if message.sender_id != current_user.id and message.receiver_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Brak uprawnień")
-    
-    encrypted_base64 = base64.b64encode(attachment.encrypted_data).decode('utf-8')
+    chunks = iter_attachment_data(db, attachment, blob_backend, 0, data_size - 1, AttachmentConfig.STREAM_CHUNK_SIZE)
+    encrypted_data = b"".join([chunk async for chunk in chunks])
+    encrypted_base64 = base64.b64encode(encrypted_data).decode('utf-8')
     
     return {
         "id": attachment.id,
@@ -170,3 +597,73 @@ async def get_attachment(
         "size": attachment.size,
         "encrypted_data": encrypted_base64
     }
+
+
+@router.get("/attachments/{attachment_id}/content")
+async def get_attachment_content(
+    attachment_id: int,
+    request: Request,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """Strumieniuje zaszyfrowany załącznik jako dane binarne z obsługą Range/If-Range"""
+    attachment, data_size, blob_backend = await _get_accessible_attachment(db, attachment_id, current_user.id)
+    
+    content_disposition = f"attachment; filename*=UTF-8''{quote(attachment.filename)}"
+
+    # Pliki z magazynu na dysku może wysłać nginx - worker tylko sprawdza uprawnienia
+    if attachment.blob_sha256 and blob_backend == FilesystemBlobStore.name:
+        if AttachmentConfig.DELIVERY_MODE == "x-accel":
+            return Response(
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": content_disposition, **x_accel_headers(attachment.blob_sha256)},
+            )
+        if AttachmentConfig.DELIVERY_MODE == "signed-url":
+            expires, signature = sign_blob(attachment.blob_sha256, AttachmentConfig.SIGNED_URL_TTL_SECONDS)
+            return RedirectResponse(
+                f"{AttachmentConfig.PUBLIC_API_PREFIX}/downloads/{attachment.blob_sha256}"
+                f"?expires={expires}&signature={signature}",
+                status_code=307,
+                headers={"Cache-Control": "no-store"},
+            )
+
+    etag = f'"{attachment.id}-{data_size}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": content_disposition,
+    }
+
+    start, end = 0, data_size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and data_size > 0 and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range_header(range_header, data_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{data_size}", **headers},
+            )
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{data_size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+
+    async def content():
+        # Sesja żądania jest już zamknięta, gdy StreamingResponse czyta kolejne fragmenty
+        async with session_factory() as session:
+            chunks = iter_attachment_data(session, attachment, blob_backend, start, end, AttachmentConfig.STREAM_CHUNK_SIZE)
+            async for chunk in chunks:
+                yield chunk
+
+    return StreamingResponse(
+        content(),
+        status_code=status_code,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.password_hasher import hasher_pool
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metryki workera w formacie Prometheusa - nginx nie wystawia tej ścieżki na zewnątrz"""
+    return (
+        "# HELP password_hash_queue_depth Password hashing jobs running or waiting in this worker.\n"
+        "# TYPE password_hash_queue_depth gauge\n"
+        f"password_hash_queue_depth {hasher_pool.depth}\n"
+        "# HELP password_hash_queue_capacity Maximum password hashing jobs before requests get 503.\n"
+        "# TYPE password_hash_queue_capacity gauge\n"
+        f"password_hash_queue_capacity {hasher_pool.capacity}\n"
+        "# HELP password_hash_rejected_total Requests rejected because the hashing queue was full.\n"
+        "# TYPE password_hash_rejected_total counter\n"
+        f"password_hash_rejected_total {hasher_pool.rejected}\n"
+    )
@@ -5,13 +5,21 @@ from app.utils.totp_manager import generate_totp_secret, generate_qr_code, decry
 from app.utils.rate_limiter import limiter
 from app.config import RateLimitConfig
 from app.db import AsyncSession, get_db
-from app.dependencies import get_current_user
+from app.dependencies import get_current_user, get_current_user_record, get_redis
+from app.crud.users import set_totp_secret, enable_totp_for_user, disable_totp_for_user
+from app.utils.user_cache import UserSnapshot
+import redis.asyncio as redis
 
 router = APIRouter(prefix="/totp", tags=["totp"])
 
 @router.post("/initialize")
 @limiter.limit(RateLimitConfig.AUTH_REFRESH)
-async def enable_totp(request: Request, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def enable_totp(
+    request: Request,
+    user: User = Depends(get_current_user_record),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
     if user.is_2fa_enabled:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -24,15 +32,19 @@ async def enable_totp(request: Request, user: User = Depends(get_current_user),
     else:
         totp_secret = generate_totp_secret()
         totp_secret_encrypted = encrypt_totp_secret(totp_secret)
-        user.totp_secret_encrypted = totp_secret_encrypted
-        await db.commit()
-        await db.refresh(user)
+        await set_totp_secret(db, redis_conn, user, totp_secret_encrypted)
     qr_code = generate_qr_code(username=user.username, secret=totp_secret)
     return {"message": "TOTP secret generated", "qr_code": qr_code, "secret": totp_secret}
 
 @router.post("/enable")
 @limiter.limit(RateLimitConfig.AUTH_REFRESH)
-async def verify_totp(request: Request, totp_request: TOTPVerifyRequest, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def verify_totp(
+    request: Request,
+    totp_request: TOTPVerifyRequest,
+    user: User = Depends(get_current_user_record),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
     if user.is_2fa_enabled:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -50,22 +62,26 @@ async def verify_totp(request: Request, totp_request: TOTPVerifyRequest, user: U
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid TOTP code"
         )
-    user.is_2fa_enabled = True
-    await db.commit()
-    await db.refresh(user)
+    await enable_totp_for_user(db, redis_conn, user)
     return {"message": "2FA enabled successfully"}
 
 @router.get("/status")
 @limiter.limit(RateLimitConfig.AUTH_REFRESH)
-async def get_totp_status(request: Request, user: User = Depends(get_current_user)):
+async def get_totp_status(request: Request, user: UserSnapshot = Depends(get_current_user)):
     return {
         "is_2fa_enabled": user.is_2fa_enabled,
-        "has_secret": bool(user.totp_secret_encrypted)
+        "has_secret": user.has_totp_secret
     }
 
 @router.post("/disable")
 @limiter.limit(RateLimitConfig.AUTH_REFRESH)
-async def disable_totp(request: Request, totp_request: TOTPVerifyRequest, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def disable_totp(
+    request: Request,
+    totp_request: TOTPVerifyRequest,
+    user: User = Depends(get_current_user_record),
+    db: AsyncSession = Depends(get_db),
+    redis_conn: redis.Redis = Depends(get_redis)
+):
     if not user.is_2fa_enabled:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -83,8 +99,5 @@ async def disable_totp(request: Request, totp_request: TOTPVerifyRequest, user:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid TOTP code"
         )
-    user.is_2fa_enabled = False
-    user.totp_secret_encrypted = None
-    await db.commit()
-    await db.refresh(user)
+    await disable_totp_for_user(db, redis_conn, user)
     return {"message": "2FA disabled successfully"}
@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_db
+from app.dependencies import get_current_user
+from app.models.upload import UploadSession
+from app.schemas.upload import CreateUploadRequest, UploadSessionResponse
+from app.crud.uploads import (
+    create_upload_session,
+    get_upload_session,
+    record_chunk,
+    mark_upload_complete,
+    delete_expired_upload_sessions,
+)
+from app.utils.upload_storage import write_part, part_sha256
+from app.utils.user_cache import UserSnapshot
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+def _session_response(session: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_id=session.id,
+        chunk_size=session.chunk_size,
+        total_chunks=session.total_chunks,
+        received_chunks=sorted(chunk.index for chunk in session.chunks),
+        is_complete=session.is_complete,
+    )
+
+
+async def _get_session_or_404(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession:
+    session = await get_upload_session(db, upload_id, user_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Sesja przesyłania nie znaleziona")
+    return session
+
+
+@router.post("", response_model=UploadSessionResponse)
+async def create_upload(
+    upload_in: CreateUploadRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    await delete_expired_upload_sessions(db, current_user.id)
+    session = await create_upload_session(db, upload_in, current_user.id)
+    return _session_response(session)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload(
+    upload_id: str,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stan sesji - klient wznawia przesyłanie od brakujących fragmentów"""
+    session = await _get_session_or_404(db, upload_id, current_user.id)
+    return _session_response(session)
+
+
+@router.put("/{upload_id}/chunks/{index}")
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await _get_session_or_404(db, upload_id, current_user.id)
+    if session.is_complete:
+        raise HTTPException(status_code=409, detail="Przesyłanie zostało już zakończone")
+    if index < 0 or index >= session.total_chunks:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy numer fragmentu")
+
+    offset = index * session.chunk_size
+    expected_size = min(session.chunk_size, session.total_size - offset)
+
+    received = 0
+    async for data in request.stream():
+        if not data:
+            continue
+        if received + len(data) > expected_size:
+            raise HTTPException(status_code=400, detail="Fragment jest zbyt duży")
+        await write_part(session.id, offset + received, data)
+        received += len(data)
+
+    if received != expected_size:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy rozmiar fragmentu")
+
+    await record_chunk(db, session.id, index, received)
+    return {"status": "success", "index": index}
+
+
+@router.post("/{upload_id}/complete", response_model=UploadSessionResponse)
+async def complete_upload(
+    upload_id: str,
+    current_user: UserSnapshot = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await _get_session_or_404(db, upload_id, current_user.id)
+    if session.is_complete:
+        return _session_response(session)
+
+    received = {chunk.index for chunk in session.chunks}
+    missing = [i for i in range(session.total_chunks) if i not in received]
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Brakuje fragmentów", "missing_chunks": missing}
+        )
+
+    if sum(chunk.size for chunk in session.chunks) != session.total_size:
+        raise HTTPException(status_code=400, detail="Nieprawidłowy rozmiar pliku")
+
+    if await part_sha256(session.id) != session.sha256:
+        raise HTTPException(status_code=400, detail="Suma kontrolna SHA-256 się nie zgadza")
+
+    await mark_upload_complete(db, session)
+    return _session_response(session)
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
+from typing import Literal
+from app.config import BulkConfig, UploadConfig
 
 class SendMessageRequest(BaseModel):
     receiver_id: int
@@ -8,6 +10,30 @@ class SendMessageRequest(BaseModel):
     encrypted_symmetric_key_sender: str | None = None
     signature: str
     attachments: list["AttachmentData"] | None = None
+    upload_ids: list[str] | None = Field(None, description="Identyfikatory zakończonych sesji /uploads")
+
+class BatchSendRequest(BaseModel):
+    messages: list[SendMessageRequest] = Field(min_length=1, max_length=BulkConfig.MAX_BATCH_MESSAGES)
+
+class GroupRecipient(BaseModel):
+    receiver_id: int
+    encrypted_symmetric_key: str
+
+class GroupSendRequest(BaseModel):
+    recipients: list[GroupRecipient] = Field(min_length=1, max_length=BulkConfig.MAX_GROUP_RECIPIENTS)
+    encrypted_content: str
+    encrypted_symmetric_key_sender: str | None = None
+    signature: str
+    attachments: list["AttachmentData"] | None = None
+    upload_ids: list[str] | None = Field(None, description="Identyfikatory zakończonych sesji /uploads")
+
+    @model_validator(mode="after")
+    def validate_unique_recipients(self):
+        """Each recipient at most once"""
+        receiver_ids = [recipient.receiver_id for recipient in self.recipients]
+        if len(set(receiver_ids)) != len(receiver_ids):
+            raise ValueError("Duplicate recipient")
+        return self
 
 class AttachmentData(BaseModel):
     encrypted_data: str
@@ -36,3 +62,77 @@ class AttachmentResponse(BaseModel):
     filename: str
     mime_type: str
     size: int
+
+class SyncResponse(BaseModel):
+    cursor: int
+    # Zmiana względem poprzedniej synchronizacji oznacza reset hasła - klient pobiera skrzynkę od nowa
+    key_epoch: int
+    inbox: list[MessageResponse]
+    sent: list[MessageResponse]
+    deleted: list[int]
+
+class MailboxCountsResponse(BaseModel):
+    unread: int
+    inbox: int
+    sent: int
+
+class MarkReadRequest(BaseModel):
+    message_ids: list[int] | None = Field(None, min_length=1, max_length=BulkConfig.MAX_MESSAGE_IDS)
+    up_to_cursor: int | None = Field(None, ge=0, description="Kursor z /messages/sync - wszystko, co klient już widział")
+    up_to: datetime | None = Field(None, description="Wszystkie wiadomości utworzone do tej chwili włącznie")
+
+    @model_validator(mode="after")
+    def validate_single_mode(self):
+        """Exactly one selection mode"""
+        given = [value for value in (self.message_ids, self.up_to_cursor, self.up_to) if value is not None]
+        if len(given) != 1:
+            raise ValueError("Exactly one of message_ids, up_to_cursor or up_to must be given")
+        return self
+
+class DeleteMessagesRequest(BaseModel):
+    message_ids: list[int] = Field(min_length=1, max_length=BulkConfig.MAX_MESSAGE_IDS)
+
+class ConversationResponse(BaseModel):
+    correspondent_id: int
+    correspondent_username: str
+    last_message_id: int | None
+    last_message_at: datetime | None
+    unread_count: int
+    message_count: int
+
+class MessageFilters(BaseModel):
+    """Filtry listy wiadomości - wyłącznie po jawnych metadanych, treść pozostaje zaszyfrowana."""
+    correspondent_id: int | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    unread: bool | None = None
+    has_attachments: bool | None = None
+    mime_type: str | None = Field(None, max_length=255, description="Dokładny typ albo prefiks, np. image/*")
+    min_attachment_size: int | None = Field(None, ge=0)
+    max_attachment_size: int | None = Field(None, ge=0)
+
+class ExportedAttachment(BaseModel):
+    id: int
+    filename: str
+    mime_type: str
+    size: int = Field(gt=0, le=10_000_000)
+    data_size: int = Field(gt=0, le=UploadConfig.MAX_TOTAL_SIZE, description="Rozmiar szyfrogramu w wierszach attachment_data")
+
+class ExportedMessage(BaseModel):
+    """Wiersz "message" eksportu NDJSON - wiadomość z perspektywy eksportującego."""
+    id: int
+    direction: Literal["sent", "received"]
+    correspondent_username: str
+    encrypted_content: str
+    encrypted_symmetric_key: str
+    encrypted_symmetric_key_sender: str | None = None
+    signature: str
+    created_at: datetime
+    is_read: bool
+    read_at: datetime | None = None
+    is_decryptable: bool = True
+    attachments: list[ExportedAttachment] = []
+
+class MailboxImportResponse(BaseModel):
+    imported: int
+    skipped: int
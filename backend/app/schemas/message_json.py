@@ -0,0 +1,57 @@
+"""
+Szybka ścieżka serializacji wiadomości: wiersze z bazy od razu jako słowniki
+o kształcie MessageResponse, kodowane przez orjson.
+
+Dane pochodzą z bazy, więc nie są ponownie walidowane - zgodność kształtu
+z MessageResponse pilnuje test porównujący obie ścieżki.
+"""
+import orjson
+
+
+def attachment_manifest(message) -> list[dict]:
+    return [
+        {
+            "id": attachment.id,
+            "filename": attachment.filename,
+            "mime_type": attachment.mime_type,
+            "size": attachment.size,
+        }
+        for attachment in message.attachments
+    ]
+
+
+def inbox_message(message, sender_username: str, sender_key_epoch: int, receiver_key_epoch: int) -> dict:
+    payload = message.payload
+    return {
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "sender_username": sender_username,
+        "recipient_id": None,
+        "recipient_username": None,
+        "encrypted_content": payload.encrypted_content,
+        "encrypted_symmetric_key": message.encrypted_symmetric_key,
+        "encrypted_symmetric_key_sender": payload.encrypted_symmetric_key_sender,
+        "signature": payload.signature,
+        "created_at": message.created_at,
+        "is_decryptable_receiver": message.is_decryptable_for_receiver(receiver_key_epoch),
+        "is_decryptable_sender": message.is_decryptable_for_sender(sender_key_epoch),
+        "is_read": bool(message.is_read),
+        "attachments": attachment_manifest(message),
+    }
+
+
+def sent_message(
+    message,
+    sender_username: str,
+    receiver_username: str,
+    sender_key_epoch: int,
+    receiver_key_epoch: int,
+) -> dict:
+    result = inbox_message(message, sender_username, sender_key_epoch, receiver_key_epoch)
+    result["recipient_id"] = message.receiver_id
+    result["recipient_username"] = receiver_username
+    return result
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value)
@@ -0,0 +1,18 @@
+from pydantic import BaseModel, Field
+from app.config import UploadConfig
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    mime_type: str
+    size: int = Field(gt=0, le=10_000_000)
+    total_size: int = Field(gt=0, le=UploadConfig.MAX_TOTAL_SIZE, description="Rozmiar szyfrogramu w bajtach")
+    sha256: str = Field(pattern="^[0-9a-f]{64}$", description="SHA-256 szyfrogramu (hex)")
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    chunk_size: int
+    total_chunks: int
+    received_chunks: list[int]
+    is_complete: bool
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import BlobStoreConfig, BulkConfig
+from app.crud.blobs import collect_garbage
+from app.crud.messages import purge_deleted_messages
+from app.db import SessionLocal
+
+_tasks: list[asyncio.Task] = []
+
+
+async def _run_periodically(name: str, interval: float, job: Callable[[AsyncSession], Awaitable[int]]):
+    while True:
+        try:
+            async with SessionLocal() as db:
+                processed = await job(db)
+            if processed:
+                logger.info(f"{name}: przetworzono {processed}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"{name} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_background_tasks():
+    _tasks.append(asyncio.create_task(
+        _run_periodically("blob-gc", BlobStoreConfig.GC_INTERVAL_SECONDS, collect_garbage)
+    ))
+    _tasks.append(asyncio.create_task(
+        _run_periodically("message-purge", BulkConfig.PURGE_INTERVAL_SECONDS, purge_deleted_messages)
+    ))
+
+
+async def stop_background_tasks():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import BLOB_STORE_DIR, AttachmentConfig
+from app.models.attachment import Blob
+from app.utils.upload_storage import _read_file
+
+
+class BlobStore(ABC):
+    """
+    Backend przechowujący treść blobów. Liczniki referencji prowadzi app.crud.blobs,
+    backend odpowiada tylko za zapis, odczyt zakresu i fizyczne usunięcie.
+    """
+    name: str
+
+    @abstractmethod
+    async def write(self, db: AsyncSession, sha256: str, source: bytes | str) -> bool:
+        """
+        Zapisuje treść, jeśli jej jeszcze nie ma. source to bajty lub ścieżka pliku - plik
+        zostaje na miejscu, bo transakcja może zostać wycofana i ponowiona; usuwa go wywołujący
+        po commicie. Zwraca True, jeśli powstał nowy plik poza bazą.
+        """
+
+    @abstractmethod
+    def iter_range(self, db: AsyncSession, sha256: str, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+        """Zwraca kolejne fragmenty domkniętego zakresu bajtów [start, end]."""
+
+    @abstractmethod
+    async def remove(self, sha256: str) -> None:
+        ...
+
+
+class FilesystemBlobStore(BlobStore):
+    name = "filesystem"
+
+    def __init__(self, root: str | None = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return self._root or BLOB_STORE_DIR
+
+    def relative_path(self, sha256: str) -> str:
+        # Dwa poziomy katalogów, żeby żaden z nich nie rozrastał się ponad kilka tysięcy plików
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, self.relative_path(sha256))
+
+    def _write(self, sha256: str, source: bytes | str) -> bool:
+        path = self.path(sha256)
+        if os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        if isinstance(source, str):
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                # Inny system plików albo brak obsługi dowiązań
+                shutil.copyfile(source, tmp_path)
+        else:
+            with open(tmp_path, "wb") as f:
+                f.write(source)
+        os.replace(tmp_path, path)
+        return True
+
+    def _read(self, path: str, offset: int, length: int) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _remove(self, sha256: str) -> None:
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    async def write(self, db: AsyncSession, sha256: str, source: bytes | str) -> bool:
+        return await asyncio.to_thread(self._write, sha256, source)
+
+    async def iter_range(self, db: AsyncSession, sha256: str, start: int, end: int, chunk_size: int):
+        path = self.path(sha256)
+        offset = start
+        while offset <= end:
+            chunk = await asyncio.to_thread(self._read, path, offset, min(chunk_size, end - offset + 1))
+            if not chunk:
+                break
+            yield chunk
+            offset += len(chunk)
+
+    async def remove(self, sha256: str) -> None:
+        await asyncio.to_thread(self._remove, sha256)
+
+
+class DatabaseBlobStore(BlobStore):
+    name = "database"
+
+    async def write(self, db: AsyncSession, sha256: str, source: bytes | str) -> bool:
+        result = await db.execute(select(Blob.data.is_(None)).where(Blob.sha256 == sha256))
+        if not result.scalar_one():
+            return False
+
+        if isinstance(source, str):
+            source = await asyncio.to_thread(_read_file, source)
+        # Treść w wierszu blobs znika razem z wycofaną transakcją
+        await db.execute(update(Blob).where(Blob.sha256 == sha256).values(data=source))
+        return False
+
+    async def iter_range(self, db: AsyncSession, sha256: str, start: int, end: int, chunk_size: int):
+        offset = start
+        while offset <= end:
+            query = (
+                select(func.substr(Blob.data, offset + 1, min(chunk_size, end - offset + 1)))
+                .where(Blob.sha256 == sha256)
+            )
+            chunk = (await db.execute(query)).scalar_one_or_none()
+            if not chunk:
+                break
+            yield chunk
+            offset += len(chunk)
+
+    async def remove(self, sha256: str) -> None:
+        # Treść znika razem z wierszem w tabeli blobs
+        pass
+
+
+_stores: dict[str, BlobStore] = {
+    FilesystemBlobStore.name: FilesystemBlobStore(),
+    DatabaseBlobStore.name: DatabaseBlobStore(),
+}
+
+
+def x_accel_headers(sha256: str) -> dict[str, str]:
+    """Nagłówki przekazujące wysyłkę pliku z magazynu do wewnętrznej lokalizacji nginx."""
+    return {
+        "X-Accel-Redirect": f"{AttachmentConfig.X_ACCEL_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}",
+        "X-Accel-Buffering": "no",
+    }
+
+
+def get_blob_store(name: str) -> BlobStore:
+    try:
+        return _stores[name]
+    except KeyError:
+        raise ValueError(f"Unknown blob store backend: {name}")
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import redis.asyncio as redis
+from loguru import logger
+
+CHANNEL_PREFIX = "mailbox_events:"
+QUEUE_SIZE = 100
+
+
+class EventBus:
+    """
+    Rozsyłanie zdarzeń skrzynki między workerami. Każdy worker ma jedną subskrypcję
+    Redis pub/sub i przekazuje zdarzenia do kolejek swoich lokalnych połączeń.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    def ensure_started(self, redis_conn: redis.Redis) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(redis_conn))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def dispatch(self, user_id: int, event: dict) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Wolny klient traci zdarzenie - i tak dogoni stan przez /messages/sync
+                pass
+
+    async def _listen(self, redis_conn: redis.Redis) -> None:
+        while True:
+            pubsub = redis_conn.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    try:
+                        user_id = int(message["channel"].removeprefix(CHANNEL_PREFIX))
+                        self.dispatch(user_id, json.loads(message["data"]))
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"Invalid mailbox event: {e}")
+            except redis.RedisError as e:
+                logger.error(f"Mailbox event listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+event_bus = EventBus()
+
+
+async def publish_event(redis_conn: redis.Redis, user_id: int, event: dict) -> None:
+    """Publikuje zdarzenie dla użytkownika. Błąd Redisa nie przerywa żądania."""
+    try:
+        await redis_conn.publish(f"{CHANNEL_PREFIX}{user_id}", json.dumps(event))
+    except redis.RedisError as e:
+        logger.error(f"Failed to publish mailbox event: {e}")
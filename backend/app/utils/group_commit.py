@@ -0,0 +1,104 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class _Batch:
+    def __init__(self):
+        self.items: list[tuple[Any, asyncio.Future]] = []
+        self.full = asyncio.Event()
+
+
+class GroupCommitQueue:
+    """
+    Łączy współbieżne zapisy z różnych żądań w jedną transakcję SQLite.
+
+    Pierwsze żądanie otwiera paczkę, czeka najwyżej window_seconds na kolejne
+    i zapisuje wszystkie zebrane elementy we własnej sesji - zapis trwa także po
+    przerwaniu tego żądania. Pozostałe żądania tylko czekają na wynik, więc na
+    całą paczkę przypada jeden commit i jeden fsync.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[AsyncSession, list[Any]], Awaitable[list[Any]]],
+        window_seconds: float,
+        max_items: int,
+    ):
+        self._write_batch = write_batch
+        self._window_seconds = window_seconds
+        self._max_items = max_items
+        self._open: _Batch | None = None
+
+    async def submit(self, session_factory: async_sessionmaker, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._open
+        if batch is not None:
+            batch.items.append((item, future))
+            if len(batch.items) >= self._max_items:
+                batch.full.set()
+                self._open = None
+            return await future
+
+        batch = _Batch()
+        batch.items.append((item, future))
+        self._open = batch
+        # Zapis w osobnym zadaniu - przerwanie żądania lidera nie zostawia pozostałych bez odpowiedzi
+        await asyncio.shield(asyncio.ensure_future(self._lead(session_factory, batch)))
+        return await future
+
+    async def _lead(self, session_factory: async_sessionmaker, batch: _Batch) -> None:
+        try:
+            await self._write(session_factory, batch)
+        except asyncio.CancelledError:
+            for _, future in batch.items:
+                if not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            # Błąd poza samym zapisem paczki, np. przy otwieraniu sesji albo wycofaniu transakcji
+            logger.error(f"Group commit of {len(batch.items)} items failed: {e}")
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # Żadne z czekających żądań nie może zostać bez odpowiedzi, np. gdy wyników jest mniej niż elementów
+            for _, future in batch.items:
+                if not future.done():
+                    future.set_exception(RuntimeError("Group commit returned no result for the item"))
+
+    async def _write(self, session_factory: async_sessionmaker, batch: _Batch) -> None:
+        if len(batch.items) < self._max_items:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self._window_seconds)
+            except asyncio.TimeoutError:
+                pass
+        if self._open is batch:
+            self._open = None
+
+        items = [item for item, _ in batch.items]
+        async with session_factory() as db:
+            try:
+                results = await self._write_batch(db, items)
+            except Exception as e:
+                await db.rollback()
+                if len(items) == 1:
+                    batch.items[0][1].set_exception(e)
+                    return
+                logger.warning(f"Group commit of {len(items)} items failed, retrying one by one: {e}")
+                await self._write_one_by_one(db, batch)
+                return
+
+        for (_, future), result in zip(batch.items, results):
+            future.set_result(result)
+
+    async def _write_one_by_one(self, db: AsyncSession, batch: _Batch) -> None:
+        # Jeden błędny element nie może zepsuć zapisu pozostałych
+        for item, future in batch.items:
+            try:
+                future.set_result((await self._write_batch(db, [item]))[0])
+            except Exception as e:
+                await db.rollback()
+                future.set_exception(e)
@@ -0,0 +1,35 @@
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parsuje nagłówek Range w postaci bytes=start-end, bytes=start- lub bytes=-suffix.
+    Zwraca domknięty przedział (start, end) albo None, gdy należy wysłać całość
+    (nieobsługiwana jednostka lub kilka zakresów naraz).
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_str, sep, end_str = ranges.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if not start_str:
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            start = max(size - suffix, 0)
+            end = size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+
+    if start < 0 or start > end or start >= size:
+        raise RangeNotSatisfiable()
+
+    return start, min(end, size - 1)
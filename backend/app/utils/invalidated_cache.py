@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, TypeVar
+
+import redis.asyncio as redis
+from loguru import logger
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class InvalidatedCache(Generic[K, V]):
+    """
+    Lokalna (per worker) pamięć LRU z TTL, unieważniana przez Redis pub/sub. Wiadomość
+    na kanale to lista kluczy w JSON, sprowadzanych do typu klucza przez parse_key.
+
+    Wpisy są używane tylko przy aktywnej subskrypcji. Po jej zerwaniu cache jest czyszczony,
+    bo unieważnienia z tego czasu mogły przepaść.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        parse_key: Callable[[object], K],
+        ttl_seconds: float,
+        max_entries: int,
+        description: str,
+    ):
+        self._channel = channel
+        self._parse_key = parse_key
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._description = description
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        # Zmienia się przy każdym unieważnieniu - wartość odczytana przed nim nie trafia do cache
+        self._generation = 0
+        self._subscribed = False
+        self._listener: asyncio.Task | None = None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def ensure_started(self, redis_conn: redis.Redis) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(redis_conn))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def get(self, key: K) -> V | None:
+        if not self._subscribed:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V, generation: int) -> None:
+        """Zapamiętuje wartość odczytaną ze źródła; generation pobrane przed odczytem."""
+        if not self._subscribed or generation != self._generation:
+            return
+        self._entries[key] = (value, time.monotonic() + self._ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def evict(self, keys: list[K]) -> None:
+        self._generation += 1
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    async def publish(self, redis_conn: redis.Redis, keys: list[K]) -> None:
+        """Usuwa klucze z lokalnego cache i rozsyła unieważnienie do pozostałych workerów."""
+        self.evict(keys)
+        if not keys:
+            return
+        try:
+            await redis_conn.publish(self._channel, json.dumps(keys))
+        except redis.RedisError as e:
+            logger.error(f"Failed to publish {self._description}: {e}")
+
+    async def _listen(self, redis_conn: redis.Redis) -> None:
+        while True:
+            pubsub = redis_conn.pubsub()
+            try:
+                await pubsub.subscribe(self._channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "subscribe":
+                        self._subscribed = True
+                        continue
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        keys = json.loads(message["data"])
+                        if not isinstance(keys, list):
+                            raise TypeError("expected a list of keys")
+                        self.evict([self._parse_key(key) for key in keys])
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"Invalid {self._description}: {e}")
+            except redis.RedisError as e:
+                logger.error(f"{self._description.capitalize()} listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                self._subscribed = False
+                self.clear()
+                await pubsub.aclose()
@@ -1,17 +1,116 @@
+import asyncio
+import multiprocessing
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
 from passlib.hash import argon2
 from app.config import HashingConfig
 
 
+_hasher = argon2.using(
+    type=HashingConfig.TYPE,
+    salt_size=HashingConfig.SALT_SIZE,
+    time_cost=HashingConfig.TIME_COST,
+    memory_cost=HashingConfig.MEMORY_COST,
+    parallelism=HashingConfig.PARALLELISM,
+    digest_size=HashingConfig.DIGEST_SIZE,
+)
+
+_dummy_hasher = argon2.using(
+    type=HashingConfig.TYPE,
+    salt_size=HashingConfig.SALT_SIZE,
+    time_cost=HashingConfig.DUMMY_TIME_COST,
+    memory_cost=HashingConfig.DUMMY_MEMORY_COST,
+    parallelism=HashingConfig.DUMMY_PARALLELISM,
+    digest_size=HashingConfig.DIGEST_SIZE,
+)
+
+
 def hash_password(password: str) -> str:
-    return argon2.using(
-        type=HashingConfig.TYPE,
-        salt_size=HashingConfig.SALT_SIZE,
-        time_cost=HashingConfig.TIME_COST,
-        memory_cost=HashingConfig.MEMORY_COST,
-        parallelism=HashingConfig.PARALLELISM,
-        digest_size=HashingConfig.DIGEST_SIZE,
-    ).hash(password)
+    return _hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return argon2.verify(plain_password, hashed_password)
+
+
+def _hash_dummy_password(password: str) -> str:
+    return _dummy_hasher.hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True, jeśli hash ma inne parametry niż bieżący HashingConfig (sam odczyt nagłówka, bez Argon2)."""
+    return _hasher.needs_update(hashed_password)
+
+
+class HasherBusy(Exception):
+    """Kolejka haszowania jest pełna - żądanie należy powtórzyć później."""
+
+
+class PasswordHasherPool:
+    """
+    Argon2 w osobnych procesach, żeby pętla zdarzeń workera nie stała w miejscu
+    na czas haszowania. Liczba zadań (liczonych i czekających) jest ograniczona -
+    nadmiarowe żądania dostają HasherBusy zamiast gromadzić się w pamięci.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self._workers = workers
+        self.capacity = workers + queue_size
+        self.depth = 0
+        self.rejected = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Tworzony przy pierwszym użyciu, już w procesie workera uvicorn
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.depth >= self.capacity:
+            self.rejected += 1
+            raise HasherBusy()
+        self.depth += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.depth -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher_pool = PasswordHasherPool(HashingConfig.POOL_WORKERS, HashingConfig.QUEUE_SIZE)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hasher_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hasher_pool.run(verify_password, plain_password, hashed_password)
+
+
+_dummy_hash: str | None = None
+
+
+async def get_dummy_hash() -> str:
+    """
+    Hash losowego hasła - logowanie na nieistniejący email weryfikuje hasło względem niego
+    i trwa tyle samo co dla istniejącego konta. Liczony raz na worker.
+
+    Parametry (HashingConfig.DUMMY_*) powinny odpowiadać hashom większości kont. W trakcie
+    przejścia na nowe parametry czas logowania i tak różni się dla jednej z grup kont -
+    już przeliczonych albo jeszcze nie - więc atrapa zostaje przy starych, dopóki
+    większość kont nie zaloguje się ponownie.
+    """
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = await hasher_pool.run(_hash_dummy_password, secrets.token_urlsafe(32))
+    return _dummy_hash
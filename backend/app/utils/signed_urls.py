@@ -0,0 +1,23 @@
+import hashlib
+import hmac
+import time
+
+from app.config import SECRET_KEY
+
+# Osobny klucz wyprowadzony z SECRET_KEY, żeby podpisy linków nie mieszały się z JWT
+_SIGNING_KEY = hmac.new(SECRET_KEY.encode(), b"blob-download-url", hashlib.sha256).digest()
+
+
+def _signature(sha256: str, expires: int) -> str:
+    return hmac.new(_SIGNING_KEY, f"{sha256}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def sign_blob(sha256: str, ttl_seconds: int) -> tuple[int, str]:
+    expires = int(time.time()) + ttl_seconds
+    return expires, _signature(sha256, expires)
+
+
+def verify_blob_signature(sha256: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(sha256, expires), signature)
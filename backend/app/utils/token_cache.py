@@ -0,0 +1,34 @@
+import redis.asyncio as redis
+
+from app.config import TokenCacheConfig
+from app.utils.invalidated_cache import InvalidatedCache
+
+CHANNEL = "token_revocations"
+
+
+class TokenCache(InvalidatedCache[str, bool]):
+    """
+    Lokalna pamięć zweryfikowanych identyfikatorów refresh tokenów - pozwala pominąć
+    EXISTS w Redisie przy większości żądań. Unieważnienia przychodzą przez Redis pub/sub.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        super().__init__(CHANNEL, str, ttl_seconds, max_entries, "token revocation")
+
+    def contains(self, token_id: str) -> bool:
+        return self.get(token_id) is not None
+
+    def add(self, token_id: str, generation: int) -> None:
+        """Zapamiętuje token potwierdzony w Redisie; generation odczytane przed zapytaniem."""
+        self.put(token_id, True, generation)
+
+
+token_cache = TokenCache(TokenCacheConfig.TTL_SECONDS, TokenCacheConfig.MAX_ENTRIES)
+
+
+async def publish_revocation(redis_conn: redis.Redis, token_ids: list[str]) -> None:
+    """
+    Usuwa tokeny z lokalnego cache i rozsyła unieważnienie do pozostałych workerów.
+    Gdy publikacja się nie uda, inne workery mogą honorować token jeszcze przez TTL cache.
+    """
+    await token_cache.publish(redis_conn, token_ids)
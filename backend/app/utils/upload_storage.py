@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import os
+from app.config import UPLOAD_DIR
+
+
+def part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+
+def spool_path(name: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{name}.spool")
+
+
+def _create_part_file(path: str, size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+def _write_at(path: str, offset: int, data: bytes) -> None:
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+
+def _append(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def create_part_file(upload_id: str, size: int) -> None:
+    await asyncio.to_thread(_create_part_file, part_path(upload_id), size)
+
+
+async def write_part(upload_id: str, offset: int, data: bytes) -> None:
+    await asyncio.to_thread(_write_at, part_path(upload_id), offset, data)
+
+
+async def part_sha256(upload_id: str) -> str:
+    return await asyncio.to_thread(_file_sha256, part_path(upload_id))
+
+
+async def remove_part(upload_id: str) -> None:
+    await asyncio.to_thread(_remove_file, part_path(upload_id))
+
+
+async def append_to_file(path: str, data: bytes) -> None:
+    await asyncio.to_thread(_append, path, data)
+
+
+async def remove_file(path: str) -> None:
+    await asyncio.to_thread(_remove_file, path)
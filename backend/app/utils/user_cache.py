@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+import redis.asyncio as redis
+
+from app.config import UserCacheConfig
+from app.utils.invalidated_cache import InvalidatedCache
+
+CHANNEL = "user_invalidations"
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """
+    Niezmienna tożsamość zalogowanego użytkownika przekazywana do handlerów.
+    Bez kluczy i hashy - te handlery pobierają z bazy tylko tam, gdzie ich potrzebują.
+    """
+    id: int
+    username: str
+    email: str
+    key_epoch: int
+    is_2fa_enabled: bool
+    has_totp_secret: bool
+
+
+class UserCache(InvalidatedCache[int, UserSnapshot]):
+    """Lokalna (per worker) pamięć LRU migawek użytkowników, unieważniana przez Redis pub/sub."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        super().__init__(CHANNEL, int, ttl_seconds, max_entries, "user invalidation")
+
+    def add(self, snapshot: UserSnapshot, generation: int) -> None:
+        self.put(snapshot.id, snapshot, generation)
+
+
+user_cache = UserCache(UserCacheConfig.LOCAL_TTL_SECONDS, UserCacheConfig.LOCAL_MAX_ENTRIES)
+
+
+async def publish_invalidation(redis_conn: redis.Redis, user_ids: list[int]) -> None:
+    """Usuwa migawki z lokalnego cache i rozsyła unieważnienie do pozostałych workerów."""
+    await user_cache.publish(redis_conn, user_ids)
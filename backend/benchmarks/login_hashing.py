@@ -0,0 +1,79 @@
+"""
+Koszt Argon2 w logowaniu: dawna ścieżka (hash atrapy + weryfikacja przy każdym
+logowaniu) i obecna (jedna weryfikacja względem hasha konta albo gotowej atrapy).
+
+    uv run python -m benchmarks.login_hashing [--logins 20] [--concurrency 8]
+
+Sprawdza:
+- zrównanie czasów - istniejące i nieistniejące konto kosztują tyle samo,
+- przepustowość - logowania na sekundę przez pulę procesów z app.utils.password_hasher.
+Pozostała część logowania (baza, Redis, losowe opóźnienie) nie jest mierzona.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.utils.password_hasher import hash_password_async, verify_password_async, get_dummy_hash, hasher_pool
+
+PASSWORD = "CorrectHorse123!"
+
+
+async def legacy_login(password_hash: str | None, password: str) -> bool:
+    fake_hash = await hash_password_async("fake_password")
+    if password_hash is None:
+        await verify_password_async(password, fake_hash)
+        return False
+    return await verify_password_async(password, password_hash)
+
+
+async def current_login(password_hash: str | None, password: str) -> bool:
+    valid = await verify_password_async(password, password_hash or await get_dummy_hash())
+    return password_hash is not None and valid
+
+
+async def latency(login, password_hash: str | None, count: int) -> float:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await login(password_hash, PASSWORD)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def throughput(login, password_hash: str, count: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await login(password_hash, PASSWORD)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    return count / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    password_hash = await hash_password_async(PASSWORD)
+    await get_dummy_hash()
+
+    print(f"Argon2 pool: {hasher_pool.capacity} slots, {args.logins} logins per measurement")
+    for name, login in (("legacy", legacy_login), ("current", current_login)):
+        existing = await latency(login, password_hash, args.logins)
+        missing = await latency(login, None, args.logins)
+        rate = await throughput(login, password_hash, args.logins, args.concurrency)
+        print(
+            f"  {name:8} existing {existing * 1000:7.1f} ms  missing {missing * 1000:7.1f} ms"
+            f"  parity {missing / existing:5.2f}  throughput {rate:6.1f} logins/s"
+        )
+
+    hasher_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
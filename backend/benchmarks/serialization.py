@@ -0,0 +1,112 @@
+"""
+Koszt serializacji listy wiadomości na jedną wiadomość: dawna ścieżka
+(MessageResponse na wiersz + walidacja response_model + JSONResponse)
+i szybka ścieżka app.schemas.message_json (słowniki + orjson).
+
+    uv run python -m benchmarks.serialization [--messages 200] [--attachments 1] [--repeat 20]
+
+Wiersze są budowane w pamięci, bez bazy - mierzona jest wyłącznie serializacja.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models.attachment import Attachment
+from app.models.message import Message
+from app.schemas import message_json
+from app.schemas.message import MessageResponse
+import app.models  # noqa: F401
+
+
+def build_rows(count: int, attachments: int) -> list[tuple]:
+    created_at = datetime(2025, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(count):
+        message = Message(
+            id=i + 1,
+            sender_id=2,
+            receiver_id=1,
+            encrypted_content="A" * 512,
+            encrypted_symmetric_key="K" * 344,
+            encrypted_symmetric_key_sender="S" * 344,
+            signature="G" * 344,
+            created_at=created_at + timedelta(seconds=i),
+            is_read=bool(i % 2),
+            is_decryptable_sender=True,
+            is_decryptable_receiver=True,
+            sender_key_epoch=0,
+            receiver_key_epoch=0,
+        )
+        message.attachments = [
+            Attachment(id=i * attachments + j + 1, filename=f"file-{j}.bin", mime_type="application/octet-stream", size=1024)
+            for j in range(attachments)
+        ]
+        rows.append((message, "sender", 0))
+    return rows
+
+
+def legacy_response(message, sender_username: str, sender_key_epoch: int, receiver_key_epoch: int) -> MessageResponse:
+    return MessageResponse(
+        id=message.id,
+        sender_id=message.sender_id,
+        sender_username=sender_username,
+        encrypted_content=message.payload.encrypted_content,
+        encrypted_symmetric_key=message.encrypted_symmetric_key,
+        encrypted_symmetric_key_sender=message.payload.encrypted_symmetric_key_sender,
+        signature=message.payload.signature,
+        created_at=message.created_at,
+        is_read=message.is_read,
+        is_decryptable_receiver=message.is_decryptable_for_receiver(receiver_key_epoch),
+        is_decryptable_sender=message.is_decryptable_for_sender(sender_key_epoch),
+        attachments=message_json.attachment_manifest(message),
+    )
+
+
+async def legacy_path(rows, field) -> bytes:
+    content = [legacy_response(message, username, epoch, 0) for message, username, epoch in rows]
+    # To samo, co FastAPI robi z wynikiem handlera przy response_model=List[MessageResponse]
+    serialized = await serialize_response(field=field, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def fast_path(rows, field) -> bytes:
+    return ORJSONResponse([message_json.inbox_message(message, username, epoch, 0) for message, username, epoch in rows]).body
+
+
+async def measure(path, rows, field, repeat: int) -> float:
+    await path(rows, field)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await path(rows, field)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="wiadomości na odpowiedź (domyślnie jedna strona)")
+    parser.add_argument("--attachments", type=int, default=1, help="załączniki na wiadomość")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = build_rows(args.messages, args.attachments)
+    field = create_response_field(name="response", type_=List[MessageResponse], mode="serialization")
+
+    legacy = await measure(legacy_path, rows, field, args.repeat)
+    fast = await measure(fast_path, rows, field, args.repeat)
+
+    print(f"{args.messages} messages, {args.attachments} attachment(s) each, best of {args.repeat}")
+    print(f"  MessageResponse + response_model: {legacy * 1e6:8.2f} µs/message")
+    print(f"  message_json + orjson:            {fast * 1e6:8.2f} µs/message")
+    print(f"  speedup: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
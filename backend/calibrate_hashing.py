@@ -0,0 +1,103 @@
+"""
+Dobiera parametry Argon2id do bieżącej maszyny.
+
+    uv run calibrate_hashing.py [--target-ms 250] [--memory-budget-mib 1024] [--concurrency N]
+
+Przy --concurrency jednoczesnych haszowaniach (domyślnie liczba rdzeni) każde ma
+trwać najwyżej --target-ms, a wszystkie razem zajmować najwyżej --memory-budget-mib.
+Najpierw ustalana jest pamięć (największa mieszcząca się w budżecie, zmniejszana,
+gdy nawet time_cost=1 przekracza cel), potem największy time_cost w limicie czasu.
+
+Wynik to linie do .env. Po zmianie parametrów hashe istniejących kont są
+przeliczane przy ich następnym logowaniu - bez resetu haseł. Hash-atrapa dla
+nieistniejących kont zostaje przy dotychczasowych parametrach (PASSWORD_HASH_DUMMY_*),
+które można usunąć z .env, gdy większość kont ma już nowe hashe.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.hash import argon2
+
+from app.config import HashingConfig
+
+# Minimum OWASP dla Argon2id
+MIN_MEMORY_KIB = 19 * 1024
+MAX_TIME_COST = 10
+
+
+def timed_hash(time_cost: int, memory_cost: int, parallelism: int) -> float:
+    hasher = argon2.using(
+        type=HashingConfig.TYPE,
+        salt_size=HashingConfig.SALT_SIZE,
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        digest_size=HashingConfig.DIGEST_SIZE,
+    )
+    start = time.perf_counter()
+    hasher.hash("calibration-password")
+    return time.perf_counter() - start
+
+
+def measure(pool: ProcessPoolExecutor, concurrency: int, rounds: int, time_cost: int, memory_cost: int, parallelism: int) -> float:
+    """Mediana czasu jednego haszowania, gdy concurrency haszowań trwa jednocześnie."""
+    samples = []
+    for _ in range(rounds):
+        futures = [pool.submit(timed_hash, time_cost, memory_cost, parallelism) for _ in range(concurrency)]
+        samples.extend(future.result() for future in futures)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250, help="docelowy czas jednego haszowania pod obciążeniem")
+    parser.add_argument("--memory-budget-mib", type=int, default=1024, help="pamięć na wszystkie jednoczesne haszowania")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="jednoczesne haszowania na maszynie")
+    parser.add_argument("--parallelism", type=int, default=HashingConfig.PARALLELISM)
+    parser.add_argument("--rounds", type=int, default=3, help="pomiary na każdy zestaw parametrów")
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    memory_cost = args.memory_budget_mib * 1024 // args.concurrency
+    if memory_cost < MIN_MEMORY_KIB:
+        parser.error(f"memory budget gives {memory_cost // 1024} MiB per hash, minimum is {MIN_MEMORY_KIB // 1024} MiB")
+
+    with ProcessPoolExecutor(max_workers=args.concurrency, mp_context=multiprocessing.get_context("spawn")) as pool:
+        def run(time_cost: int, memory: int) -> float:
+            latency = measure(pool, args.concurrency, args.rounds, time_cost, memory, args.parallelism)
+            print(f"  t={time_cost:<2} m={memory // 1024:>5} MiB p={args.parallelism}: {latency * 1000:7.1f} ms")
+            return latency
+
+        print(f"Calibrating for {args.concurrency} concurrent hashes, target {args.target_ms:.0f} ms")
+        latency = run(1, memory_cost)
+        while latency > target and memory_cost > MIN_MEMORY_KIB:
+            memory_cost = max(MIN_MEMORY_KIB, memory_cost // 2)
+            latency = run(1, memory_cost)
+
+        time_cost = 1
+        while time_cost < MAX_TIME_COST:
+            next_latency = run(time_cost + 1, memory_cost)
+            if next_latency > target:
+                break
+            time_cost, latency = time_cost + 1, next_latency
+
+    if latency > target:
+        print(f"! Even the minimum parameters miss the target ({latency * 1000:.0f} ms) - lower --concurrency")
+    print(f"\n# {latency * 1000:.0f} ms per hash at concurrency {args.concurrency}, "
+          f"{args.concurrency * memory_cost // 1024} MiB total")
+    print(f"PASSWORD_HASH_TIME_COST={time_cost}")
+    print(f"PASSWORD_HASH_MEMORY_COST={memory_cost}")
+    print(f"PASSWORD_HASH_PARALLELISM={args.parallelism}")
+    if (time_cost, memory_cost, args.parallelism) != (HashingConfig.TIME_COST, HashingConfig.MEMORY_COST, HashingConfig.PARALLELISM):
+        print("# Keep the dummy hash at the current parameters until most accounts have logged in again")
+        print(f"PASSWORD_HASH_DUMMY_TIME_COST={HashingConfig.DUMMY_TIME_COST}")
+        print(f"PASSWORD_HASH_DUMMY_MEMORY_COST={HashingConfig.DUMMY_MEMORY_COST}")
+        print(f"PASSWORD_HASH_DUMMY_PARALLELISM={HashingConfig.DUMMY_PARALLELISM}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import asyncio
 from app.db import engine, Base
 # Import all models to ensure they're registered with SQLAlchemy
-from app.models import User, Message, Attachment  # noqa: F401
+from app.models import User, Message, MessageContent, MessageTombstone, Attachment, Blob, UploadSession, UploadChunk, Conversation  # noqa: F401
 
 
 async def main():
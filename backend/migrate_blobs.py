@@ -0,0 +1,108 @@
+"""
+Przenosi zaszyfrowane załączniki z bazy SQLite do magazynu blobów.
+
+    uv run migrate_blobs.py [--batch-size 20] [--vacuum]
+
+Obsługuje starsze załączniki (kolumna attachments.encrypted_data) oraz bloby
+zapisane backendem "database". Skrypt można przerwać i uruchomić ponownie -
+każda paczka jest osobną transakcją.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select, update, func, text
+
+from app.config import BlobStoreConfig
+from app.db import engine, SessionLocal
+from app.crud.blobs import store_blob
+from app.models import Attachment, Blob
+from app.utils.blob_store import FilesystemBlobStore, get_blob_store
+from migrate_schema import upgrade_schema
+
+
+async def ensure_schema():
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+
+
+async def migrate_attachment_column(batch_size: int) -> int:
+    migrated = 0
+    while True:
+        async with SessionLocal() as db:
+            query = (
+                select(Attachment.id, Attachment.encrypted_data)
+                .where(Attachment.blob_sha256.is_(None))
+                .where(func.length(Attachment.encrypted_data) > 0)
+                .limit(batch_size)
+            )
+            rows = (await db.execute(query)).all()
+            if not rows:
+                return migrated
+
+            for attachment_id, data in rows:
+                sha256 = await store_blob(db, data)
+                await db.execute(
+                    update(Attachment)
+                    .where(Attachment.id == attachment_id)
+                    .values(blob_sha256=sha256, encrypted_data=None)
+                )
+            await db.commit()
+            migrated += len(rows)
+            print(f"  attachments: {migrated}")
+
+
+async def migrate_database_blobs(batch_size: int) -> int:
+    target = get_blob_store(FilesystemBlobStore.name)
+    migrated = 0
+    while True:
+        async with SessionLocal() as db:
+            query = (
+                select(Blob.sha256, Blob.data)
+                .where(Blob.backend == "database")
+                .limit(batch_size)
+            )
+            rows = (await db.execute(query)).all()
+            if not rows:
+                return migrated
+
+            for sha256, data in rows:
+                await target.write(db, sha256, data or b"")
+                await db.execute(
+                    update(Blob)
+                    .where(Blob.sha256 == sha256)
+                    .values(backend=target.name, data=None)
+                )
+            await db.commit()
+            migrated += len(rows)
+            print(f"  database blobs: {migrated}")
+
+
+async def vacuum():
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM"))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--vacuum", action="store_true", help="Zwolnij miejsce w pliku bazy po migracji")
+    args = parser.parse_args()
+
+    BlobStoreConfig.BACKEND = FilesystemBlobStore.name
+    await ensure_schema()
+
+    print("Migrating attachments.encrypted_data...")
+    attachments = await migrate_attachment_column(args.batch_size)
+    print("Migrating database-backed blobs...")
+    blobs = await migrate_database_blobs(args.batch_size)
+
+    if args.vacuum:
+        print("Running VACUUM...")
+        await vacuum()
+
+    print(f"✓ Moved {attachments} attachments and {blobs} blobs to the filesystem store")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+"""
+Doprowadza istniejącą bazę SQLite do aktualnego modelu.
+
+    uv run migrate_schema.py
+
+create_all tworzy tylko brakujące tabele - istniejących nie zmienia. Skrypt dodaje nowe
+kolumny (numery synchronizacji są uzupełniane dla dotychczasowych wiadomości), przebudowuje
+tabele messages i attachments tam, gdzie SQLite nie zdejmie NOT NULL przez ALTER TABLE,
+tworzy brakujące indeksy, ujednolica starsze daty created_at i przelicza podsumowania
+rozmów, jeśli ich tabela dopiero powstała. Skrypt można uruchamiać wielokrotnie.
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from app.db import engine, Base, SessionLocal
+from app.crud.conversations import rebuild_conversations
+from app.crud.messages import normalize_legacy_timestamps
+from app.models import Attachment, Message, User
+
+# Kolumny dodane do tabel, które istniały już w pierwszej wersji schematu
+ADDED_COLUMNS = {
+    User.__table__: ["mailbox_seq", "key_epoch"],
+    Message.__table__: ["content_id", "sender_key_epoch", "receiver_key_epoch", "sender_seq", "receiver_seq"],
+}
+
+
+def _columns(conn, table_name: str) -> dict:
+    """Kolumny tabeli z PRAGMA table_info: nazwa -> (cid, name, type, notnull, default, pk)."""
+    return {row[1]: row for row in conn.execute(text(f'PRAGMA table_info("{table_name}")'))}
+
+
+def _drop_indexes(conn, table_name: str) -> None:
+    indexes = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+    ), {"table": table_name})
+    for (name,) in indexes.all():
+        conn.execute(text(f'DROP INDEX "{name}"'))
+
+
+def add_missing_columns(conn) -> None:
+    for table, names in ADDED_COLUMNS.items():
+        existing = _columns(conn, table.name)
+        for name in names:
+            if name not in existing:
+                column = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {column}'))
+
+
+def upgrade_messages_table(conn) -> None:
+    """
+    Wiadomości grupowe trzymają szyfrogram i podpis w message_contents, więc te kolumny
+    w messages muszą przyjmować NULL. Tabela jest przebudowywana pod nową nazwą i podmieniana -
+    zmiana nazwy starej tabeli przepisałaby klucze obce w attachments na tabelę do usunięcia.
+    """
+    columns = _columns(conn, "messages")
+    if not (columns["encrypted_content"][3] or columns["signature"][3]):
+        return
+
+    table = Message.__table__
+    create = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(text(create.replace("CREATE TABLE messages ", "CREATE TABLE messages_rebuilt ", 1)))
+    names = ", ".join(column.name for column in table.columns if column.name in columns)
+    conn.execute(text(f"INSERT INTO messages_rebuilt ({names}) SELECT {names} FROM messages"))
+    _drop_indexes(conn, "messages")
+    conn.execute(text("DROP TABLE messages"))
+    conn.execute(text("ALTER TABLE messages_rebuilt RENAME TO messages"))
+
+
+def upgrade_attachments_table(conn) -> None:
+    """
+    Doprowadza starszą tabelę attachments do aktualnego modelu. SQLite nie zdejmie
+    NOT NULL z encrypted_data przez ALTER TABLE, więc tabela jest przebudowywana:
+    nowe załączniki trzymają treść w magazynie blobów i zostawiają tę kolumnę pustą.
+    """
+    columns = _columns(conn, "attachments")
+    if "blob_sha256" not in columns:
+        conn.execute(text("ALTER TABLE attachments ADD COLUMN blob_sha256 VARCHAR(64) REFERENCES blobs(sha256)"))
+    # Kolumna notnull z PRAGMA table_info
+    if not columns["encrypted_data"][3]:
+        return
+
+    _drop_indexes(conn, "attachments")
+    conn.execute(text("ALTER TABLE attachments RENAME TO attachments_legacy"))
+    Attachment.__table__.create(conn)
+    names = ", ".join(column.name for column in Attachment.__table__.columns)
+    conn.execute(text(f"INSERT INTO attachments ({names}) SELECT {names} FROM attachments_legacy"))
+    conn.execute(text("DROP TABLE attachments_legacy"))
+
+
+def backfill_mailbox_seq(conn) -> None:
+    """
+    Numery synchronizacji dla wiadomości sprzed ich wprowadzenia. Identyfikator wiadomości
+    jest unikalny w obrębie skrzynki, więc służy za numer zmiany, a licznik użytkownika
+    startuje od największego z nich - synchronizacja od zera zwraca całą skrzynkę.
+    """
+    conn.execute(text("UPDATE messages SET sender_seq = id, receiver_seq = id"))
+    conn.execute(text(
+        "UPDATE users SET mailbox_seq = coalesce("
+        "(SELECT max(id) FROM messages WHERE sender_id = users.id OR receiver_id = users.id), 0)"
+    ))
+
+
+def create_missing_indexes(conn) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def upgrade_schema(conn) -> set[str]:
+    """Wszystkie kroki migracji w jednej transakcji. Zwraca nazwy tabel utworzonych od zera."""
+    existing_tables = set(inspect(conn).get_table_names())
+    Base.metadata.create_all(conn)
+    created_tables = {table.name for table in Base.metadata.sorted_tables} - existing_tables
+    if "messages" in created_tables:
+        return created_tables
+
+    has_seq = "sender_seq" in _columns(conn, "messages")
+    upgrade_messages_table(conn)
+    upgrade_attachments_table(conn)
+    add_missing_columns(conn)
+    if not has_seq:
+        backfill_mailbox_seq(conn)
+    create_missing_indexes(conn)
+    return created_tables
+
+
+async def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    async with engine.begin() as conn:
+        created_tables = await conn.run_sync(upgrade_schema)
+    print("✓ Schema upgraded")
+
+    async with SessionLocal() as db:
+        normalized = await normalize_legacy_timestamps(db)
+        print(f"✓ Normalized {normalized} message timestamps")
+        if "conversations" in created_tables:
+            rebuilt = await rebuild_conversations(db)
+            print(f"✓ Rebuilt {rebuilt} conversation summaries")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
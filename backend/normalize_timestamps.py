@@ -0,0 +1,31 @@
+"""
+Ujednolica format messages.created_at w bazach sprzed stronicowania kursorem.
+
+    uv run normalize_timestamps.py
+
+Wiadomości zapisane przez dawny server_default mają datę bez mikrosekund, a SQLite
+porównuje daty jako tekst - bez poprawki stronicowanie skrzynki potrafi zwracać
+ten sam wiersz na kolejnych stronach. Skrypt można uruchamiać wielokrotnie.
+"""
+import argparse
+import asyncio
+
+from app.db import engine, Base, SessionLocal
+from app.crud.messages import normalize_legacy_timestamps
+import app.models  # noqa: F401
+
+
+async def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionLocal() as db:
+        normalized = await normalize_legacy_timestamps(db)
+
+    print(f"✓ Normalized {normalized} message timestamps")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+"""
+Przelicza tabelę conversations z tabeli messages.
+
+    uv run rebuild_conversations.py
+
+Potrzebne jednorazowo dla baz sprzed wprowadzenia podsumowań rozmów albo po
+ręcznych zmianach w tabeli messages. Podsumowania są przeliczane w jednej transakcji.
+"""
+import argparse
+import asyncio
+
+from app.db import engine, Base, SessionLocal
+from app.crud.conversations import rebuild_conversations
+import app.models  # noqa: F401
+
+
+async def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with SessionLocal() as db:
+        rebuilt = await rebuild_conversations(db)
+
+    print(f"✓ Rebuilt {rebuilt} conversation summaries")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,19 @@
 import pytest_asyncio
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+import asyncio
 import redis.asyncio as redis
 from unittest.mock import AsyncMock
 
 from app.main import app
-from app.db import Base, get_db
+from app.db import Base, get_db, get_session_factory
 from app.dependencies import get_redis
 from app.models import User
 from app.utils.password_hasher import hash_password
+from app.utils.token_cache import token_cache
+from app.utils.user_cache import user_cache
 
 # Baza testowa w pamięci
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -24,6 +27,17 @@ async def cleanup():
     app.dependency_overrides.clear()
     app.state.limiter._storage.storage.clear()
 
+@pytest_asyncio.fixture(autouse=True)
+async def storage_dirs(tmp_path, monkeypatch):
+    """Pliki przesyłane i bloby trafiają do katalogu tymczasowego testu."""
+    import app.utils.upload_storage as upload_storage
+    import app.utils.blob_store as blob_store
+
+    monkeypatch.setattr(upload_storage, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(blob_store, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    yield tmp_path
+
+
 @pytest_asyncio.fixture
 async def db_session():
     """Tworzy czystą bazę danych dla każdego testu."""
@@ -49,14 +63,48 @@ async def db_session():
     await engine.dispose()
 
 
+class FakePubSub:
+    """Minimalny pub/sub dla mocka Redisa - dostarcza wiadomości z publish() subskrybentom kanału."""
+
+    def __init__(self, redis_mock):
+        self._redis_mock = redis_mock
+        self._queue = asyncio.Queue()
+        self._channels = set()
+
+    async def subscribe(self, channel):
+        self._channels.add(channel)
+        self._redis_mock.subscribers.append(self)
+        await self._queue.put({"type": "subscribe", "channel": channel, "data": 1})
+
+    def deliver(self, channel, message):
+        if channel in self._channels:
+            self._queue.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+    async def aclose(self):
+        if self in self._redis_mock.subscribers:
+            self._redis_mock.subscribers.remove(self)
+
+
 @pytest_asyncio.fixture
 async def redis_session():
     redis_mock = AsyncMock(spec=redis.Redis)
     redis_mock.storage = {}
+    redis_mock.published = []
+    redis_mock.subscribers = []
     
     async def mock_setex(key, time, value):
         redis_mock.storage[key] = value
     
+    async def mock_set(key, value, ex=None, nx=False):
+        if nx and key in redis_mock.storage:
+            return None
+        redis_mock.storage[key] = value
+        return True
+    
     async def mock_get(key):
         return redis_mock.storage.get(key)
     
@@ -86,7 +134,26 @@ async def redis_session():
     async def mock_expire(key, time):
         pass
     
+    async def mock_hincrby(key, field, amount=1):
+        hash_value = redis_mock.storage.setdefault(key, {})
+        hash_value[field] = str(int(hash_value.get(field, 0)) + amount)
+        return int(hash_value[field])
+    
+    async def mock_hgetall(key):
+        return dict(redis_mock.storage.get(key, {}))
+    
+    async def mock_hset(key, mapping):
+        hash_value = redis_mock.storage.setdefault(key, {})
+        hash_value.update({field: str(value) for field, value in mapping.items()})
+    
+    async def mock_publish(channel, message):
+        redis_mock.published.append((channel, message))
+        for pubsub in list(redis_mock.subscribers):
+            pubsub.deliver(channel, message)
+        return len(redis_mock.subscribers)
+    
     redis_mock.setex = mock_setex
+    redis_mock.set = mock_set
     redis_mock.get = mock_get
     redis_mock.delete = mock_delete
     redis_mock.exists = mock_exists
@@ -94,6 +161,11 @@ async def redis_session():
     redis_mock.smembers = mock_smembers
     redis_mock.srem = mock_srem
     redis_mock.expire = mock_expire
+    redis_mock.hincrby = mock_hincrby
+    redis_mock.hgetall = mock_hgetall
+    redis_mock.hset = mock_hset
+    redis_mock.publish = mock_publish
+    redis_mock.pubsub = lambda: FakePubSub(redis_mock)
     
     yield redis_mock
     redis_mock.storage.clear()
@@ -113,6 +185,9 @@ async def client(db_session: AsyncSession, redis_session):
         return redis_session
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: async_sessionmaker(
+        db_session.bind, class_=AsyncSession, expire_on_commit=False
+    )
     app.dependency_overrides[get_redis] = override_get_redis
     
     try:
@@ -120,6 +195,8 @@ async def client(db_session: AsyncSession, redis_session):
             yield ac
     finally:
         app.dependency_overrides.clear()
+        await token_cache.stop()
+        await user_cache.stop()
 
 
 @pytest_asyncio.fixture
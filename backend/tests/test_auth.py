@@ -80,4 +80,252 @@ async def test_login_2fa_with_valid_code(client: AsyncClient, test_user_with_2fa
         "totp_code": code
     })
     assert response.status_code == 200
-    assert "access_token" in response.json()
\ No newline at end of file
+    assert "access_token" in response.json()
+
+@pytest.mark.asyncio
+async def test_password_hashing_runs_in_process_pool(client: AsyncClient, test_user, monkeypatch):
+    """Test puli procesów Argon2 - logowanie działa, a pełna kolejka daje 503 z Retry-After."""
+    from app.utils.password_hasher import hasher_pool, hash_password_async, verify_password
+
+    password_hash = await hash_password_async("Secret123!")
+    assert verify_password("Secret123!", password_hash)
+    assert hasher_pool.depth == 0
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+    response = await client.post("/auth/login", headers=headers, json={
+        "email": test_user.email,
+        "password": "WrongPass123!"
+    })
+    assert response.status_code == 401
+
+    rejected = hasher_pool.rejected
+    monkeypatch.setattr(hasher_pool, "depth", hasher_pool.capacity)
+    response = await client.post("/auth/login", headers=headers, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    metrics = (await client.get("/metrics")).text
+    assert f"password_hash_queue_depth {hasher_pool.capacity}" in metrics
+    assert f"password_hash_rejected_total {rejected + 1}" in metrics
+
+
+@pytest.mark.asyncio
+async def test_login_runs_exactly_one_verify(client: AsyncClient, test_user, monkeypatch):
+    """Test logowania - jedna weryfikacja Argon2 bez dodatkowego haszowania, także dla nieznanego emaila."""
+    from app.utils.password_hasher import hasher_pool, get_dummy_hash
+
+    await get_dummy_hash()
+    calls = []
+    original_run = hasher_pool.run
+
+    async def counting_run(fn, *args):
+        calls.append(fn.__name__)
+        return await original_run(fn, *args)
+
+    monkeypatch.setattr(hasher_pool, "run", counting_run)
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+
+    for email in ("missing@example.com", test_user.email):
+        calls.clear()
+        response = await client.post("/auth/login", headers=headers, json={
+            "email": email,
+            "password": "WrongPass123!"
+        })
+        assert response.status_code == 401
+        assert calls == ["verify_password"]
+
+
+@pytest.mark.asyncio
+async def test_dummy_hash_uses_dummy_parameters():
+    """Test hasha-atrapy - parametry z HashingConfig.DUMMY_*, niezależne od bieżących po rekalibracji."""
+    from passlib.hash import argon2
+    from app.config import HashingConfig
+    from app.utils.password_hasher import get_dummy_hash
+
+    dummy = argon2.from_string(await get_dummy_hash())
+    assert (dummy.rounds, dummy.memory_cost, dummy.parallelism) == (
+        HashingConfig.DUMMY_TIME_COST, HashingConfig.DUMMY_MEMORY_COST, HashingConfig.DUMMY_PARALLELISM,
+    )
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password_hash(client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test rehash-on-login - hash ze starymi parametrami jest przeliczany po udanym logowaniu."""
+    from passlib.hash import argon2
+    from app.utils.password_hasher import password_needs_rehash, verify_password
+
+    outdated_hash = argon2.using(type="ID", time_cost=1, memory_cost=8192, parallelism=1).hash("TestPass123!")
+    test_user.password_hash = outdated_hash
+    await db_session.commit()
+    assert password_needs_rehash(outdated_hash)
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+
+    await db_session.refresh(test_user)
+    assert test_user.password_hash != outdated_hash
+    assert not password_needs_rehash(test_user.password_hash)
+    assert verify_password("TestPass123!", test_user.password_hash)
+
+
+@pytest.mark.asyncio
+async def test_access_token_check_uses_near_cache(client: AsyncClient, test_user, redis_session):
+    """Test cache tokenów - kolejne żądania pomijają EXISTS, unieważnienie z innego workera działa od razu."""
+    import asyncio
+    import json
+    from app.utils.token_cache import CHANNEL
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+    # Ciasteczka są Secure, a klient testowy działa po http
+    client.cookies.set("access_token", response.cookies["access_token"])
+
+    exists_calls = []
+    mock_exists = redis_session.exists
+
+    async def counting_exists(key):
+        exists_calls.append(key)
+        return await mock_exists(key)
+
+    redis_session.exists = counting_exists
+
+    # Pierwsze żądanie uruchamia nasłuch unieważnień - cache działa dopiero po subskrypcji
+    assert (await client.get("/auth/me")).status_code == 200
+    await asyncio.sleep(0.01)
+    exists_calls.clear()
+    assert (await client.get("/auth/me")).status_code == 200
+    assert (await client.get("/auth/me")).status_code == 200
+    assert (await client.get("/auth/me")).status_code == 200
+    assert len(exists_calls) == 1
+
+    # Wylogowanie na innym workerze: klucz znika z Redisa, a unieważnienie przychodzi przez pub/sub
+    token_key = exists_calls[0]
+    await redis_session.delete(token_key)
+    await redis_session.publish(CHANNEL, json.dumps([token_key.removeprefix("refresh_token:")]))
+    await asyncio.sleep(0.01)
+
+    response = await client.get("/auth/me")
+    assert response.status_code == 401
+    assert len(exists_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_logout_evicts_cached_access_token(client: AsyncClient, test_user):
+    """Test wylogowania - token z cache przestaje działać przy następnym żądaniu."""
+    import asyncio
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+    access_token = response.cookies["access_token"]
+    client.cookies.set("access_token", access_token)
+    client.cookies.set("refresh_token", response.cookies["refresh_token"])
+
+    assert (await client.get("/auth/me")).status_code == 200
+    await asyncio.sleep(0.01)
+    assert (await client.get("/auth/me")).status_code == 200
+
+    response = await client.post("/auth/logout", headers={"X-XSRF-TOKEN": "csrf-test"})
+    assert response.status_code == 200
+
+    client.cookies.set("access_token", access_token)
+    response = await client.get("/auth/me")
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_current_user_snapshot_is_cached(client: AsyncClient, test_user, db_session, redis_session):
+    """Test migawki użytkownika - kolejne żądania nie czytają wiersza users z bazy."""
+    import asyncio
+    import dataclasses
+    from sqlalchemy import event
+    from app.utils.user_cache import UserSnapshot, user_cache
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+    client.cookies.set("access_token", response.cookies["access_token"])
+
+    user_queries = []
+
+    def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            user_queries.append(statement)
+
+    sync_engine = db_session.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", count_user_queries)
+    try:
+        response = await client.get("/auth/me")
+        assert response.status_code == 200
+        assert response.json() == {"id": test_user.id, "username": "testuser", "email": test_user.email}
+        assert len(user_queries) == 1
+        assert "public_key" not in user_queries[0]
+
+        await asyncio.sleep(0.01)
+        assert (await client.get("/auth/me")).status_code == 200
+        # Wspólna kopia w Redisie zastępuje bazę, gdy lokalny cache jest pusty
+        user_cache.clear()
+        assert (await client.get("/auth/me")).status_code == 200
+        assert (await client.get("/auth/me")).status_code == 200
+        assert len(user_queries) == 1
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", count_user_queries)
+
+    snapshot = user_cache.get(test_user.id)
+    assert isinstance(snapshot, UserSnapshot)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.username = "other"
+
+
+@pytest.mark.asyncio
+async def test_reset_password_invalidates_user_snapshot(client: AsyncClient, test_user, db_session, redis_session):
+    """Test unieważnienia migawki - nowy key_epoch jest widoczny od razu po resecie hasła."""
+    import asyncio
+    from jose import jwt
+    from app.config import SECRET_KEY, JWTConfig
+    from app.crud.users import get_user_snapshot
+    from app.utils.user_cache import user_cache
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+    client.cookies.set("access_token", response.cookies["access_token"])
+    assert (await client.get("/auth/me")).status_code == 200
+    await asyncio.sleep(0.01)
+    assert (await client.get("/auth/me")).status_code == 200
+    assert user_cache.get(test_user.id).key_epoch == 0
+
+    reset_token = jwt.encode({"sub": str(test_user.id), "email": test_user.email}, SECRET_KEY, algorithm=JWTConfig.ALGORITHM)
+    response = await client.post("/auth/reset-password", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "token": reset_token,
+        "new_password": "NewPass123!",
+        "public_key": "-----BEGIN PUBLIC KEY-----\nNEW\n-----END PUBLIC KEY-----",
+        "encrypted_private_key": "new_encrypted_key"
+    })
+    assert response.status_code == 200
+    assert user_cache.get(test_user.id) is None
+    # Kopia w Redisie została zapisana pod starą wersją, więc odczyt sięga do bazy
+    snapshot = await get_user_snapshot(redis_session, db_session, test_user.id)
+    assert snapshot.key_epoch == 1
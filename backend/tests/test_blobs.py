@@ -0,0 +1,190 @@
+import os
+import pytest
+from tests.utils.helpers import current_user_override
+
+
+@pytest.mark.asyncio
+async def test_blob_deduplication_and_garbage_collection(db_session, monkeypatch):
+    """Test współdzielenia blobów, liczników referencji i usuwania nieużywanych."""
+    from app.config import BlobStoreConfig
+    from app.crud.blobs import store_blob, release_blobs, collect_garbage
+    from app.models.attachment import Blob
+    from app.utils.blob_store import get_blob_store
+
+    monkeypatch.setattr(BlobStoreConfig, "GC_GRACE_SECONDS", 0)
+    data = b"ciphertext" * 100
+
+    sha256 = await store_blob(db_session, data)
+    assert await store_blob(db_session, data) == sha256
+    await db_session.commit()
+
+    blob = await db_session.get(Blob, sha256)
+    assert blob.ref_count == 2
+    path = get_blob_store("filesystem").path(sha256)
+    assert os.path.exists(path)
+
+    await release_blobs(db_session, [sha256])
+    await db_session.commit()
+    assert await collect_garbage(db_session) == 0
+    assert os.path.exists(path)
+
+    await release_blobs(db_session, [sha256])
+    await db_session.commit()
+    assert await collect_garbage(db_session) == 1
+    assert not os.path.exists(path)
+
+
+@pytest.mark.asyncio
+async def test_database_blob_store_range(db_session, monkeypatch):
+    """Test odczytu zakresu z backendu przechowującego bloby w bazie."""
+    from app.config import BlobStoreConfig
+    from app.crud.blobs import store_blob
+    from app.utils.blob_store import get_blob_store
+
+    monkeypatch.setattr(BlobStoreConfig, "BACKEND", "database")
+    data = bytes(range(256))
+    sha256 = await store_blob(db_session, data)
+    await db_session.commit()
+
+    store = get_blob_store("database")
+    chunks = [chunk async for chunk in store.iter_range(db_session, sha256, 10, 109, 32)]
+    assert [len(chunk) for chunk in chunks] == [32, 32, 32, 4]
+    assert b"".join(chunks) == data[10:110]
+
+
+@pytest.mark.asyncio
+async def test_attachment_delivery_offloaded_to_nginx(client, test_user, db_session, monkeypatch):
+    """Test trybów x-accel i signed-url - backend tylko sprawdza uprawnienia."""
+    from urllib.parse import urlsplit, parse_qs
+    from app.main import app
+    from app.config import AttachmentConfig
+    from app.crud.blobs import store_blob
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.message import Message
+    from app.models.attachment import Attachment
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="offloader",
+        email="offloader@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    sha256 = await store_blob(db_session, b"ciphertext")
+    message = Message(
+        sender_id=sender.id,
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    attachment = Attachment(blob_sha256=sha256, filename="plik.bin", mime_type="image/png", size=5)
+    message.attachments.append(attachment)
+    db_session.add(message)
+    await db_session.commit()
+    url = f"/messages/attachments/{attachment.id}/content"
+    accel_path = f"/_protected_blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    monkeypatch.setattr(AttachmentConfig, "DELIVERY_MODE", "x-accel")
+    response = await client.get(url)
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == accel_path
+    assert response.content == b""
+
+    monkeypatch.setattr(AttachmentConfig, "DELIVERY_MODE", "signed-url")
+    monkeypatch.setattr(AttachmentConfig, "PUBLIC_API_PREFIX", "")
+    response = await client.get(url)
+    assert response.status_code == 307
+    location = urlsplit(response.headers["location"])
+    assert location.path == f"/downloads/{sha256}"
+
+    app.dependency_overrides.clear()
+    response = await client.get(response.headers["location"])
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == accel_path
+
+    params = parse_qs(location.query)
+    response = await client.get(location.path, params={"expires": params["expires"][0], "signature": "0" * 64})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_attachment_without_blob_row_returns_404(client, test_user, db_session):
+    """Test załącznika wskazującego brakujący blob - 404 zamiast błędu serwera, eksport go pomija."""
+    import json
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.message import Message
+    from app.models.attachment import Attachment
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    message = Message(
+        sender_id=test_user.id,
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    attachment = Attachment(blob_sha256="0" * 64, filename="plik.bin", mime_type="image/png", size=5)
+    message.attachments.append(attachment)
+    db_session.add(message)
+    await db_session.commit()
+
+    for url in (f"/messages/attachments/{attachment.id}", f"/messages/attachments/{attachment.id}/content"):
+        response = await client.get(url)
+        assert response.status_code == 404
+
+    response = await client.get("/messages/export")
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.content.splitlines()]
+    assert [r["attachments"] for r in records if r["type"] == "message"] == [[], []]
+    assert not [r for r in records if r["type"] == "attachment_data"]
+
+
+@pytest.mark.asyncio
+async def test_migration_makes_legacy_attachment_data_nullable(test_user, db_session):
+    """Test migracji starszej tabeli attachments - nowe załączniki nie zapisują encrypted_data."""
+    from sqlalchemy import text, select
+    from migrate_schema import upgrade_attachments_table
+    from app.models.attachment import Attachment
+    from app.models.message import Message
+
+    message = Message(
+        sender_id=test_user.id,
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    db_session.add(message)
+    await db_session.commit()
+
+    async with db_session.bind.begin() as conn:
+        await conn.execute(text("DROP TABLE attachments"))
+        await conn.execute(text(
+            "CREATE TABLE attachments (id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL REFERENCES messages(id), "
+            "encrypted_data BLOB NOT NULL, filename VARCHAR NOT NULL, mime_type VARCHAR NOT NULL, size INTEGER NOT NULL)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO attachments (message_id, encrypted_data, filename, mime_type, size) "
+            f"VALUES ({message.id}, x'0102', 'stary.bin', 'application/octet-stream', 2)"
+        ))
+        await conn.run_sync(upgrade_attachments_table)
+        await conn.run_sync(upgrade_attachments_table)
+
+    db_session.add(Attachment(message_id=message.id, blob_sha256=None, filename="nowy.bin", mime_type="image/png", size=1))
+    await db_session.commit()
+
+    rows = (await db_session.execute(
+        select(Attachment.filename, Attachment.encrypted_data).order_by(Attachment.id)
+    )).all()
+    assert rows == [("stary.bin", b"\x01\x02"), ("nowy.bin", None)]
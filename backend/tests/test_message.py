@@ -1,5 +1,8 @@
+from datetime import datetime
+
 import pytest
 from httpx import AsyncClient
+from tests.utils.helpers import current_user_override
 
 @pytest.mark.asyncio
 async def test_send_message(client: AsyncClient, auth_headers, test_user, db_session):
@@ -102,4 +105,1331 @@ async def test_mark_message_as_read(client: AsyncClient, auth_headers, test_user
     # Sprawdź w bazie
     await db_session.refresh(message)
     assert message.is_read is True
-    assert message.read_at is not None
\ No newline at end of file
+    assert message.read_at is not None
+
+@pytest.mark.asyncio
+async def test_inbox_cursor_pagination(test_user, db_session):
+    """Test stronicowania skrzynki kursorem po (created_at, id)."""
+    from datetime import datetime
+    from app.models.user import User
+    from app.models.message import Message
+    from app.crud.messages import get_inbox_messages
+
+    sender = User(
+        username="pager",
+        email="pager@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    # Część wiadomości ma identyczny created_at - kolejność rozstrzyga id
+    timestamps = [datetime(2025, 1, 1, 12, 0, 0)] * 3 + [datetime(2025, 1, 2, 12, 0, 0)] * 2
+    for created_at in timestamps:
+        db_session.add(Message(
+            sender_id=sender.id,
+            receiver_id=test_user.id,
+            encrypted_content="encrypted",
+            encrypted_symmetric_key="key",
+            signature="sig",
+            created_at=created_at
+        ))
+    await db_session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        rows = await get_inbox_messages(db_session, test_user.id, limit=2, cursor=cursor)
+        seen.extend(message.id for message, _, _ in rows)
+        if len(rows) < 2:
+            break
+        cursor = (rows[-1][0].created_at, rows[-1][0].id)
+
+    assert seen == [5, 4, 3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_legacy_timestamps_do_not_repeat_across_pages(test_user, db_session):
+    """Test stronicowania po normalizacji dat zapisanych bez mikrosekund przez starszy server_default."""
+    from sqlalchemy import text
+    from app.models.user import User
+    from app.models.message import Message
+    from app.crud.messages import get_inbox_messages, normalize_legacy_timestamps
+
+    sender = User(
+        username="legacy",
+        email="legacy@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+    receiver_id = test_user.id
+    for _ in range(3):
+        db_session.add(Message(
+            sender_id=sender.id,
+            receiver_id=receiver_id,
+            encrypted_content="encrypted",
+            encrypted_symmetric_key="key",
+            signature="sig",
+        ))
+    await db_session.commit()
+    await db_session.execute(text("UPDATE messages SET created_at = '2025-01-01 12:00:00'"))
+    await db_session.commit()
+
+    assert await normalize_legacy_timestamps(db_session) == 3
+    assert await normalize_legacy_timestamps(db_session) == 0
+    db_session.expire_all()
+
+    seen = []
+    cursor = None
+    while True:
+        rows = await get_inbox_messages(db_session, receiver_id, limit=1, cursor=cursor)
+        if not rows:
+            break
+        seen.append(rows[0][0].id)
+        assert len(seen) <= 3
+        cursor = (rows[0][0].created_at, rows[0][0].id)
+
+    assert seen == [3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_inbox_does_not_load_attachment_data(test_user, db_session):
+    """Test czy lista wiadomości ładuje tylko metadane załączników."""
+    from sqlalchemy import inspect
+    from app.models.user import User
+    from app.models.message import Message
+    from app.models.attachment import Attachment
+    from app.crud.messages import get_inbox_messages
+
+    sender = User(
+        username="attacher",
+        email="attacher@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message = Message(
+        sender_id=sender.id,
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    message.attachments.append(Attachment(
+        encrypted_data=b"\x00" * 1024,
+        filename="file.bin",
+        mime_type="application/octet-stream",
+        size=1024
+    ))
+    db_session.add(message)
+    await db_session.commit()
+    db_session.expunge_all()
+
+    rows = await get_inbox_messages(db_session, test_user.id)
+    attachment = rows[0][0].attachments[0]
+    assert attachment.filename == "file.bin"
+    assert "encrypted_data" in inspect(attachment).unloaded
+
+
+@pytest.mark.asyncio
+async def test_attachment_content_range(client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test strumieniowego pobierania załącznika z nagłówkiem Range."""
+    from app.main import app
+    from app.config import AttachmentConfig
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.message import Message
+    from app.models.attachment import Attachment
+
+    monkeypatch.setattr(AttachmentConfig, "STREAM_CHUNK_SIZE", 64)
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="streamer",
+        email="streamer@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    data = bytes(range(256)) * 4
+    message = Message(
+        sender_id=sender.id,
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    attachment = Attachment(encrypted_data=data, filename="plik.bin", mime_type="image/png", size=900)
+    message.attachments.append(attachment)
+    db_session.add(message)
+    await db_session.commit()
+
+    # Treść czyta własna sesja generatora - sesja żądania jest zamknięta przed wysłaniem ciała
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from app.db import get_session_factory
+    session_factory = async_sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False)
+    stream_sessions = []
+
+    def tracking_factory():
+        stream_sessions.append(session_factory())
+        return stream_sessions[-1]
+
+    app.dependency_overrides[get_session_factory] = lambda: tracking_factory
+
+    url = f"/messages/attachments/{attachment.id}/content"
+    response = await client.get(url)
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert len(stream_sessions) == 1
+    assert not stream_sessions[0].in_transaction()
+
+    response = await client.get(url, headers={"Range": "bytes=100-299"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-299/{len(data)}"
+    assert response.content == data[100:300]
+
+    response = await client.get(url, headers={"Range": "bytes=100-299", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == data
+
+    response = await client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    assert response.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_sync_returns_only_changes_since_cursor(client: AsyncClient, test_user, db_session):
+    """Test synchronizacji przyrostowej z kursorem i śladami usunięć."""
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message, mark_message_read, delete_messages
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="syncer",
+        email="syncer@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message_in = SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    first = await create_message(db_session, message_in, sender.id)
+    second = await create_message(db_session, message_in, sender.id)
+
+    response = await client.get("/messages/sync")
+    data = response.json()
+    assert [m["id"] for m in data["inbox"]] == [first.id, second.id]
+    cursor = data["cursor"]
+
+    response = await client.get("/messages/sync", params={"since": cursor})
+    assert response.json()["inbox"] == []
+
+    await mark_message_read(db_session, first.id)
+    await delete_messages(db_session, test_user.id, message_ids=[second.id])
+
+    data = (await client.get("/messages/sync", params={"since": cursor})).json()
+    assert [(m["id"], m["is_read"]) for m in data["inbox"]] == [(first.id, True)]
+    assert data["deleted"] == [second.id]
+    assert data["cursor"] > cursor
+
+
+@pytest.mark.asyncio
+async def test_mark_read_publishes_mailbox_event(client: AsyncClient, test_user, db_session, redis_session):
+    """Test publikacji zdarzenia i rozsyłania go do lokalnych subskrybentów."""
+    import json
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message
+    from app.utils.event_bus import event_bus
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="pusher",
+        email="pusher@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message = await create_message(db_session, SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    ), sender.id)
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+    response = await client.post(f"/messages/{message.id}/read", headers=headers)
+    assert response.status_code == 200
+
+    published = {channel: json.loads(data) for channel, data in redis_session.published}
+    assert published == {
+        f"mailbox_events:{sender.id}": {"type": "message_read", "message_id": message.id},
+        f"mailbox_events:{test_user.id}": {"type": "message_read", "message_id": message.id},
+    }
+
+    # Ponowne oznaczenie nic nie zmienia, więc nie generuje zdarzeń
+    redis_session.published.clear()
+    await client.post(f"/messages/{message.id}/read", headers=headers)
+    assert redis_session.published == []
+
+    queue = event_bus.subscribe(test_user.id)
+    try:
+        event_bus.dispatch(test_user.id, published[f"mailbox_events:{test_user.id}"])
+        event_bus.dispatch(sender.id, published[f"mailbox_events:{sender.id}"])
+        assert queue.get_nowait() == {"type": "message_read", "message_id": message.id}
+        assert queue.empty()
+    finally:
+        event_bus.unsubscribe(test_user.id, queue)
+
+
+@pytest.mark.asyncio
+async def test_mailbox_counts(client: AsyncClient, test_user, db_session, redis_session):
+    """Test liczników skrzynki utrzymywanych w Redisie."""
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="counter",
+        email="counter@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message_in = SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    first = await create_message(db_session, message_in, sender.id)
+    second = await create_message(db_session, message_in, sender.id)
+
+    # Brak klucza w Redisie - liczniki odbudowane z bazy
+    response = await client.get("/messages/counts")
+    assert response.json() == {"unread": 2, "inbox": 2, "sent": 0}
+    assert redis_session.storage[f"user:{test_user.id}:mailbox_counts"]["ready"] == "1"
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+    await client.post(f"/messages/{first.id}/read", headers=headers)
+    await client.post(f"/messages/{first.id}/read", headers=headers)
+    await client.delete(f"/messages/{second.id}", headers=headers)
+    await client.delete(f"/messages/{second.id}", headers=headers)
+
+    response = await client.get("/messages/counts")
+    assert response.json() == {"unread": 0, "inbox": 1, "sent": 0}
+
+    response = await client.post("/messages/send", headers=headers, json={
+        "receiver_id": sender.id,
+        "encrypted_content": "encrypted",
+        "encrypted_symmetric_key": "key",
+        "signature": "sig"
+    })
+    assert response.status_code == 200
+    response = await client.get("/messages/counts")
+    assert response.json() == {"unread": 0, "inbox": 1, "sent": 1}
+
+
+@pytest.mark.asyncio
+async def test_bulk_mark_as_read(client: AsyncClient, test_user, db_session):
+    """Test oznaczania wielu wiadomości jednym żądaniem."""
+    from datetime import timedelta
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="bulkreader",
+        email="bulkreader@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message_in = SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    messages = [await create_message(db_session, message_in, sender.id) for _ in range(4)]
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+
+    response = await client.post("/messages/read", headers=headers, json={})
+    assert response.status_code == 422
+
+    response = await client.post("/messages/read", headers=headers, json={
+        "message_ids": [messages[0].id, messages[0].id, 999999]
+    })
+    assert response.json()["updated"] == 1
+
+    cursor = (await client.get("/messages/sync")).json()["cursor"]
+    late = await create_message(db_session, message_in, sender.id)
+
+    response = await client.post("/messages/read", headers=headers, json={"up_to_cursor": cursor})
+    assert response.json()["updated"] == 3
+
+    data = (await client.get("/messages/sync")).json()
+    assert [m["id"] for m in data["inbox"] if not m["is_read"]] == [late.id]
+
+    up_to = (late.created_at + timedelta(seconds=1)).isoformat() + "Z"
+    response = await client.post("/messages/read", headers=headers, json={"up_to": up_to})
+    assert response.json()["updated"] == 1
+
+    # Ponowne oznaczenie przeczytanych nie przesuwa kursora synchronizacji
+    cursor = (await client.get("/messages/sync")).json()["cursor"]
+    response = await client.post("/messages/read", headers=headers, json={"message_ids": [m.id for m in messages]})
+    assert response.json()["updated"] == 0
+    assert (await client.get("/messages/sync", params={"since": cursor})).json()["cursor"] == cursor
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_clear_conversation_and_purge(client: AsyncClient, test_user, db_session):
+    """Test usuwania wielu wiadomości, czyszczenia rozmowy i fizycznego usuwania w tle."""
+    import base64
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.message import Message
+    from app.models.attachment import Attachment, Blob
+    from app.schemas.message import SendMessageRequest, AttachmentData
+    from app.crud.messages import create_message, delete_messages, purge_deleted_messages
+    from sqlalchemy import select
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    other = User(
+        username="cleaner",
+        email="cleaner@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(other)
+    await db_session.commit()
+
+    def message_to(receiver_id, attachments=None):
+        return SendMessageRequest(
+            receiver_id=receiver_id,
+            encrypted_content="encrypted",
+            encrypted_symmetric_key="key",
+            signature="sig",
+            attachments=attachments
+        )
+
+    attachment = AttachmentData(
+        encrypted_data=base64.b64encode(b"payload").decode(),
+        filename="a.bin",
+        mime_type="application/octet-stream",
+        size=7
+    )
+    received = await create_message(db_session, message_to(test_user.id, [attachment]), other.id)
+    sent = await create_message(db_session, message_to(other.id), test_user.id)
+    kept = await create_message(db_session, message_to(test_user.id), other.id)
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+
+    response = await client.post("/messages/delete", headers=headers, json={"message_ids": [received.id, 999999]})
+    assert response.json()["deleted"] == 1
+    response = await client.delete(f"/messages/conversations/{other.id}", headers=headers)
+    assert response.json()["deleted"] == 2
+
+    data = (await client.get("/messages/sync")).json()
+    assert sorted(data["deleted"]) == sorted([received.id, sent.id, kept.id])
+
+    # Druga strona usuwa jedną z wiadomości - dopiero wtedy purger ją usuwa fizycznie
+    await delete_messages(db_session, other.id, message_ids=[received.id])
+    assert await purge_deleted_messages(db_session) == 1
+    assert await purge_deleted_messages(db_session) == 0
+
+    remaining = (await db_session.execute(select(Message.id))).scalars().all()
+    assert sorted(remaining) == sorted([sent.id, kept.id])
+    assert (await db_session.execute(select(Attachment))).scalars().all() == []
+    blob = (await db_session.execute(select(Blob))).scalar_one()
+    assert blob.ref_count == 0
+
+    response = await client.delete(f"/messages/{received.id}", headers=headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_password_reset_bumps_key_epoch(client: AsyncClient, test_user, db_session):
+    """Test resetu hasła - wcześniejsze wiadomości przestają być odszyfrowywalne bez ich przepisywania."""
+    from jose import jwt
+    from app.main import app
+    from app.config import SECRET_KEY, JWTConfig
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    sender = User(
+        username="epochsender",
+        email="epochsender@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nSENDER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(sender)
+    await db_session.commit()
+
+    message_in = SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    before = await create_message(db_session, message_in, sender.id)
+
+    token = jwt.encode({"sub": str(test_user.id), "email": test_user.email}, SECRET_KEY, algorithm=JWTConfig.ALGORITHM)
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/reset-password", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "token": token,
+        "new_password": "NewPassword123!",
+        "public_key": "-----BEGIN PUBLIC KEY-----\nNEW\n-----END PUBLIC KEY-----",
+        "encrypted_private_key": "new-encrypted"
+    })
+    assert response.status_code == 200
+    await db_session.refresh(test_user)
+    assert test_user.key_epoch == 1
+    # Po resecie aplikacja wczytuje nową migawkę - unieważnienie usuwa starą z cache
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    after = await create_message(db_session, message_in, sender.id)
+
+    data = (await client.get("/messages/sync")).json()
+    assert data["key_epoch"] == 1
+    decryptable = {m["id"]: m["is_decryptable_receiver"] for m in data["inbox"]}
+    assert decryptable == {before.id: False, after.id: True}
+    assert all(m["is_decryptable_sender"] for m in data["inbox"])
+
+
+@pytest.mark.asyncio
+async def test_group_send_stores_content_once(client: AsyncClient, test_user, db_session):
+    """Test wiadomości grupowej - wspólna treść i blob, osobne koperty odbiorców."""
+    import base64
+    from sqlalchemy import select
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.message import Message, MessageContent
+    from app.models.attachment import Attachment, Blob
+    from app.crud.messages import delete_messages, purge_deleted_messages
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    recipients = [
+        User(
+            username=f"member{i}",
+            email=f"member{i}@example.com",
+            password_hash="hash",
+            public_key="-----BEGIN PUBLIC KEY-----\nMEMBER\n-----END PUBLIC KEY-----",
+            encrypted_private_key="encrypted"
+        )
+        for i in range(3)
+    ]
+    db_session.add_all(recipients)
+    await db_session.commit()
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+    payload = {
+        "recipients": [
+            {"receiver_id": user.id, "encrypted_symmetric_key": f"key-{user.id}"}
+            for user in recipients
+        ],
+        "encrypted_content": "shared-ciphertext",
+        "encrypted_symmetric_key_sender": "sender-key",
+        "signature": "sig",
+        "attachments": [{
+            "encrypted_data": base64.b64encode(b"shared attachment").decode(),
+            "filename": "doc.bin",
+            "mime_type": "application/octet-stream",
+            "size": 17
+        }]
+    }
+
+    response = await client.post("/messages/send-group", headers=headers, json={
+        **payload, "recipients": payload["recipients"] + [{"receiver_id": 999999, "encrypted_symmetric_key": "k"}]
+    })
+    assert response.status_code == 404
+
+    response = await client.post("/messages/send-group", headers=headers, json=payload)
+    assert response.status_code == 200
+    message_ids = response.json()["message_ids"]
+    assert len(message_ids) == 3
+
+    assert len((await db_session.execute(select(MessageContent))).scalars().all()) == 1
+    stored = (await db_session.execute(select(Message.encrypted_content))).scalars().all()
+    assert stored == [None, None, None]
+    assert (await db_session.execute(select(Blob.ref_count))).scalar_one() == 3
+
+    app.dependency_overrides[get_current_user] = current_user_override(recipients[1])
+    inbox = (await client.get("/messages/inbox")).json()
+    assert len(inbox) == 1
+    assert inbox[0]["encrypted_content"] == "shared-ciphertext"
+    assert inbox[0]["encrypted_symmetric_key"] == f"key-{recipients[1].id}"
+    assert inbox[0]["encrypted_symmetric_key_sender"] == "sender-key"
+    assert [a["filename"] for a in inbox[0]["attachments"]] == ["doc.bin"]
+
+    for user in recipients:
+        await delete_messages(db_session, user.id, message_ids=message_ids)
+    await delete_messages(db_session, test_user.id, message_ids=message_ids)
+    assert await purge_deleted_messages(db_session) == 3
+
+    assert (await db_session.execute(select(MessageContent))).scalars().all() == []
+    assert (await db_session.execute(select(Attachment))).scalars().all() == []
+    assert (await db_session.execute(select(Blob.ref_count))).scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_send_batch(client: AsyncClient, test_user, db_session):
+    """Test wysyłki wielu wiadomości jednym żądaniem."""
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    receivers = [
+        User(
+            username=f"batch{i}",
+            email=f"batch{i}@example.com",
+            password_hash="hash",
+            public_key="-----BEGIN PUBLIC KEY-----\nBATCH\n-----END PUBLIC KEY-----",
+            encrypted_private_key="encrypted"
+        )
+        for i in range(2)
+    ]
+    db_session.add_all(receivers)
+    await db_session.commit()
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    messages = [
+        {
+            "receiver_id": receivers[i % 2].id,
+            "encrypted_content": f"encrypted-{i}",
+            "encrypted_symmetric_key": "key",
+            "signature": "sig"
+        }
+        for i in range(5)
+    ]
+    response = await client.post("/messages/send-batch", headers={"X-XSRF-TOKEN": "csrf-test"}, json={"messages": messages})
+    assert response.status_code == 200
+    message_ids = response.json()["message_ids"]
+    assert len(message_ids) == 5
+
+    sent = (await client.get("/messages/sent")).json()
+    assert {m["id"]: m["encrypted_content"] for m in sent} == {
+        message_id: f"encrypted-{i}" for i, message_id in enumerate(message_ids)
+    }
+
+    # Każda wiadomość dostaje własny numer zmiany u nadawcy
+    data = (await client.get("/messages/sync", params={"since": 0})).json()
+    assert data["cursor"] == 5
+
+
+@pytest.mark.asyncio
+async def test_group_commit_queue_merges_concurrent_writes():
+    """Test łączenia współbieżnych zapisów w jedną paczkę i izolacji błędów."""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from unittest.mock import AsyncMock
+    from app.utils.group_commit import GroupCommitQueue
+
+    batches = []
+
+    async def write_batch(db, items):
+        batches.append(list(items))
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    sessions = []
+
+    @asynccontextmanager
+    async def session_factory():
+        sessions.append(AsyncMock())
+        yield sessions[-1]
+
+    queue = GroupCommitQueue(write_batch, window_seconds=0.05, max_items=3)
+
+    results = await asyncio.gather(*(queue.submit(session_factory, item) for item in ["a", "b"]))
+    assert results == ["A", "B"]
+    assert batches == [["a", "b"]]
+    # Jedna sesja lidera na paczkę
+    assert len(sessions) == 1
+
+    batches.clear()
+    results = await asyncio.gather(*(queue.submit(session_factory, item) for item in ["c", "d", "e", "f"]))
+    assert results == ["C", "D", "E", "F"]
+    assert batches == [["c", "d", "e"], ["f"]]
+
+    batches.clear()
+    results = await asyncio.gather(
+        *(queue.submit(session_factory, item) for item in ["g", "bad", "h"]),
+        return_exceptions=True
+    )
+    assert results[0] == "G" and results[2] == "H"
+    assert isinstance(results[1], ValueError)
+    assert batches[0] == ["g", "bad", "h"]
+
+
+@pytest.mark.asyncio
+async def test_group_commit_queue_fails_all_items_when_leader_fails():
+    """Test błędu lidera poza zapisem paczki - każde czekające żądanie dostaje wyjątek zamiast wisieć."""
+    import asyncio
+    from contextlib import asynccontextmanager
+    from app.utils.group_commit import GroupCommitQueue
+
+    @asynccontextmanager
+    async def broken_session_factory():
+        raise ConnectionError("database unavailable")
+        yield
+
+    async def write_batch(db, items):
+        return [item.upper() for item in items]
+
+    queue = GroupCommitQueue(write_batch, window_seconds=0.01, max_items=3)
+    results = await asyncio.wait_for(asyncio.gather(
+        *(queue.submit(broken_session_factory, item) for item in ["a", "b"]),
+        return_exceptions=True
+    ), timeout=1)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+    async def short_write_batch(db, items):
+        return []
+
+    @asynccontextmanager
+    async def session_factory():
+        yield None
+
+    queue = GroupCommitQueue(short_write_batch, window_seconds=0.01, max_items=3)
+    results = await asyncio.wait_for(asyncio.gather(
+        *(queue.submit(session_factory, item) for item in ["a", "b"]),
+        return_exceptions=True
+    ), timeout=1)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_send_with_idempotency_key(client: AsyncClient, test_user, db_session):
+    """Test powtórzeń /messages/send z nagłówkiem Idempotency-Key."""
+    import asyncio
+    from sqlalchemy import select, func
+    from app.main import app
+    from app.dependencies import verify_access_token
+    from app.models.user import User
+    from app.models.message import Message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+
+    receiver = User(
+        username="idempotent",
+        email="idempotent@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nRECEIVER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(receiver)
+    await db_session.commit()
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test", "Idempotency-Key": "retry-1"}
+    payload = {
+        "receiver_id": receiver.id,
+        "encrypted_content": "encrypted",
+        "encrypted_symmetric_key": "key",
+        "signature": "sig"
+    }
+
+    first, second = await asyncio.gather(
+        client.post("/messages/send", headers=headers, json=payload),
+        client.post("/messages/send", headers=headers, json=payload),
+    )
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+
+    replay = await client.post("/messages/send", headers=headers, json=payload)
+    assert replay.json() == first.json()
+    assert (await db_session.execute(select(func.count()).select_from(Message))).scalar_one() == 1
+
+    response = await client.post("/messages/send", headers=headers, json={**payload, "encrypted_content": "other"})
+    assert response.status_code == 422
+
+    # Nieudane żądanie zwalnia klucz - ponowienie jest obsługiwane od nowa zamiast 409
+    bad_headers = {**headers, "Idempotency-Key": "retry-2"}
+    response = await client.post("/messages/send", headers=bad_headers, json={**payload, "receiver_id": 999999})
+    assert response.status_code == 404
+    response = await client.post("/messages/send", headers=bad_headers, json={**payload, "receiver_id": 999999})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_conversation_summaries_and_thread(client: AsyncClient, test_user, db_session):
+    """Test podsumowań rozmów utrzymywanych przy wysyłce, odczycie i usuwaniu."""
+    from sqlalchemy import select
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.conversation import Conversation
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message, mark_message_read, delete_messages
+    from app.crud.conversations import rebuild_conversations
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    alice, bob = [
+        User(
+            username=name,
+            email=f"{name}@example.com",
+            password_hash="hash",
+            public_key="-----BEGIN PUBLIC KEY-----\nPEER\n-----END PUBLIC KEY-----",
+            encrypted_private_key="encrypted"
+        )
+        for name in ("alice", "bob")
+    ]
+    db_session.add_all([alice, bob])
+    await db_session.commit()
+
+    def message_to(receiver_id):
+        return SendMessageRequest(
+            receiver_id=receiver_id,
+            encrypted_content="encrypted",
+            encrypted_symmetric_key="key",
+            signature="sig"
+        )
+
+    from_alice = await create_message(db_session, message_to(test_user.id), alice.id)
+    to_alice = await create_message(db_session, message_to(alice.id), test_user.id)
+    from_bob = [await create_message(db_session, message_to(test_user.id), bob.id) for _ in range(2)]
+
+    conversations = (await client.get("/messages/conversations")).json()
+    assert [(c["correspondent_username"], c["message_count"], c["unread_count"], c["last_message_id"]) for c in conversations] == [
+        ("bob", 2, 2, from_bob[1].id),
+        ("alice", 2, 1, to_alice.id),
+    ]
+
+    thread = (await client.get(f"/messages/conversations/{alice.id}")).json()
+    assert [(m["id"], m["sender_id"]) for m in thread] == [(to_alice.id, test_user.id), (from_alice.id, alice.id)]
+    assert thread[0]["recipient_username"] == "alice"
+
+    await mark_message_read(db_session, from_bob[0].id)
+    await delete_messages(db_session, test_user.id, message_ids=[from_bob[1].id, to_alice.id])
+
+    conversations = (await client.get("/messages/conversations")).json()
+    assert [(c["correspondent_username"], c["message_count"], c["unread_count"], c["last_message_id"]) for c in conversations] == [
+        ("bob", 1, 0, from_bob[0].id),
+        ("alice", 1, 1, from_alice.id),
+    ]
+
+    before = {
+        (c.user_id, c.correspondent_id): (c.last_message_id, c.unread_count, c.message_count)
+        for c in (await db_session.execute(select(Conversation))).scalars().all()
+    }
+    db_session.expunge_all()
+    await rebuild_conversations(db_session)
+    after = {
+        (c.user_id, c.correspondent_id): (c.last_message_id, c.unread_count, c.message_count)
+        for c in (await db_session.execute(select(Conversation))).scalars().all()
+    }
+    assert after == before
+
+    await delete_messages(db_session, test_user.id, correspondent_id=bob.id)
+    conversations = (await client.get("/messages/conversations")).json()
+    assert [c["correspondent_username"] for c in conversations] == ["alice"]
+
+
+@pytest.mark.asyncio
+async def test_inbox_metadata_filters(client: AsyncClient, test_user, db_session):
+    """Test filtrów listy wiadomości po nadawcy, dacie, stanie odczytu i załącznikach."""
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.models.attachment import Attachment
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message, mark_message_read
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    alice, bob = [
+        User(
+            username=name,
+            email=f"{name}@example.com",
+            password_hash="hash",
+            public_key="-----BEGIN PUBLIC KEY-----\nPEER\n-----END PUBLIC KEY-----",
+            encrypted_private_key="encrypted"
+        )
+        for name in ("alice", "bob")
+    ]
+    db_session.add_all([alice, bob])
+    await db_session.commit()
+
+    message_in = SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    )
+    plain = await create_message(db_session, message_in, alice.id)
+    image = await create_message(db_session, message_in, alice.id)
+    document = await create_message(db_session, message_in, bob.id)
+    db_session.add_all([
+        Attachment(message_id=image.id, encrypted_data=b"x", filename="a.png", mime_type="image/png", size=2048),
+        Attachment(message_id=document.id, encrypted_data=b"x", filename="a.pdf", mime_type="application/pdf", size=100),
+    ])
+    await db_session.commit()
+    await mark_message_read(db_session, plain.id)
+
+    async def inbox_ids(**params):
+        response = await client.get("/messages/inbox", params=params)
+        assert response.status_code == 200
+        return [m["id"] for m in response.json()]
+
+    assert await inbox_ids() == [document.id, image.id, plain.id]
+    assert await inbox_ids(correspondent_id=alice.id) == [image.id, plain.id]
+    assert await inbox_ids(unread="true") == [document.id, image.id]
+    assert await inbox_ids(unread="false") == [plain.id]
+    assert await inbox_ids(has_attachments="true") == [document.id, image.id]
+    assert await inbox_ids(has_attachments="false") == [plain.id]
+    assert await inbox_ids(mime_type="image/*") == [image.id]
+    assert await inbox_ids(mime_type="application/pdf") == [document.id]
+    assert await inbox_ids(min_attachment_size=1000) == [image.id]
+    assert await inbox_ids(max_attachment_size=1000) == [document.id]
+    assert await inbox_ids(since="2000-01-01T00:00:00+02:00", until="2000-01-02T00:00:00Z") == []
+    assert await inbox_ids(since=plain.created_at.isoformat(), until=image.created_at.isoformat()) == [image.id, plain.id]
+
+    response = await client.get("/messages/inbox", params={"min_attachment_size": -1})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("side, filters, index", [
+    ("inbox", {"correspondent_id": 2}, "ix_messages_thread"),
+    ("sent", {"correspondent_id": 2}, "ix_messages_thread"),
+    ("inbox", {"since": "2025-01-01T00:00:00", "until": "2026-01-01T00:00:00"}, "ix_messages_inbox"),
+    ("inbox", {"unread": True}, "ix_messages_inbox_read"),
+    ("sent", {"unread": True}, "ix_messages_sent_read"),
+    ("inbox", {"mime_type": "image/*"}, "ix_attachments_message_mime_size"),
+    ("inbox", {"has_attachments": True, "min_attachment_size": 1024}, "ix_attachments_message_mime_size"),
+])
+async def test_message_filters_use_indexes(db_session, side, filters, index):
+    """Plan zapytania dla każdego filtra przeszukuje indeks zamiast skanować tabele."""
+    from datetime import datetime
+    from sqlalchemy import event
+    from app.schemas.message import MessageFilters
+    from app.crud.messages import get_inbox_messages, get_sent_messages
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = db_session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        get_messages = get_inbox_messages if side == "inbox" else get_sent_messages
+        await get_messages(
+            db_session, 1, limit=50, cursor=(datetime(2026, 1, 1), 10),
+            filters=MessageFilters(**filters),
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[0]
+    connection = await db_session.connection()
+    plan = [row[3] for row in await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+    assert any(index in step for step in plan), plan
+    assert not any(step.startswith(("SCAN messages", "SCAN attachments")) for step in plan), plan
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cursor", [None, (datetime(2026, 1, 1), 10)])
+async def test_thread_query_merges_index_ranges(db_session, cursor):
+    """Plan wątku rozmowy - dwa zakresy ix_messages_thread łączone bez sortowania całej rozmowy."""
+    from app.crud.conversations import visible_thread
+
+    query = visible_thread(1, 2, cursor, limit=50)
+    compiled = query.compile(db_session.bind.sync_engine)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    connection = await db_session.connection()
+    plan = [row[3] for row in await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+
+    assert "MERGE (UNION ALL)" in plan, plan
+    assert sum("USING INDEX ix_messages_thread" in step for step in plan) == 2, plan
+    assert not any("TEMP B-TREE" in step or "MULTI-INDEX OR" in step for step in plan), plan
+
+
+@pytest.mark.asyncio
+async def test_mailbox_export_and_import(client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test eksportu NDJSON czytanego paczkami i ponownego importu do skrzynki."""
+    import base64
+    import json
+    from app.main import app
+    from app.config import AttachmentConfig, ExportConfig
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest, AttachmentData
+    from app.crud.messages import create_message, delete_messages
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+    monkeypatch.setattr(ExportConfig, "BATCH_SIZE", 2)
+    monkeypatch.setattr(ExportConfig, "IMPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(AttachmentConfig, "STREAM_CHUNK_SIZE", 4)
+
+    alice = User(
+        username="alice",
+        email="alice@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nPEER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(alice)
+    await db_session.commit()
+
+    def message_to(receiver_id, content, attachments=None):
+        return SendMessageRequest(
+            receiver_id=receiver_id,
+            encrypted_content=content,
+            encrypted_symmetric_key="key",
+            signature="sig",
+            attachments=attachments
+        )
+
+    attachment = AttachmentData(
+        encrypted_data=base64.b64encode(b"attachment-payload").decode(),
+        filename="a.bin",
+        mime_type="application/octet-stream",
+        size=18
+    )
+    received = [await create_message(db_session, message_to(test_user.id, f"in-{i}"), alice.id) for i in range(3)]
+    with_attachment = await create_message(db_session, message_to(test_user.id, "in-att", [attachment]), alice.id)
+    sent = await create_message(db_session, message_to(alice.id, "out"), test_user.id)
+
+    response = await client.get("/messages/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    export = response.content
+    records = [json.loads(line) for line in export.splitlines()]
+
+    assert records[0]["type"] == "header"
+    messages = [r for r in records if r["type"] == "message"]
+    assert [(m["direction"], m["encrypted_content"]) for m in messages] == [
+        ("sent", "out"), ("received", "in-0"), ("received", "in-1"), ("received", "in-2"), ("received", "in-att"),
+    ]
+    assert messages[-1]["attachments"][0]["data_size"] == 18
+    chunks = [r for r in records if r["type"] == "attachment_data"]
+    assert len(chunks) == 5
+    assert b"".join(base64.b64decode(c["data"]) for c in chunks) == b"attachment-payload"
+
+    await delete_messages(db_session, test_user.id, correspondent_id=alice.id)
+    assert (await client.get("/messages/inbox")).json() == []
+
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test", "Content-Type": "application/x-ndjson"}
+    response = await client.post("/messages/import", headers=headers, content=export)
+    assert response.status_code == 200
+    assert response.json() == {"imported": 5, "skipped": 0}
+
+    inbox = (await client.get("/messages/inbox")).json()
+    assert [m["encrypted_content"] for m in inbox] == ["in-att", "in-2", "in-1", "in-0"]
+    assert inbox[0]["is_read"] is False
+    assert {m["id"] for m in inbox}.isdisjoint({m.id for m in received} | {with_attachment.id})
+    content = await client.get(f"/messages/attachments/{inbox[0]['attachments'][0]['id']}/content")
+    assert content.content == b"attachment-payload"
+    assert [m["encrypted_content"] for m in (await client.get("/messages/sent")).json()] == ["out"]
+
+    # Zaimportowane kopie są widoczne tylko dla importującego
+    app.dependency_overrides[get_current_user] = current_user_override(alice)
+    assert len((await client.get("/messages/sent")).json()) == 4
+    assert [m["id"] for m in (await client.get("/messages/inbox")).json()] == [sent.id]
+
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+    truncated = export[:export.rindex(b'{"type":"attachment_data"')]
+    response = await client.post("/messages/import", headers=headers, content=truncated)
+    assert response.status_code == 400
+    response = await client.post("/messages/import", headers=headers, content=b'{"type":"message"}\n')
+    assert response.status_code == 400
+
+    # Limity importu - 413 zamiast zapełniania dysku i bazy
+    monkeypatch.setattr(ExportConfig, "MAX_IMPORT_MESSAGES", 3)
+    response = await client.post("/messages/import", headers=headers, content=export)
+    assert response.status_code == 413
+    monkeypatch.setattr(ExportConfig, "MAX_IMPORT_MESSAGES", 100)
+    monkeypatch.setattr(ExportConfig, "MAX_IMPORT_BYTES", len(export) - 1)
+    response = await client.post("/messages/import", headers=headers, content=export)
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_import_keeps_newest_conversation_summary(test_user, db_session):
+    """Test importu starszych wiadomości - podsumowanie rozmowy wskazuje nadal najnowszą wiadomość."""
+    import json
+    from sqlalchemy import select
+    from app.models.user import User
+    from app.models.conversation import Conversation
+    from app.schemas.message import SendMessageRequest
+    from app.crud.messages import create_message
+    from app.crud.mailbox_export import import_mailbox
+
+    peers = [
+        User(username=name, email=f"{name}@example.com", password_hash="hash", public_key="pk", encrypted_private_key="epk")
+        for name in ("recent", "archived")
+    ]
+    db_session.add_all(peers)
+    await db_session.commit()
+    latest = await create_message(db_session, SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="latest",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    ), peers[0].id)
+
+    def record(message_id, direction, username, created_at):
+        return {
+            "type": "message", "id": message_id, "direction": direction, "correspondent_username": username,
+            "encrypted_content": "old", "encrypted_symmetric_key": "key", "signature": "sig",
+            "created_at": created_at, "is_read": True,
+        }
+
+    # Eksport zapisuje wysłane przed odebranymi, więc kolejność wierszy nie jest chronologiczna
+    lines = [
+        {"type": "header", "version": 1},
+        record(1, "sent", "recent", "2020-01-01T00:00:00"),
+        record(2, "sent", "archived", "2024-06-01T00:00:00"),
+        record(3, "received", "archived", "2021-03-01T00:00:00"),
+    ]
+
+    async def chunks():
+        yield "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+    assert await import_mailbox(db_session, test_user.id, chunks()) == (3, 0)
+
+    summaries = {
+        row.correspondent_id: row
+        for row in (await db_session.execute(select(Conversation).where(Conversation.user_id == test_user.id))).scalars()
+    }
+    assert summaries[peers[0].id].last_message_id == latest.id
+    assert summaries[peers[0].id].message_count == 2
+    assert summaries[peers[1].id].last_message_at == datetime(2024, 6, 1)
+
+
+@pytest.mark.asyncio
+async def test_streamed_listings_match_paginated(client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test trybu stream=true - ta sama tablica JSON co lista stronicowana, składana z paczek kursora."""
+    import base64
+    from app.main import app
+    from app.config import PaginationConfig
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest, AttachmentData
+    from app.crud.messages import create_message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+    monkeypatch.setattr(PaginationConfig, "STREAM_BATCH_SIZE", 3)
+
+    response = await client.get("/messages/inbox", params={"stream": "true"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    alice = User(
+        username="alice",
+        email="alice@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nPEER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(alice)
+    await db_session.commit()
+
+    attachment = AttachmentData(
+        encrypted_data=base64.b64encode(b"payload").decode(),
+        filename="a.bin",
+        mime_type="application/octet-stream",
+        size=7
+    )
+    for i in range(7):
+        await create_message(db_session, SendMessageRequest(
+            receiver_id=test_user.id,
+            encrypted_content=f"in-{i}",
+            encrypted_symmetric_key="key",
+            signature="sig",
+            attachments=[attachment] if i % 2 else None
+        ), alice.id)
+    await create_message(db_session, SendMessageRequest(
+        receiver_id=alice.id,
+        encrypted_content="out",
+        encrypted_symmetric_key="key",
+        signature="sig"
+    ), test_user.id)
+
+    # Strumień czyta własna sesja generatora, zamykana po wysłaniu ostatniej paczki
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from app.db import get_session_factory
+    session_factory = async_sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False)
+    stream_sessions = []
+
+    def tracking_factory():
+        stream_sessions.append(session_factory())
+        return stream_sessions[-1]
+
+    app.dependency_overrides[get_session_factory] = lambda: tracking_factory
+
+    for path in ("/messages/inbox", "/messages/sent"):
+        paginated = await client.get(path, params={"limit": PaginationConfig.MAX_PAGE_SIZE})
+        streamed = await client.get(path, params={"stream": "true"})
+        assert streamed.headers["content-type"] == "application/json"
+        assert streamed.json() == paginated.json()
+    assert len(stream_sessions) == 2
+    assert not any(session.in_transaction() for session in stream_sessions)
+
+    first_page = await client.get("/messages/inbox", params={"limit": 2})
+    rest = await client.get("/messages/inbox", params={"stream": "true", "cursor": first_page.headers["X-Next-Cursor"]})
+    assert [m["encrypted_content"] for m in rest.json()] == ["in-4", "in-3", "in-2", "in-1", "in-0"]
+    assert len((await client.get("/messages/inbox", params={"stream": "true", "has_attachments": "true"})).json()) == 3
+
+
+@pytest.mark.asyncio
+async def test_fast_message_serialization_matches_schema(client: AsyncClient, test_user, db_session):
+    """Test szybkiej ścieżki orjson - odpowiedzi mają dokładnie kształt MessageResponse i SyncResponse."""
+    import base64
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+    from app.models.user import User
+    from app.schemas.message import SendMessageRequest, AttachmentData, GroupSendRequest, GroupRecipient, MessageResponse, SyncResponse
+    from app.crud.messages import create_message, create_group_message
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+
+    alice = User(
+        username="alice",
+        email="alice@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nPEER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(alice)
+    await db_session.commit()
+
+    attachment = AttachmentData(
+        encrypted_data=base64.b64encode(b"payload").decode(),
+        filename="a.bin",
+        mime_type="application/octet-stream",
+        size=7
+    )
+    await create_message(db_session, SendMessageRequest(
+        receiver_id=test_user.id,
+        encrypted_content="encrypted",
+        encrypted_symmetric_key="key",
+        encrypted_symmetric_key_sender="key_sender",
+        signature="sig",
+        attachments=[attachment]
+    ), alice.id)
+    await create_group_message(db_session, GroupSendRequest(
+        recipients=[GroupRecipient(receiver_id=alice.id, encrypted_symmetric_key="key_alice")],
+        encrypted_content="group",
+        signature="sig"
+    ), test_user.id)
+
+    for path in ("/messages/inbox", "/messages/sent", f"/messages/conversations/{alice.id}"):
+        messages = (await client.get(path)).json()
+        assert messages
+        for message in messages:
+            assert MessageResponse.model_validate(message).model_dump(mode="json") == message
+
+    sync = (await client.get("/messages/sync")).json()
+    assert SyncResponse.model_validate(sync).model_dump(mode="json") == sync
+    assert [m["encrypted_content"] for m in sync["sent"]] == ["group"]
+
+
+@pytest.mark.asyncio
+async def test_mailbox_events_stream_ends_after_logout(client: AsyncClient, test_user, monkeypatch):
+    """Test SSE - otwarty strumień zdarzeń kończy się po wylogowaniu sesji."""
+    import asyncio
+    from app.config import EventsConfig
+
+    monkeypatch.setattr(EventsConfig, "KEEPALIVE_SECONDS", 0.01)
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    response = await client.post("/auth/login", headers={"X-XSRF-TOKEN": "csrf-test"}, json={
+        "email": test_user.email,
+        "password": "TestPass123!"
+    })
+    assert response.status_code == 200
+    client.cookies.set("access_token", response.cookies["access_token"])
+    client.cookies.set("refresh_token", response.cookies["refresh_token"])
+
+    async def logout_later():
+        await asyncio.sleep(0.1)
+        response = await client.post("/auth/logout", headers={"X-XSRF-TOKEN": "csrf-test"})
+        assert response.status_code == 200
+
+    logout = asyncio.create_task(logout_later())
+    response = await asyncio.wait_for(client.get("/messages/events"), timeout=5)
+    await logout
+
+    assert response.status_code == 200
+    assert response.text.startswith("retry: 3000")
+    assert ": keepalive" in response.text
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Tabele w postaci z pierwszej wersji schematu, przed migracjami
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, username VARCHAR, email VARCHAR, password_hash VARCHAR, "
+    "totp_secret_encrypted VARCHAR, is_2fa_enabled BOOLEAN, public_key TEXT NOT NULL, "
+    "encrypted_private_key TEXT NOT NULL, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE TABLE messages (id INTEGER NOT NULL, sender_id INTEGER NOT NULL, receiver_id INTEGER NOT NULL, "
+    "encrypted_content TEXT NOT NULL, encrypted_symmetric_key TEXT NOT NULL, encrypted_symmetric_key_sender TEXT, "
+    "signature TEXT NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), is_read BOOLEAN, read_at DATETIME, "
+    "deleted_by_sender BOOLEAN, deleted_by_receiver BOOLEAN, is_decryptable_sender BOOLEAN, "
+    "is_decryptable_receiver BOOLEAN, PRIMARY KEY (id), FOREIGN KEY(sender_id) REFERENCES users (id), "
+    "FOREIGN KEY(receiver_id) REFERENCES users (id))",
+    "CREATE INDEX ix_messages_id ON messages (id)",
+    "CREATE TABLE attachments (id INTEGER NOT NULL, message_id INTEGER NOT NULL, encrypted_data BLOB NOT NULL, "
+    "filename VARCHAR NOT NULL, mime_type VARCHAR NOT NULL, size INTEGER NOT NULL, PRIMARY KEY (id), "
+    "FOREIGN KEY(message_id) REFERENCES messages (id))",
+    "CREATE INDEX ix_attachments_id ON attachments (id)",
+]
+
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_migrates_baseline_database():
+    """Test migracji bazy z pierwszej wersji schematu - nowe kolumny, numery synchronizacji i indeksy."""
+    from app.db import Base
+    from app.models.message import Message, MessageContent
+    from app.crud.messages import get_mailbox_changes, get_thread_messages
+    from migrate_schema import upgrade_schema
+
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    try:
+        async with engine.begin() as conn:
+            for statement in BASELINE_SCHEMA:
+                await conn.execute(text(statement))
+            await conn.execute(text(
+                "INSERT INTO users (id, username, email, password_hash, public_key, encrypted_private_key) VALUES "
+                "(1, 'ala', 'ala@example.com', 'hash', 'pk', 'epk'), (2, 'ola', 'ola@example.com', 'hash', 'pk', 'epk')"
+            ))
+            await conn.execute(text(
+                "INSERT INTO messages (id, sender_id, receiver_id, encrypted_content, encrypted_symmetric_key, "
+                "signature, is_read, deleted_by_sender, deleted_by_receiver) VALUES "
+                "(1, 1, 2, 'c1', 'k', 's', 0, 0, 0), (2, 2, 1, 'c2', 'k', 's', 0, 0, 0)"
+            ))
+            await conn.execute(text(
+                "INSERT INTO attachments (message_id, encrypted_data, filename, mime_type, size) "
+                "VALUES (1, x'0102', 'a.bin', 'application/octet-stream', 2)"
+            ))
+
+        async with engine.begin() as conn:
+            created = await conn.run_sync(upgrade_schema)
+            assert "conversations" in created and "messages" not in created
+        # Drugie uruchomienie niczego nie zmienia
+        async with engine.begin() as conn:
+            assert await conn.run_sync(upgrade_schema) == set()
+
+        async with engine.connect() as conn:
+            columns = {row[1]: row for row in await conn.execute(text("PRAGMA table_info(messages)"))}
+            assert not columns["encrypted_content"][3] and not columns["signature"][3]
+            indexes = {row[0] for row in await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+            expected = {index.name for table in Base.metadata.sorted_tables for index in table.indexes}
+            assert expected <= indexes
+            seqs = (await conn.execute(text("SELECT id, mailbox_seq, key_epoch FROM users ORDER BY id"))).all()
+            assert seqs == [(1, 2, 0), (2, 2, 0)]
+
+        session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as db:
+            inbox, sent, deleted = await get_mailbox_changes(db, 2, 0)
+            assert [row[0].id for row in inbox] == [1]
+            assert [row[0].id for row in sent] == [2]
+            assert [m.id for m in await get_thread_messages(db, 1, 2)] and not deleted
+
+            content = MessageContent(encrypted_content="group", signature="sig")
+            db.add(Message(sender_id=1, receiver_id=2, content=content, encrypted_symmetric_key="k"))
+            await db.commit()
+    finally:
+        await engine.dispose()
@@ -48,4 +48,29 @@ async def test_enable_totp_with_invalid_code(client: AsyncClient, auth_headers):
         "totp_code": "000000"
     })
     assert response.status_code == 401
-    assert "Invalid TOTP code" in response.json()["detail"]
\ No newline at end of file
+    assert "Invalid TOTP code" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_totp_changes_invalidate_user_snapshot(client: AsyncClient, test_user, redis_session):
+    """Test statusu TOTP - migawka użytkownika jest odświeżana po inicjalizacji i włączeniu 2FA."""
+    import asyncio
+    import pyotp
+    from app.dependencies import verify_access_token
+    from app.main import app
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    headers = {"X-XSRF-TOKEN": "csrf-test"}
+
+    assert (await client.get("/totp/status")).json() == {"is_2fa_enabled": False, "has_secret": False}
+    await asyncio.sleep(0.01)
+    assert (await client.get("/totp/status")).json() == {"is_2fa_enabled": False, "has_secret": False}
+
+    response = await client.post("/totp/initialize", headers=headers)
+    assert response.status_code == 200
+    secret = response.json()["secret"]
+    assert (await client.get("/totp/status")).json() == {"is_2fa_enabled": False, "has_secret": True}
+
+    response = await client.post("/totp/enable", headers=headers, json={"totp_code": pyotp.TOTP(secret).now()})
+    assert response.status_code == 200
+    assert (await client.get("/totp/status")).json() == {"is_2fa_enabled": True, "has_secret": True}
@@ -0,0 +1,167 @@
+import hashlib
+import pytest
+from httpx import AsyncClient
+from tests.utils.helpers import current_user_override
+
+
+@pytest.fixture
+def upload_client(client: AsyncClient, test_user):
+    """Klient z nadpisanym uwierzytelnieniem i tokenem CSRF."""
+    from app.main import app
+    from app.dependencies import get_current_user, verify_access_token
+
+    app.dependency_overrides[verify_access_token] = lambda: str(test_user.id)
+    app.dependency_overrides[get_current_user] = current_user_override(test_user)
+    client.cookies.set("XSRF-TOKEN", "csrf-test")
+    client.headers["X-XSRF-TOKEN"] = "csrf-test"
+    return client
+
+
+@pytest.mark.asyncio
+async def test_chunked_upload_and_send(upload_client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test przesyłania załącznika we fragmentach i wysłania go w wiadomości."""
+    from sqlalchemy import select
+    from app.config import UploadConfig
+    from app.models.user import User
+    from app.models.attachment import Attachment
+    from app.utils.blob_store import get_blob_store
+
+    monkeypatch.setattr(UploadConfig, "CHUNK_SIZE", 100)
+
+    receiver = User(
+        username="uploadreceiver",
+        email="uploadreceiver@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nRECEIVER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(receiver)
+    await db_session.commit()
+
+    data = bytes(range(250))
+    response = await upload_client.post("/uploads", json={
+        "filename": "plik.bin",
+        "mime_type": "application/octet-stream",
+        "size": 200,
+        "total_size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest()
+    })
+    assert response.status_code == 200
+    upload = response.json()
+    assert upload["total_chunks"] == 3
+
+    upload_url = f"/uploads/{upload['upload_id']}"
+    # Fragmenty w dowolnej kolejności, jeden wysłany ponownie
+    for index in (2, 0, 0):
+        response = await upload_client.put(f"{upload_url}/chunks/{index}", content=data[index * 100:(index + 1) * 100])
+        assert response.status_code == 200
+
+    response = await upload_client.post(f"{upload_url}/complete")
+    assert response.status_code == 409
+    assert response.json()["detail"]["missing_chunks"] == [1]
+
+    response = await upload_client.put(f"{upload_url}/chunks/1", content=data[100:200])
+    assert response.status_code == 200
+    response = await upload_client.post(f"{upload_url}/complete")
+    assert response.status_code == 200
+    assert response.json()["is_complete"] is True
+
+    response = await upload_client.post("/messages/send", json={
+        "receiver_id": receiver.id,
+        "encrypted_content": "encrypted_message_here",
+        "encrypted_symmetric_key": "encrypted_aes_key",
+        "signature": "digital_signature_here",
+        "upload_ids": [upload["upload_id"]]
+    })
+    assert response.status_code == 200
+
+    result = await db_session.execute(select(Attachment))
+    attachment = result.scalar_one()
+    assert attachment.message_id == response.json()["message_id"]
+    assert attachment.blob_sha256 == hashlib.sha256(data).hexdigest()
+    with open(get_blob_store("filesystem").path(attachment.blob_sha256), "rb") as f:
+        assert f.read() == data
+
+    response = await upload_client.get(upload_url)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_wrong_hash(upload_client: AsyncClient):
+    """Test odrzucenia pliku z niezgodną sumą kontrolną."""
+    data = b"ciphertext"
+    response = await upload_client.post("/uploads", json={
+        "filename": "plik.bin",
+        "mime_type": "application/octet-stream",
+        "size": 5,
+        "total_size": len(data),
+        "sha256": "0" * 64
+    })
+    upload_id = response.json()["upload_id"]
+
+    await upload_client.put(f"/uploads/{upload_id}/chunks/0", content=data)
+    response = await upload_client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_failed_send_keeps_upload_and_removes_blob(upload_client: AsyncClient, test_user, db_session, monkeypatch):
+    """Test wycofanego zapisu - plik przesyłania zostaje do ponowienia, a nowy blob znika z dysku."""
+    import os
+    import app.crud.messages as messages_crud
+    from sqlalchemy import select, func
+    from app.models.user import User
+    from app.models.attachment import Blob
+    from app.utils.blob_store import get_blob_store
+    from app.utils.upload_storage import part_path
+
+    receiver = User(
+        username="retryreceiver",
+        email="retryreceiver@example.com",
+        password_hash="hash",
+        public_key="-----BEGIN PUBLIC KEY-----\nRECEIVER\n-----END PUBLIC KEY-----",
+        encrypted_private_key="encrypted"
+    )
+    db_session.add(receiver)
+    await db_session.commit()
+
+    data = b"attachment" * 20
+    sha256 = hashlib.sha256(data).hexdigest()
+    response = await upload_client.post("/uploads", json={
+        "filename": "plik.bin",
+        "mime_type": "application/octet-stream",
+        "size": len(data),
+        "total_size": len(data),
+        "sha256": sha256
+    })
+    upload_id = response.json()["upload_id"]
+    assert (await upload_client.put(f"/uploads/{upload_id}/chunks/0", content=data)).status_code == 200
+    assert (await upload_client.post(f"/uploads/{upload_id}/complete")).status_code == 200
+
+    # Błąd po zapisaniu blobu, tuż przed commitem
+    original_delete = messages_crud.delete_upload_sessions
+
+    async def failing_delete(db, upload_ids):
+        raise RuntimeError("disk I/O error")
+
+    monkeypatch.setattr(messages_crud, "delete_upload_sessions", failing_delete)
+    send_request = {
+        "receiver_id": receiver.id,
+        "encrypted_content": "encrypted_message_here",
+        "encrypted_symmetric_key": "encrypted_aes_key",
+        "signature": "digital_signature_here",
+        "upload_ids": [upload_id]
+    }
+    with pytest.raises(RuntimeError):
+        await upload_client.post("/messages/send", json=send_request)
+
+    blob_path = get_blob_store("filesystem").path(sha256)
+    assert not os.path.exists(blob_path)
+    assert os.path.exists(part_path(upload_id))
+    assert (await db_session.execute(select(func.count()).select_from(Blob))).scalar_one() == 0
+
+    monkeypatch.setattr(messages_crud, "delete_upload_sessions", original_delete)
+    response = await upload_client.post("/messages/send", json=send_request)
+    assert response.status_code == 200
+    assert os.path.exists(blob_path)
+    assert not os.path.exists(part_path(upload_id))
@@ -9,4 +9,19 @@ def create_mock_rsa_keys() -> tuple[str, str]:
     """Zwraca mock klucze RSA (dla testów bez prawdziwej kryptografii)."""
     public_key = "-----BEGIN PUBLIC KEY-----\nMOCK_PUBLIC\n-----END PUBLIC KEY-----"
     encrypted_private = "mock_encrypted_private_key"
-    return public_key, encrypted_private
\ No newline at end of file
+    return public_key, encrypted_private
+
+
+def current_user_override(user):
+    """Nadpisanie get_current_user migawką użytkownika - tym samym typem, który zwraca aplikacja."""
+    from app.utils.user_cache import UserSnapshot
+
+    snapshot = UserSnapshot(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        key_epoch=user.key_epoch,
+        is_2fa_enabled=bool(user.is_2fa_enabled),
+        has_totp_secret=user.totp_secret_encrypted is not None,
+    )
+    return lambda: snapshot